@@ -0,0 +1,200 @@
+"""Release with asyncio: lookups and subprocesses overlap and their output is streamed live."""
+# --------------------------------------------------
+# Name        : aio.py
+# Author      : E.Taskesen
+# Contact     : erdogant@gmail.com
+# github      : https://github.com/erdogant/irelease
+# Licence     : MIT
+# --------------------------------------------------
+
+import sys
+import time
+import asyncio
+from irelease import gitops
+from irelease import irelease
+from irelease import pipeline
+from irelease import runner
+from irelease import trace
+from irelease import upload
+
+
+# %% Subprocesses
+async def stream(command, step, package=None, cwd=None, env=None, timeout=None, verbose=3):
+    """Run a command and stream its output into the log of step while it runs, see :func:`irelease.runner.run`.
+
+    Parameters
+    ----------
+    command : list of str or str
+        Command, a str is run in the shell.
+    step : str
+        Name of the step: the log file and the prefix of every line, '[irelease] [package:step] line'.
+    package : str, optional
+        Name of the package.
+    cwd : str, optional
+        Working directory.
+    env : dict, optional
+        Environment. The default is the current environment.
+    timeout : float, optional
+        Kill the command after this many seconds. The default is :func:`irelease.runner.step_timeout`.
+    verbose : int, optional
+        Print the output when verbose>=3. The default is 3.
+
+    Returns
+    -------
+    returncode : int
+        Exit code.
+    tail : list of str
+        The last lines of the output.
+
+    Raises
+    ------
+    runner.CommandFailed
+        When the command fails or times out.
+
+    """
+    name = command if isinstance(command, str) else ' '.join(command)
+    timeout = runner.step_timeout(step, cwd or '.') if timeout is None else timeout
+    start = time.perf_counter()
+    with runner.StepLog(step, package=package, verbose=verbose) as log, trace.span(' '.join(name.split()[:2]), command=name, step=step) as event:
+        log.start(command)
+        # A new session, so that a timeout kills the process group of the command, as runner.run does.
+        options = {'cwd': cwd, 'env': env, 'stdin': asyncio.subprocess.DEVNULL, 'stdout': asyncio.subprocess.PIPE, 'stderr': asyncio.subprocess.STDOUT, 'start_new_session': sys.platform!='win32'}
+        if isinstance(command, str):
+            process = await asyncio.create_subprocess_shell(command, **options)
+        else:
+            process = await asyncio.create_subprocess_exec(*command, **options)
+
+        async def _read():
+            async for line in process.stdout:
+                log.write(line.decode('utf-8', errors='replace'))
+            return await process.wait()
+        try:
+            event['returncode'] = await asyncio.wait_for(_read(), timeout)
+        except asyncio.TimeoutError:
+            runner._kill(process)
+            await process.wait()
+            log.finish(process.returncode, time.perf_counter() - start)
+            raise runner.CommandFailed(process.returncode, command, tail=log.tail, logfile=log.logfile, timeout=timeout)
+        log.finish(event['returncode'], time.perf_counter() - start)
+    if event['returncode']!=0:
+        raise runner.CommandFailed(event['returncode'], command, tail=log.tail, logfile=log.logfile)
+    return event['returncode'], list(log.tail)
+
+
+# %% Steps
+async def _step_git_pull(ctx):
+    if await asyncio.to_thread(lambda: gitops.Git('.', verbose=0).is_detached()):
+        return await asyncio.to_thread(pipeline._step_git_pull, ctx)
+    try:
+        await stream(['git', 'pull'], 'git_pull', package=ctx['packagename'], verbose=ctx['verbose'])
+    except runner.CommandFailed as e:
+        if ctx['verbose']>=2: print('[irelease] Warning: %s' %(e))
+        return {'pulled': False}
+    return {'pulled': True}
+
+
+async def _step_upload(ctx):
+    # Twine is streamed for pypi or the explicit repository url, the publish targets are uploaded concurrently by the pipeline step.
+    from irelease import publish
+    target = publish.read_targets('.', repository_url=ctx['repository_url'])[0] if ctx['upload'] and ctx['twine'] is not None else None
+    if target is not None and (target['implicit'] or ctx['repository_url'] not in (None, upload.PYPI_URL)):
+        credentials = None if target['password'] is None else (target['username'], target['password'])
+        repository_url = None if target['implicit'] and target['repository_url']==upload.PYPI_URL else target['repository_url']
+        command, env = irelease._twine_noninteractive(ctx['twine'], artifacts=ctx['artifacts'], credentials=credentials, repository_url=repository_url, verbose=ctx['verbose'])
+        if command=='': raise Exception('Twine is not found: %s' %(ctx['twine']))
+        await stream(command, 'upload', package=ctx['packagename'], env=env, verbose=ctx['verbose'])
+        return {'uploaded': True}
+    return await asyncio.to_thread(pipeline._step_upload, ctx)
+
+
+def release_steps(version_source='tags'):
+    """Steps of :func:`irelease.pipeline.release_steps` with git pull and twine as streamed subprocesses."""
+    steps = pipeline.release_steps(version_source)
+    for step in steps:
+        if step.name=='git_pull': step.func = _step_git_pull
+        if step.name=='upload': step.func = _step_upload
+    return steps
+
+
+# %% Pipeline
+async def _run_step(step, context):
+    start = time.perf_counter()
+    try:
+        with trace.span(step.name):
+            if asyncio.iscoroutinefunction(step.func):
+                outputs = await step.func(context) or {}
+            else:
+                # Blocking steps (lookups, clean, build) run in a worker thread.
+                outputs = await asyncio.to_thread(step.func, context) or {}
+        pipeline._check_outputs(step, outputs)
+    except Exception as e:
+        # The time until the step failed is reported with the error, see pipeline._run_step.
+        e.elapsed = time.perf_counter() - start
+        raise
+    return outputs, time.perf_counter() - start
+
+
+async def run_pipeline_async(steps, context=None, state_file=None, resume=False, verbose=3):
+    """Run the steps as asyncio tasks as soon as their inputs are available.
+
+    Steps can be coroutine functions or blocking functions, the latter run in a worker thread.
+    Checkpoints, resume and the results are the same as :func:`irelease.pipeline.run_pipeline`.
+
+    Returns
+    -------
+    results : dict
+        See :func:`irelease.pipeline.run_pipeline`.
+
+    """
+    context = dict(context or {})
+    state, done = pipeline._restore(steps, context, state_file, resume, verbose)
+    pipeline._check_steps(steps, context)
+    results = {'context': context, 'status': 'completed', 'failed': None, 'error': None, 'timings': {}}
+    running = {}
+
+    while True:
+        if results['failed'] is None:
+            for step in pipeline._ready(steps, context, done, running.values()):
+                if verbose>=4: print('[irelease] [%s] started.' %(step.name))
+                running[asyncio.ensure_future(_run_step(step, dict(context)))] = step.name
+
+        if len(running)==0:
+            break
+
+        finished, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+        for task in finished:
+            pipeline._collect(steps, running.pop(task), task, results, state, state_file, done, verbose)
+
+    return pipeline._finish(steps, results, state_file, done)
+
+
+async def run_async(username=None, packagename=None, clean=True, install=False, upload=True, twine=None, repository_url=upload.PYPI_URL, build_mode='single', force_rebuild=False, version_source='tags', resume=False, verbose=3):
+    """Release the package in the current directory with asyncio, without user interaction.
+
+    The same steps as :func:`irelease.pipeline.release` run as soon as their inputs are available: the
+    version lookup, git pull, clean and build overlap, so the release takes as long as its critical path.
+    The output of git, the build backend and twine is printed live with the name of the step in front.
+
+    Parameters
+    ----------
+    See :func:`irelease.pipeline.release`.
+
+    Returns
+    -------
+    results : dict
+        See :func:`irelease.pipeline.run_pipeline`.
+
+    Examples
+    --------
+    >>> import asyncio
+    >>> from irelease import aio
+    >>> results = asyncio.run(aio.run_async())
+
+    """
+    context = {'username': username, 'packagename': packagename, 'clean': clean, 'install': install, 'upload': upload, 'twine': twine, 'repository_url': repository_url, 'build_mode': build_mode, 'force_rebuild': force_rebuild, 'version_source': version_source, 'verbose': verbose}
+    state_file, resume = await asyncio.to_thread(pipeline._prepare, context, resume, verbose)
+    with trace.span('release', package=context['packagename'], version=context['current_version']) as event:
+        results = await run_pipeline_async(release_steps(version_source), context=context, state_file=state_file, resume=resume, verbose=verbose)
+        event['status'] = results['status']
+    pipeline._report(results, verbose)
+    return results
@@ -0,0 +1,234 @@
+"""Release many packages from one workspace in parallel."""
+# --------------------------------------------------
+# Name        : batch.py
+# Author      : E.Taskesen
+# Contact     : erdogant@gmail.com
+# github      : https://github.com/erdogant/irelease
+# Licence     : MIT
+# --------------------------------------------------
+
+import os
+import glob
+import time
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import toml
+from irelease import gitops
+from irelease import pipeline
+from irelease.upload import PYPI_URL
+
+PACKAGE_FILES = ['pyproject.toml', 'setup.py']
+SKIP_DIRS = ['build', 'dist', 'doc', 'docs', 'depricated', 'node_modules']
+
+
+# %% Find packages
+def find_packages(paths, verbose=3):
+    """Find all package roots in the given paths.
+
+    A package root is a directory that contains a ``pyproject.toml`` or ``setup.py``.
+    Directories that are not a package root themselves are searched recursively.
+
+    Parameters
+    ----------
+    paths : list of str
+        Directories to search.
+    verbose : int, optional
+        Print message. The default is 3.
+
+    Returns
+    -------
+    packages : list of str
+        Absolute paths to the package roots.
+
+    """
+    packages = []
+    for path in paths:
+        path = os.path.abspath(path)
+        if not os.path.isdir(path):
+            if verbose>=2: print('[irelease] Warning: directory does not exists: %s' %(path))
+            continue
+        for root, dirs, files in os.walk(path):
+            if any(f in files for f in PACKAGE_FILES):
+                packages.append(root)
+                # Do not descend into a package; its subdirectories belong to it.
+                dirs[:] = []
+            else:
+                dirs[:] = sorted(d for d in dirs if d[0] not in ('.', '_') and d.lower() not in SKIP_DIRS)
+
+    # Keep the order but remove duplicates
+    packages = list(dict.fromkeys(packages))
+    if verbose>=3: print('[irelease] %d packages found.' %(len(packages)))
+    return packages
+
+
+def read_manifest(filepath):
+    """Read the package directories from a workspace manifest.
+
+    The manifest is a toml file with the package directories (glob patterns are allowed)
+    relative to the location of the manifest::
+
+        [workspace]
+        packages = ["libs/*", "tools/cli"]
+
+    Parameters
+    ----------
+    filepath : str
+        Path to the manifest.
+
+    Returns
+    -------
+    paths : list of str
+        Directories listed in the manifest.
+
+    """
+    with open(filepath, 'r') as f:
+        data = toml.load(f)
+    rootdir = os.path.dirname(os.path.abspath(filepath))
+    paths = []
+    for pattern in data.get('workspace', {}).get('packages', []):
+        paths.extend(sorted(glob.glob(os.path.join(rootdir, pattern))))
+    return [p for p in paths if os.path.isdir(p)]
+
+
+# %% Release one package
+def release_package(path, packagename=None, clean=True, upload=True, twine=None, repository_url=PYPI_URL, build_mode='single', force_rebuild=False, version_source='tags', resume=False, worktree=False, verbose=1):
+    """Release the package in path with the release pipeline, without any user interaction.
+
+    Parameters
+    ----------
+    path : str
+        Root directory of the package.
+    packagename : str, optional
+        Name of the package. The default is found in the project files.
+    clean : bool, optional
+        Clean local distribution files for packaging. The default is True.
+    upload : bool, optional
+        Upload the distribution archives to PyPi. The default is True.
+    twine : str, optional
+        Filepath to the executable of twine. None uploads the files concurrently without twine.
+    repository_url : str, optional
+        Upload url of the repository. The default is 'https://upload.pypi.org/legacy/'.
+    build_mode : str, optional
+        How the sdist and wheel are build, see :func:`irelease.builder.build_artifacts`. The default is 'single'.
+    force_rebuild : bool, optional
+        Build even if the sources are unchanged since the artifacts in dist/ were build. The default is False.
+    version_source : str, optional
+        Read the latest released version from the git 'tags', the github releases ('remote') or 'both'. The default is 'tags'.
+    resume : bool, optional
+        Continue at the step that failed in the previous run. The default is False.
+    worktree : bool, optional
+        Release the committed HEAD from a temporary git worktree, see :func:`irelease.gitops.worktree`. The default is False.
+    verbose : int, optional
+        Print message. The default is 1.
+
+    Returns
+    -------
+    result : dict
+        path, package, version, remote_version, status, error, timings and the total time.
+        The status is one of 'released', 'skipped' or 'failed'.
+
+    """
+    result = {'path': path, 'package': None, 'version': None, 'remote_version': None, 'status': 'failed', 'error': None, 'timings': {}, 'time': 0.0}
+    cwd = os.getcwd()
+    start = time.perf_counter()
+    try:
+        with gitops.worktree(path, verbose=verbose) if worktree else contextlib.nullcontext(path) as workdir:
+            os.chdir(workdir)
+            results = pipeline.release(packagename=packagename, clean=clean, upload=upload, twine=twine, repository_url=repository_url, build_mode=build_mode, force_rebuild=force_rebuild, version_source=version_source, resume=resume, verbose=verbose)
+            # Leave the worktree before it is removed
+            os.chdir(cwd)
+        context = results['context']
+        result['package'] = context.get('packagename')
+        result['version'] = context.get('current_version')
+        result['remote_version'] = context.get('git_version')
+        result['status'] = {'completed': 'released'}.get(results['status'], results['status'])
+        result['error'] = results['error']
+        result['timings'] = results['timings']
+    except Exception as e:
+        result['status'] = 'failed'
+        result['error'] = str(e)
+    finally:
+        result['time'] = time.perf_counter() - start
+        os.chdir(cwd)
+
+    return result
+
+
+# %% Release all packages
+def run_batch(paths, n_jobs=4, clean=True, upload=True, twine=None, repository_url=PYPI_URL, build_mode='single', force_rebuild=False, version_source='tags', resume=False, worktree=False, verbose=3):
+    """Release all packages that are found in paths in parallel.
+
+    Parameters
+    ----------
+    paths : list of str
+        Package directories or directories that contain packages.
+    n_jobs : int, optional
+        Number of packages that are released concurrently. The default is 4.
+    clean : bool, optional
+        Clean local distribution files for packaging. The default is True.
+    upload : bool, optional
+        Upload the distribution archives to PyPi. The default is True.
+    twine : str, optional
+        Filepath to the executable of twine. None uploads the files concurrently without twine.
+    repository_url : str, optional
+        Upload url of the repository. The default is 'https://upload.pypi.org/legacy/'.
+    build_mode : str, optional
+        How the sdist and wheel are build, see :func:`irelease.builder.build_artifacts`. The default is 'single'.
+    force_rebuild : bool, optional
+        Build even if the sources are unchanged since the artifacts in dist/ were build. The default is False.
+    version_source : str, optional
+        Read the latest released version from the git 'tags', the github releases ('remote') or 'both'. The default is 'tags'.
+    resume : bool, optional
+        Continue every package at the step that failed in the previous run. The default is False.
+    worktree : bool, optional
+        Release every package from a temporary git worktree of its committed HEAD. The default is False.
+    verbose : int, optional
+        Print message. The default is 3.
+
+    Returns
+    -------
+    results : list of dict
+        One result per package, see :func:`release_package`.
+
+    Examples
+    --------
+    >>> from irelease import batch
+    >>> results = batch.run_batch(['~/repos/'], n_jobs=8)
+
+    """
+    packages = find_packages([os.path.expanduser(p) for p in paths], verbose=verbose)
+    results = []
+    if len(packages)==0: return results
+
+    # Each worker is a separate process so that changing the working directory is safe.
+    with ProcessPoolExecutor(max_workers=max(1, min(n_jobs, len(packages)))) as executor:
+        futures = {executor.submit(release_package, path, clean=clean, upload=upload, twine=twine, repository_url=repository_url, build_mode=build_mode, force_rebuild=force_rebuild, version_source=version_source, resume=resume, worktree=worktree, verbose=min(verbose, 2)): path for path in packages}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {'path': futures[future], 'package': None, 'version': None, 'remote_version': None, 'status': 'failed', 'error': str(e), 'timings': {}, 'time': 0.0}
+            if verbose>=3: print('[irelease] [%s] %s' %(result['status'], result['path']))
+            results.append(result)
+
+    # Same order as the packages were found
+    results = sorted(results, key=lambda r: packages.index(r['path']))
+    if verbose>=1: print_summary(results)
+    return results
+
+
+def print_summary(results):
+    """Print the status and timings of a batch release."""
+    steps = ['git_pull', 'remote_version', 'clean', 'build', 'verify', 'tag', 'upload', 'git_release']
+    print('[irelease] ================================================================')
+    print('[irelease] %-20s %-10s %-10s %-9s' %('package', 'version', 'status', 'time (s)') + ''.join(' %8s' %(s[:8]) for s in steps))
+    for r in results:
+        package = r['package'] if r['package'] is not None else os.path.basename(r['path'])
+        timings = ''.join(' %8.1f' %(r['timings'][s]) if s in r['timings'] else ' %8s' %('-') for s in steps)
+        print('[irelease] %-20s %-10s %-10s %-9.1f' %(package[:20], r['version'] or '-', r['status'], r['time']) + timings)
+    for r in results:
+        if r['error'] is not None:
+            print('[irelease] %s: %s' %(r['package'] or r['path'], r['error']))
+    counts = {status: sum(r['status']==status for r in results) for status in ['released', 'skipped', 'failed']}
+    print('[irelease] released: %d, skipped: %d, failed: %d' %(counts['released'], counts['skipped'], counts['failed']))
+    print('[irelease] ================================================================')
@@ -0,0 +1,421 @@
+"""Benchmarks for irelease."""
+# --------------------------------------------------
+# Name        : benchmark.py
+# Author      : E.Taskesen
+# Contact     : erdogant@gmail.com
+# github      : https://github.com/erdogant/irelease
+# Licence     : MIT
+# --------------------------------------------------
+
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import tempfile
+import platform
+import argparse
+import subprocess
+
+# Budget for "import irelease" in milliseconds.
+IMPORT_BUDGET = 100
+# Modules that must not be imported at startup.
+LAZY_MODULES = ['numpy', 'webbrowser', 'urllib.request', 'http.client', 'http.server', 'configparser', 'build', 'pyproject_hooks', 'packaging', 'venv', 'concurrent.futures', 'cProfile', 'asyncio']
+# Sizes of the synthetic repositories: number of source files, version tags and remotes.
+SIZES = {
+    'small': {'files': 10, 'tags': 5, 'remotes': 1},
+    'medium': {'files': 1000, 'tags': 200, 'remotes': 3},
+    'large': {'files': 10000, 'tags': 2000, 'remotes': 10},
+}
+# Owner and name of the synthetic repositories
+OWNER = 'bench'
+PACKAGE = 'benchpkg'
+
+
+# %% Import time
+def import_time(module='irelease', repeat=5):
+    """Measure the import time of module in fresh interpreters.
+
+    Parameters
+    ----------
+    module : str, optional
+        Module to import. The default is 'irelease'.
+    repeat : int, optional
+        Number of measurements. The default is 5.
+
+    Returns
+    -------
+    results : dict
+        time : Best cumulative import time in milliseconds.
+        times : All measurements in milliseconds.
+        modules : Modules that are imported.
+
+    """
+    times, modules = [], []
+    env = os.environ.copy()
+    # Import the same irelease as the one that is running
+    env['PYTHONPATH'] = os.pathsep.join([os.path.dirname(os.path.dirname(os.path.abspath(__file__)))] + [p for p in [env.get('PYTHONPATH')] if p])
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module], capture_output=True, text=True, env=env, check=True).stderr
+        lines = [re.match(r'^import time:\s*(\d+) \|\s*(\d+) \|(\s*)(\S+)$', line) for line in output.splitlines()]
+        lines = [m for m in lines if m is not None]
+        modules = [m.group(4) for m in lines]
+        times.append([int(m.group(2)) for m in lines if m.group(4)==module][-1] / 1000)
+    return {'time': min(times), 'times': times, 'modules': modules}
+
+
+def check_import_time(budget=IMPORT_BUDGET, repeat=5, results=None, verbose=3):
+    """Check that importing irelease stays within the budget and does not import heavy modules.
+
+    Parameters
+    ----------
+    results : dict, optional
+        Measurement of :func:`import_time`. None measures the import time.
+
+    Returns
+    -------
+    bool
+        True when the import time is below budget and none of the LAZY_MODULES are imported.
+
+    """
+    if results is None: results = import_time('irelease', repeat=repeat)
+    eager = [m for m in LAZY_MODULES if m in results['modules']]
+    ok = results['time']<=budget and len(eager)==0
+    if verbose>=3:
+        print('[irelease] import irelease: %.1f ms (budget: %d ms)' %(results['time'], budget))
+    if verbose>=1 and len(eager)>0:
+        print('[irelease] ERROR: modules are imported at startup: %s' %(', '.join(eager)))
+    if verbose>=1 and results['time']>budget:
+        print('[irelease] ERROR: import time %.1f ms exceeds the budget of %d ms.' %(results['time'], budget))
+    return ok
+
+
+# %% Synthetic repositories
+def _git(path, *args):
+    return subprocess.run(['git'] + list(args), cwd=path, capture_output=True, text=True, check=True).stdout
+
+
+def make_repo(dirpath, files=10, tags=5, remotes=1, packagename=PACKAGE):
+    """Create a package repository with a local bare remote.
+
+    The remote url is a github url that git rewrites to the bare remote, so that the repository is
+    recognized as github while pull and push stay local.
+
+    Parameters
+    ----------
+    dirpath : str
+        Directory in which the repository ('<packagename>') and the bare remote ('remote.git') are created.
+    files : int, optional
+        Number of python files in the package. The default is 10.
+    tags : int, optional
+        Number of version tags (0.1.0, 0.2.0, ...). Half of the tags are packed. The default is 5.
+    remotes : int, optional
+        Number of remotes, the first one is origin. The default is 1.
+    packagename : str, optional
+        Name of the package. The default is 'benchpkg'.
+
+    Returns
+    -------
+    repo : dict
+        path, remote, url, packagename, version (the next version), tags (list of str) and files.
+
+    """
+    dirpath = os.path.abspath(dirpath)
+    path, remote = os.path.join(dirpath, packagename), os.path.join(dirpath, 'remote.git')
+    url = 'https://github.com/%s/%s.git' %(OWNER, packagename)
+    os.makedirs(os.path.join(path, packagename))
+    subprocess.run(['git', 'init', '-q', '--bare', remote], check=True)
+    _git(path, 'init', '-q')
+    _git(path, 'config', 'user.name', OWNER)
+    _git(path, 'config', 'user.email', OWNER + '@localhost')
+    _git(path, 'config', 'url.%s.insteadOf' %(remote), url)
+    _git(path, 'remote', 'add', 'origin', url)
+    for i in range(1, remotes):
+        _git(path, 'remote', 'add', 'mirror%d' %(i), 'https://github.com/%s%d/%s.git' %(OWNER, i, packagename))
+
+    tag_names = ['0.%d.0' %(i) for i in range(1, tags + 1)]
+    version = '0.%d.0' %(tags + 1)
+    with open(os.path.join(path, packagename, '__init__.py'), 'w') as f:
+        f.write("__version__ = '%s'\n" %(version))
+    # Spread the files over sub-packages of at most 100 files
+    for i in range(files):
+        subdir = os.path.join(path, packagename, 'sub%03d' %(i // 100))
+        if i % 100==0:
+            os.makedirs(subdir)
+            open(os.path.join(subdir, '__init__.py'), 'w').close()
+        with open(os.path.join(subdir, 'module%05d.py' %(i)), 'w') as f:
+            f.write('def function_%d(x):\n    return x + %d\n' %(i, i))
+    with open(os.path.join(path, 'pyproject.toml'), 'w') as f:
+        f.write('[build-system]\nrequires = ["setuptools>=61"]\nbuild-backend = "setuptools.build_meta"\n\n'
+                '[project]\nname = "%s"\ndynamic = ["version"]\n\n'
+                '[tool.setuptools.dynamic]\nversion = {attr = "%s.__version__"}\n\n'
+                '[tool.setuptools.packages.find]\ninclude = ["%s*"]\n' %(packagename, packagename, packagename))
+    with open(os.path.join(path, 'README.md'), 'w') as f:
+        f.write('# %s\n' %(packagename))
+    _git(path, 'add', '-A')
+    _git(path, 'commit', '-q', '-m', 'init')
+
+    # Create the tags with one git process: the first half is packed, the others are loose refs.
+    head = _git(path, 'rev-parse', 'HEAD').strip()
+    half = len(tag_names) // 2
+    for packed, names in [(True, tag_names[:half]), (False, tag_names[half:])]:
+        if len(names)==0: continue
+        subprocess.run(['git', 'update-ref', '--stdin'], cwd=path, input=''.join('create refs/tags/%s %s\n' %(t, head) for t in names), text=True, check=True)
+        if packed: _git(path, 'pack-refs', '--all')
+    _git(path, 'push', '-q', 'origin', 'HEAD', '--tags')
+    _git(path, 'branch', '-q', '--set-upstream-to=origin/%s' %(_git(path, 'rev-parse', '--abbrev-ref', 'HEAD').strip()))
+    return {'path': path, 'remote': remote, 'url': url, 'packagename': packagename, 'version': version, 'tags': tag_names, 'files': files}
+
+
+def _make_build_output(path, packagename, files):
+    # Leftovers of a previous build: dist, build, egg-info and __pycache__ directories.
+    count, size = 0, 0
+    content = b'\0' * 4096
+    for dirpath, n in [('dist', 2), ('build', files), (packagename + '.egg-info', 5), (os.path.join(packagename, '__pycache__'), files), ('.pytest_cache', 10)]:
+        os.makedirs(os.path.join(path, dirpath), exist_ok=True)
+        for i in range(max(1, n)):
+            with open(os.path.join(path, dirpath, 'file%05d.bin' %(i)), 'wb') as f:
+                f.write(content)
+            count, size = count + 1, size + len(content)
+    return count, size
+
+
+# %% Benchmarks
+def _best(func, repeat, setup=None):
+    # Best wall-time in milliseconds
+    times = []
+    for _ in range(repeat):
+        if setup is not None: setup()
+        start = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - start) * 1000)
+    return min(times)
+
+
+def bench_discovery(repo, repeat=20):
+    """Time the metadata discovery of the release in the repository.
+
+    Cold timings parse the repository again, warm timings use the cached repository context.
+    The cold timings of the repository context use the discovery cache in .git, 'discover' never uses a cache.
+
+    Returns
+    -------
+    results : dict
+        {function: {'cold_ms': float, 'warm_ms': float, 'per_s': float}}
+
+    """
+    from irelease import irelease, gitops, discover
+    from irelease.context import clear_cache
+    functions = {
+        'discover': lambda: discover.discover('.', cache=False),
+        '_package_name_infer': lambda: irelease._package_name_infer(None, verbose=0),
+        '_git_username': lambda: irelease._git_username('github', verbose=0),
+        '_getversion': lambda: irelease._getversion(repo['packagename']),
+        'tag_version': lambda: gitops.tag_version('.', verbose=0),
+    }
+    cwd = os.getcwd()
+    os.chdir(repo['path'])
+    try:
+        results = {}
+        for name, func in functions.items():
+            cold = _best(func, repeat, setup=clear_cache)
+            warm = _best(func, repeat)
+            results[name] = {'cold_ms': cold, 'warm_ms': warm, 'per_s': 1000 / warm if warm>0 else None}
+        # The discovery must find the synthetic package
+        assert irelease._package_name_infer(None, verbose=0)==repo['packagename']
+        assert gitops.tag_version('.', verbose=0)==(repo['tags'][-1] if repo['tags'] else gitops.NO_RELEASE)
+    finally:
+        os.chdir(cwd)
+        clear_cache()
+    return results
+
+
+def bench_clean(repo, repeat=3):
+    """Time the removal of previous build output from the repository.
+
+    Returns
+    -------
+    results : dict
+        files, bytes, time_ms (best), files_per_s and mb_per_s.
+
+    """
+    from irelease import irelease
+    cwd = os.getcwd()
+    os.chdir(repo['path'])
+    try:
+        times = []
+        for _ in range(repeat):
+            count, size = _make_build_output('.', repo['packagename'], repo['files'])
+            start = time.perf_counter()
+            irelease._make_clean(repo['packagename'], verbose=0)
+            times.append(time.perf_counter() - start)
+    finally:
+        os.chdir(cwd)
+    elapsed = min(times)
+    return {'files': count, 'bytes': size, 'time_ms': elapsed * 1000, 'files_per_s': count / elapsed, 'mb_per_s': size / elapsed / 1e6}
+
+
+def _mockserver_dir():
+    # The mock servers are part of the tests of the source repository, they are not installed with the package.
+    testsdir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tests')
+    return testsdir if os.path.isfile(os.path.join(testsdir, 'mockserver.py')) else None
+
+
+def bench_pipeline(repo, cachedir=None, timeout=900):
+    """Release the repository with the non-interactive pipeline against local mock servers.
+
+    The release runs in a fresh interpreter with ``irelease -y``. The version is cross-checked with a
+    mock github API and the artifacts are uploaded to a mock package index. The mock servers are in
+    tests/mockserver.py of the source repository, FileNotFoundError is raised when they are not available.
+
+    Parameters
+    ----------
+    repo : dict
+        Repository of :func:`make_repo`.
+    cachedir : str, optional
+        Cache directory of the build environments and version lookups. None uses the default cache.
+    timeout : int, optional
+        Maximum time of the release in seconds. The default is 900.
+
+    Returns
+    -------
+    results : dict
+        status, exitcode, time (s), stages {span: seconds}, uploaded (files), bytes and upload_mb_per_s.
+
+    """
+    from irelease import trace
+    testsdir = _mockserver_dir()
+    if testsdir is None:
+        raise FileNotFoundError('The pipeline benchmark needs the mock servers of the source repository: tests/mockserver.py')
+    if testsdir not in sys.path: sys.path.insert(0, testsdir)
+    from mockserver import MockIndex, MockGitHub
+    rootdir = os.path.dirname(testsdir)
+    tracefile = os.path.join(os.path.dirname(repo['path']), 'trace.jsonl')
+    env = os.environ.copy()
+    env['PYTHONPATH'] = os.pathsep.join([rootdir] + [p for p in [env.get('PYTHONPATH')] if p])
+    env.pop('GITHUB_TOKEN', None)
+    if cachedir is not None: env['IRELEASE_CACHE_DIR'] = cachedir
+
+    with MockIndex() as index, MockGitHub({'%s/%s' %(OWNER, repo['packagename']): repo['tags']}) as github:
+        env['GITHUB_API_URL'] = github.url
+        command = [sys.executable, '-c', 'from irelease.irelease import main; main()', '-y', '-v', '0', '--version-source', 'both', '-r', index.url, '--trace-file', tracefile]
+        start = time.perf_counter()
+        process = subprocess.run(command, cwd=repo['path'], env=env, capture_output=True, text=True, timeout=timeout)
+        elapsed = time.perf_counter() - start
+        uploaded = {name: len(content) for files in index.files.values() for name, content in files.items()}
+
+    spans = trace.read(tracefile) if os.path.isfile(tracefile) else []
+    stages = {s['name']: s['duration'] for s in spans if s.get('parent')=='release'}
+    upload_time = sum(s['duration'] for s in spans if s['name'].startswith('upload ') and s.get('http_status')==200)
+    size = sum(uploaded.values())
+    results = {'status': 'released' if process.returncode==0 and len(uploaded)>0 else 'failed', 'exitcode': process.returncode, 'time': elapsed, 'stages': stages,
+               'uploaded': sorted(uploaded), 'bytes': size, 'upload_mb_per_s': size / upload_time / 1e6 if upload_time>0 else None}
+    if process.returncode!=0: results['error'] = (process.stderr or process.stdout).strip()[-2000:]
+    return results
+
+
+def run_suite(sizes=('small', 'medium'), repeat=20, pipeline=False, workdir=None, cachedir=None, verbose=3):
+    """Benchmark discovery, clean and the release pipeline on synthetic repositories.
+
+    Parameters
+    ----------
+    sizes : list of str, optional
+        Repository sizes, see SIZES. The default is ('small', 'medium').
+    repeat : int, optional
+        Number of measurements of the discovery functions. The default is 20.
+    pipeline : bool, optional
+        Also run the full release pipeline, see :func:`bench_pipeline`. It is skipped when the mock servers
+        of the source repository are not available. The default is False.
+    workdir : str, optional
+        Directory for the synthetic repositories. The default is a temporary directory that is removed afterwards.
+    cachedir : str, optional
+        Cache directory of the build environments, see :func:`bench_pipeline`.
+    verbose : int, optional
+        Print message. The default is 3.
+
+    Returns
+    -------
+    results : list of dict
+        Per size: size, files, tags, remotes, setup (s), discovery, clean and pipeline.
+
+    Examples
+    --------
+    >>> from irelease import benchmark
+    >>> results = benchmark.run_suite(sizes=['small'])
+
+    """
+    if pipeline and _mockserver_dir() is None:
+        if verbose>=2: print('[irelease] Warning: the pipeline benchmark is skipped, it needs tests/mockserver.py of the source repository.')
+        pipeline = False
+    tmpdir = tempfile.mkdtemp(prefix='irelease-bench-') if workdir is None else None
+    results = []
+    try:
+        for size in sizes:
+            dirpath = os.path.join(workdir or tmpdir, size)
+            if os.path.isdir(dirpath): shutil.rmtree(dirpath)
+            if verbose>=3: print('[irelease] Benchmark [%s]: %s' %(size, SIZES[size]))
+            start = time.perf_counter()
+            repo = make_repo(dirpath, **SIZES[size])
+            result = dict(size=size, setup=time.perf_counter() - start, **SIZES[size])
+            result['discovery'] = bench_discovery(repo, repeat=repeat)
+            result['clean'] = bench_clean(repo)
+            if pipeline: result['pipeline'] = bench_pipeline(repo, cachedir=cachedir)
+            if verbose>=3: print_results([result])
+            results.append(result)
+    finally:
+        if tmpdir is not None: shutil.rmtree(tmpdir, ignore_errors=True)
+    return results
+
+
+def print_results(results):
+    """Print the results of :func:`run_suite` as a table."""
+    for r in results:
+        print('[irelease] ================================================================')
+        print('[irelease] %s: %d files, %d tags, %d remotes (setup %.1fs)' %(r['size'], r['files'], r['tags'], r['remotes'], r['setup']))
+        for name, t in r['discovery'].items():
+            print('[irelease] %-30s cold %8.3f ms  warm %8.3f ms' %(name, t['cold_ms'], t['warm_ms']))
+        print('[irelease] %-30s %8.1f ms  %10.0f files/s  %8.1f MB/s' %('clean', r['clean']['time_ms'], r['clean']['files_per_s'], r['clean']['mb_per_s']))
+        if 'pipeline' in r:
+            p = r['pipeline']
+            print('[irelease] %-30s %8.2f s   [%s]' %('pipeline', p['time'], p['status']))
+            for name, elapsed in sorted(p['stages'].items(), key=lambda s: -s[1]):
+                print('[irelease]   %-28s %8.2f s' %(name, elapsed))
+            if p.get('error'): print('[irelease] ERROR: %s' %(p['error'].splitlines()[-1]))
+    print('[irelease] ================================================================')
+
+
+# %% Main
+def main():
+    """Run the benchmarks."""
+    parser = argparse.ArgumentParser(description='irelease benchmarks')
+    parser.add_argument("--import-budget", type=float, default=IMPORT_BUDGET, help="Maximum import time in ms (default: %d)." %(IMPORT_BUDGET))
+    parser.add_argument("--json", action="store_true", help="Print the results as json.")
+    parser.add_argument("--suite", action="store_true", help="Also benchmark discovery, clean and the release pipeline on synthetic repositories.")
+    parser.add_argument("--sizes", type=str, nargs='+', default=['small', 'medium'], choices=list(SIZES.keys()), help="Sizes of the synthetic repositories (default: small medium).")
+    parser.add_argument("--repeat", type=int, default=20, help="Number of measurements of the discovery functions (default: 20).")
+    parser.add_argument("--pipeline", action="store_true", help="With --suite, also run the full release pipeline against the mock servers of the source repository.")
+    parser.add_argument("--workdir", type=str, help="Keep the synthetic repositories in this directory.")
+    parser.add_argument("--output", type=str, help="Write the results as json to this file.")
+    args = parser.parse_args()
+    verbose = 0 if args.json else 3
+
+    results = import_time('irelease')
+    eager = [m for m in LAZY_MODULES if m in results['modules']]
+    failed = not check_import_time(budget=args.import_budget, results=results, verbose=verbose)
+    report = {'python': platform.python_version(), 'platform': platform.platform(), 'import_time_ms': results['time'], 'budget_ms': args.import_budget, 'eager_modules': eager}
+
+    if args.suite:
+        report['suite'] = run_suite(sizes=args.sizes, repeat=args.repeat, pipeline=args.pipeline, workdir=args.workdir, verbose=verbose)
+        failed = failed or any(r['pipeline']['status']=='failed' for r in report['suite'] if 'pipeline' in r)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.json:
+        print(json.dumps(report))
+    sys.exit(int(failed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,406 @@
+"""Build the wheel and sdist in one (cached) build environment."""
+# --------------------------------------------------
+# Name        : builder.py
+# Author      : E.Taskesen
+# Contact     : erdogant@gmail.com
+# github      : https://github.com/erdogant/irelease
+# Licence     : MIT
+# --------------------------------------------------
+
+import os
+import sys
+import json
+import time
+import hashlib
+import shutil
+import tarfile
+import tempfile
+import venv
+from concurrent.futures import ThreadPoolExecutor
+import toml
+from irelease import trace
+
+BUILD_MODES = ['single', 'sdist', 'parallel']
+CACHE_DIR = os.environ.get('IRELEASE_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'irelease'))
+# Build-system of projects without a pyproject.toml (same as pip and build)
+LEGACY_BUILD_SYSTEM = {'requires': ['setuptools >= 40.8.0'], 'build-backend': 'setuptools.build_meta:__legacy__'}
+# Files that change the build next to the package directory
+METADATA_FILES = ['pyproject.toml', 'setup.py', 'setup.cfg', 'MANIFEST.in', 'requirements.txt']
+MANIFEST_FILE = '.irelease-manifest.json'
+# Top-level directories that are not copied for the parallel build of the wheel: git history, build output and environments.
+COPY_IGNORE = ['.git', 'build', 'dist', '.tox', '.nox', '.venv', 'venv']
+
+
+# %% Build environment
+def create_env(envdir, requires=None, verbose=3):
+    """Create a virtual environment and install the build requirements.
+
+    Parameters
+    ----------
+    envdir : str
+        Directory of the environment.
+    requires : list of str, optional
+        Requirements to install in the environment.
+    verbose : int, optional
+        Print message. The default is 3.
+
+    Returns
+    -------
+    python : str
+        Path to the python executable of the environment.
+
+    """
+    if verbose>=3: print('[irelease] Creating build environment: %s' %(envdir))
+    with trace.span('create build env'):
+        venv.create(envdir, with_pip=True, clear=True)
+    python = _env_python(envdir)
+    install_requires(python, requires, verbose=verbose)
+    return python
+
+
+def install_requires(python, requires, verbose=3):
+    """Install the requirements into the environment of python.
+
+    Installed requirements are recorded in the environment so that a reused environment does not call pip again.
+    """
+    recordfile = os.path.join(os.path.dirname(os.path.dirname(python)), '.irelease-installed')
+    installed = set()
+    if os.path.isfile(recordfile):
+        with open(recordfile, 'r') as f:
+            installed = set(f.read().splitlines())
+    requires = sorted(set(requires or []) - installed)
+    if len(requires)==0: return
+    if verbose>=3: print('[irelease] Installing build requirements: %s' %(', '.join(requires)))
+    command = [python, '-m', 'pip', 'install', '--disable-pip-version-check']
+    if verbose<4: command.append('--quiet')
+    from irelease import runner
+    with trace.span('pip install build requirements', requires=requires):
+        runner.run(command + requires, 'build', verbose=verbose)
+    with open(recordfile, 'a') as f:
+        f.write(''.join(r + '\n' for r in requires))
+
+
+# %% Build environment cache
+def build_system(srcdir='.'):
+    """Read the [build-system] table of the pyproject.toml in srcdir."""
+    filepath = os.path.join(srcdir, 'pyproject.toml')
+    if os.path.isfile(filepath):
+        with open(filepath, 'r') as f:
+            table = toml.load(f).get('build-system')
+        if table is not None:
+            return {'requires': table.get('requires', []), 'build-backend': table.get('build-backend', LEGACY_BUILD_SYSTEM['build-backend']), 'backend-path': table.get('backend-path', [])}
+    return dict(LEGACY_BUILD_SYSTEM)
+
+
+def env_key(table):
+    """Hash of the [build-system] table and the python interpreter that builds the environment."""
+    data = {'build-system': table, 'python': sys.version, 'platform': sys.platform}
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def cached_env(srcdir='.', cachedir=None, max_envs=10, max_size=2e9, verbose=3):
+    """Get a build environment with the build requirements of srcdir from the cache.
+
+    The environment is created on a miss. Afterwards the least recently used environments are
+    removed until at most max_envs environments and max_size bytes remain.
+
+    Parameters
+    ----------
+    srcdir : str, optional
+        Root directory of the package. The default is '.'.
+    cachedir : str, optional
+        Cache directory. The default is ~/.cache/irelease or the IRELEASE_CACHE_DIR environment variable.
+    max_envs : int, optional
+        Maximum number of cached environments. The default is 10.
+    max_size : float, optional
+        Maximum size of all cached environments in bytes. The default is 2e9.
+    verbose : int, optional
+        Print message. The default is 3.
+
+    Returns
+    -------
+    python : str
+        Path to the python executable of the environment.
+
+    """
+    envsdir = os.path.join(cachedir or CACHE_DIR, 'build-envs')
+    table = build_system(srcdir)
+    key = env_key(table)
+    envdir = os.path.join(envsdir, key)
+    metafile = os.path.join(envdir, '.irelease-env.json')
+
+    if os.path.isfile(metafile):
+        if verbose>=3: print('[irelease] Reuse cached build environment [%s]' %(key))
+        with open(metafile, 'r') as f:
+            meta = json.load(f)
+    else:
+        # Create in a temporary directory and move it in place so concurrent releases never see a half-made environment.
+        os.makedirs(envsdir, exist_ok=True)
+        tmpdir = tempfile.mkdtemp(prefix=key + '.tmp-', dir=envsdir)
+        create_env(tmpdir, requires=table['requires'], verbose=verbose)
+        meta = {'key': key, 'build-system': table, 'created': time.time(), 'size': _dirsize(tmpdir)}
+        try:
+            os.rename(tmpdir, envdir)
+        except OSError:
+            # Another process was first.
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+    meta['last_used'] = time.time()
+    _write_json(metafile, meta)
+    prune_envs(cachedir=cachedir, max_envs=max_envs, max_size=max_size, keep=[key], verbose=verbose)
+    return _env_python(envdir)
+
+
+def list_envs(cachedir=None):
+    """List the cached build environments, most recently used first."""
+    envsdir = os.path.join(cachedir or CACHE_DIR, 'build-envs')
+    envs = []
+    if not os.path.isdir(envsdir): return envs
+    for entry in os.scandir(envsdir):
+        metafile = os.path.join(entry.path, '.irelease-env.json')
+        if entry.is_dir() and os.path.isfile(metafile):
+            with open(metafile, 'r') as f:
+                meta = json.load(f)
+            meta['path'] = entry.path
+            envs.append(meta)
+    return sorted(envs, key=lambda e: e.get('last_used', 0), reverse=True)
+
+
+def prune_envs(cachedir=None, max_envs=10, max_size=2e9, keep=None, verbose=3):
+    """Remove the least recently used build environments above max_envs or max_size.
+
+    Returns
+    -------
+    removed : list of str
+        Keys of the removed environments.
+
+    """
+    keep = keep or []
+    removed, kept, total = [], 0, 0
+    for env in list_envs(cachedir):
+        if env['key'] not in keep and (kept>=max_envs or total + env.get('size', 0)>max_size):
+            if verbose>=3: print('[irelease] Remove cached build environment [%s]' %(env['key']))
+            shutil.rmtree(env['path'], ignore_errors=True)
+            removed.append(env['key'])
+        else:
+            kept = kept + 1
+            total = total + env.get('size', 0)
+    return removed
+
+
+def _dirsize(path):
+    size = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            filepath = os.path.join(root, f)
+            if not os.path.islink(filepath):
+                size = size + os.path.getsize(filepath)
+    return size
+
+
+def _write_json(filepath, data):
+    tmpfile = '%s.%d.tmp' %(filepath, os.getpid())
+    with open(tmpfile, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmpfile, filepath)
+
+
+def _env_python(envdir):
+    if sys.platform=='win32':
+        return os.path.join(envdir, 'Scripts', 'python.exe')
+    return os.path.join(envdir, 'bin', 'python')
+
+
+def _builder(srcdir, python, runner=None, verbose=3):
+    # Import here: build is only required when packages are build.
+    import build
+    import pyproject_hooks
+    if runner is None:
+        runner = pyproject_hooks.default_subprocess_runner if verbose>=3 else pyproject_hooks.quiet_subprocess_runner
+    return build.ProjectBuilder(srcdir, python_executable=python, runner=runner)
+
+
+def _build_one(srcdir, distribution, outdir, python, runner=None, verbose=3):
+    start = time.perf_counter()
+    with trace.span('build ' + distribution) as event:
+        builder = _builder(srcdir, python, runner=runner, verbose=verbose)
+        install_requires(python, builder.get_requires_for_build(distribution), verbose=verbose)
+        filepath = builder.build(distribution, outdir)
+        event['file'] = os.path.basename(filepath)
+    return {'file': filepath, 'time': time.perf_counter() - start}
+
+
+# %% Build
+def build_artifacts(srcdir='.', outdir='dist', mode='single', python=None, cache=True, runner=None, verbose=3):
+    """Build the sdist and the wheel with a single build environment.
+
+    Parameters
+    ----------
+    srcdir : str, optional
+        Root directory of the package. The default is '.'.
+    outdir : str, optional
+        Output directory of the distribution archives. The default is 'dist'.
+    mode : str, optional
+        'single'   : Build the sdist and then the wheel from the source directory.
+        'sdist'    : Build the sdist and then the wheel from the unpacked sdist (like python -m build).
+        'parallel' : Build the sdist from the source directory and concurrently the wheel from a copy of it,
+                     so that the backends do not share their build directories.
+        The default is 'single'.
+    python : str, optional
+        Python executable of an environment that contains the build requirements.
+        None uses the cached environment or creates a temporary environment.
+    cache : bool, optional
+        Reuse a cached build environment with the same [build-system] requirements. The default is True.
+    runner : callable, optional
+        Runs the build backend hooks: runner(cmd, cwd, extra_environ), see pyproject_hooks.
+        The default shows the output of the backend when verbose>=3.
+    verbose : int, optional
+        Print message. The default is 3.
+
+    Returns
+    -------
+    results : dict
+        sdist : dict with the file and the build time.
+        wheel : dict with the file and the build time.
+        env : Time to prepare the build environment.
+        time : Total wall-time.
+
+    Examples
+    --------
+    >>> from irelease import builder
+    >>> results = builder.build_artifacts(mode='parallel')
+    >>> print(results['wheel']['file'], results['wheel']['time'])
+
+    """
+    if mode not in BUILD_MODES: raise ValueError('[irelease] ERROR: mode must be one of %s' %(BUILD_MODES))
+    start = time.perf_counter()
+    srcdir = os.path.abspath(srcdir)
+    outdir = os.path.abspath(outdir)
+    os.makedirs(outdir, exist_ok=True)
+    tmpdir = tempfile.mkdtemp(prefix='irelease-build-')
+
+    try:
+        # One environment for both distributions
+        if python is None and cache:
+            python = cached_env(srcdir, verbose=verbose)
+        elif python is None:
+            python = create_env(os.path.join(tmpdir, 'env'), verbose=verbose)
+            install_requires(python, _builder(srcdir, python, verbose=verbose).build_system_requires, verbose=verbose)
+        results = {'env': time.perf_counter() - start}
+
+        if mode=='parallel':
+            wheel_srcdir = _copy_source(srcdir, os.path.join(tmpdir, 'src'))
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                sdist = executor.submit(trace.bind(_build_one), srcdir, 'sdist', outdir, python, runner, verbose)
+                wheel = executor.submit(trace.bind(_build_one), wheel_srcdir, 'wheel', outdir, python, runner, verbose)
+                results['sdist'], results['wheel'] = sdist.result(), wheel.result()
+        else:
+            results['sdist'] = _build_one(srcdir, 'sdist', outdir, python, runner, verbose)
+            wheel_srcdir = srcdir
+            if mode=='sdist':
+                wheel_srcdir = _unpack_sdist(results['sdist']['file'], os.path.join(tmpdir, 'sdist'))
+            results['wheel'] = _build_one(wheel_srcdir, 'wheel', outdir, python, runner, verbose)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    results['time'] = time.perf_counter() - start
+    if verbose>=3:
+        print('[irelease] Build environment ready in %.1fs' %(results['env']))
+        for distribution in ['sdist', 'wheel']:
+            print('[irelease] %-5s %s in %.1fs' %(distribution, os.path.basename(results[distribution]['file']), results[distribution]['time']))
+    return results
+
+
+# %% Incremental builds
+def source_hash(srcdir, packagename, version):
+    """Content hash of the package tree, the metadata files and the version.
+
+    Parameters
+    ----------
+    srcdir : str
+        Root directory of the package.
+    packagename : str
+        Name of the package. The directory and the version file are found with :func:`irelease.discover.discover`.
+    version : str
+        Version of the package.
+
+    Returns
+    -------
+    str
+        sha256 hex digest.
+
+    """
+    filepaths = [os.path.join(srcdir, f) for f in sorted(os.listdir(srcdir)) if f in METADATA_FILES or f.split('.')[0] in ('README', 'LICENSE')]
+    packagedir, initfile = _package_dir(srcdir, packagename)
+    # A single module or a version file outside the package directory
+    if initfile is not None and (packagedir is None or not initfile.startswith(packagedir + '/')):
+        filepaths.append(os.path.join(srcdir, initfile))
+    for root, dirs, files in os.walk(os.path.join(srcdir, packagedir)) if packagedir is not None else []:
+        dirs[:] = sorted(d for d in dirs if d!='__pycache__')
+        filepaths.extend(os.path.join(root, f) for f in sorted(files) if not f.endswith(('.pyc', '.pyo')))
+
+    digest = hashlib.sha256(version.encode())
+    for filepath in filepaths:
+        if not os.path.isfile(filepath): continue
+        digest.update(os.path.relpath(filepath, srcdir).replace(os.sep, '/').encode())
+        digest.update(_file_hash(filepath).encode())
+    return digest.hexdigest()
+
+
+def _package_dir(srcdir, packagename):
+    # Package directory and version file of packagename, relative to srcdir.
+    from irelease.context import RepoContext
+    context = RepoContext.get(srcdir)
+    if packagename in (context.project_name, context.packagename):
+        return context.packagedir, context.initfile
+    return packagename, None
+
+
+def write_manifest(srcdir, packagename, version, artifacts, outdir='dist'):
+    """Store the source hash and the artifact hashes in outdir/.irelease-manifest.json."""
+    manifest = {'source': source_hash(srcdir, packagename, version), 'version': version, 'artifacts': {os.path.basename(f): _file_hash(f) for f in artifacts}}
+    _write_json(os.path.join(srcdir, outdir, MANIFEST_FILE), manifest)
+    return manifest
+
+
+def is_up_to_date(srcdir, packagename, version, outdir='dist'):
+    """Return the existing artifacts when the sources are unchanged since they were build, otherwise None."""
+    filepath = os.path.join(srcdir, outdir, MANIFEST_FILE)
+    if not os.path.isfile(filepath): return None
+    with open(filepath, 'r') as f:
+        manifest = json.load(f)
+    if manifest.get('version')!=version or len(manifest.get('artifacts', {}))==0: return None
+    artifacts = [os.path.join(srcdir, outdir, name) for name in sorted(manifest['artifacts'])]
+    for artifact in artifacts:
+        if not os.path.isfile(artifact) or _file_hash(artifact)!=manifest['artifacts'][os.path.basename(artifact)]:
+            return None
+    if manifest.get('source')!=source_hash(srcdir, packagename, version): return None
+    return artifacts
+
+
+def _file_hash(filepath):
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _copy_source(srcdir, outdir):
+    # Copy of the source directory without the COPY_IGNORE directories, .egg-info and __pycache__.
+    def _ignore(directory, names):
+        toplevel = os.path.abspath(directory)==srcdir
+        return [n for n in names if n=='__pycache__' or (toplevel and (n in COPY_IGNORE or n.endswith('.egg-info')))]
+    with trace.span('copy source'):
+        shutil.copytree(srcdir, outdir, ignore=_ignore, symlinks=True)
+    return outdir
+
+
+def _unpack_sdist(filepath, outdir):
+    with tarfile.open(filepath) as tar:
+        if hasattr(tarfile, 'data_filter'):
+            tar.extractall(outdir, filter='data')
+        else:
+            tar.extractall(outdir)
+    # The sdist contains a single top-level directory: <name>-<version>
+    return os.path.join(outdir, os.listdir(outdir)[0])
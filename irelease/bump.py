@@ -0,0 +1,215 @@
+"""Increase the version and rewrite it in every file of the project that contains it."""
+# --------------------------------------------------
+# Name        : bump.py
+# Author      : E.Taskesen
+# Contact     : erdogant@gmail.com
+# github      : https://github.com/erdogant/irelease
+# Licence     : MIT
+# --------------------------------------------------
+
+import os
+import re
+import time
+import tempfile
+from irelease import trace
+
+PARTS = ['major', 'minor', 'patch', 'pre']
+# Files with the version, relative to the package root, and the patterns of the version in them.
+# The first group is kept, the second group is the version that is replaced.
+VERSION_FILES = {
+    # Only the version of the [project] table: the lines after [project] up to the next table.
+    'pyproject.toml': [r'''(?s)^\[project\][ \t]*(?:#[^\n]*)?\n(?:(?!^\[).)*?^(version\s*=\s*["'])([^"']+)(?=["'])'''],
+    'setup.cfg': [r'''^(version\s*=\s*)(?!attr:|file:)(\S+)'''],
+    'setup.py': [r'''(\bversion\s*=\s*["'])([^"']+)(?=["'])'''],
+    'CITATION.cff': [r'''^(version:\s*["']?)([^"'\s]+)'''],
+    'docs/conf.py': [r'''^((?:version|release)\s*=\s*["'])([^"']+)(?=["'])'''],
+    'docs/source/conf.py': [r'''^((?:version|release)\s*=\s*["'])([^"']+)(?=["'])'''],
+    'doc/conf.py': [r'''^((?:version|release)\s*=\s*["'])([^"']+)(?=["'])'''],
+    'doc/source/conf.py': [r'''^((?:version|release)\s*=\s*["'])([^"']+)(?=["'])'''],
+}
+INIT_PATTERN = r'''^(__version__\s*=\s*["'])([^"']+)(?=["'])'''
+PLAIN_PATTERN = r'''^(\s*)(\S+)'''
+DATE_PATTERN = r'''^(date-released:\s*["']?)(\d{4}-\d{2}-\d{2})'''
+
+
+# %% Versions
+def next_version(current, part):
+    """The version after current.
+
+    Parameters
+    ----------
+    current : str
+        Current version, e.g. '1.2.3'.
+    part : str
+        'major', 'minor', 'patch' or 'pre'.
+
+    Returns
+    -------
+    str
+        '2.0.0', '1.3.0', '1.2.4' or '1.2.4rc1' for '1.2.3'. A patch of a pre-release is the final
+        release ('1.2.4rc1' -> '1.2.4') and a pre of a pre-release is the next one ('1.2.4rc1' -> '1.2.4rc2').
+
+    """
+    from packaging.version import Version
+    if part not in PARTS: raise ValueError('part must be one of %s: %s' %(PARTS, part))
+    current = Version(current)
+    release = list(current.release) + [0] * (3 - len(current.release))
+    if part=='pre' and current.pre is not None:
+        return '%s%s%d' %('.'.join(map(str, current.release)), current.pre[0], current.pre[1] + 1)
+    if part=='patch' and current.pre is not None:
+        return '.'.join(map(str, current.release))
+    index = {'major': 0, 'minor': 1, 'patch': 2, 'pre': 2}[part]
+    release = release[:index] + [release[index] + 1] + [0] * (len(release) - index - 1)
+    return '.'.join(map(str, release)) + ('rc1' if part=='pre' else '')
+
+
+# %% Find
+def _short(old, new):
+    # Keep the number of parts of a short version, like the version in docs/conf.py: '1.2' -> '1.3'
+    if re.fullmatch(r'\d+(\.\d+)*', old) and len(old.split('.'))<len(new.split('.')):
+        return '.'.join(re.match(r'\d+(\.\d+)*', new).group(0).split('.')[:len(old.split('.'))])
+    return new
+
+
+def find_versions(srcdir='.', initfile=None):
+    """Find every version in the project in one pass over its files.
+
+    Parameters
+    ----------
+    srcdir : str, optional
+        Root directory of the package. The default is '.'.
+    initfile : str, optional
+        File with the version of the package, relative to srcdir. The default is found with :func:`irelease.discover.discover`.
+
+    Returns
+    -------
+    occurrences : list of dict
+        {file, line, version, span} of every version, the span is the location in the file.
+
+    """
+    if initfile is None:
+        from irelease.context import RepoContext
+        initfile = RepoContext.get(srcdir).initfile
+    return _scan(srcdir, initfile)[0]
+
+
+def _scan(srcdir, initfile):
+    # Occurrences of the version and the text of the files they are in.
+    filepatterns = dict(VERSION_FILES)
+    if initfile is not None:
+        filepatterns[initfile.replace(os.sep, '/')] = [INIT_PATTERN if initfile.endswith('.py') else PLAIN_PATTERN]
+
+    occurrences, texts = [], {}
+    for filename, patterns in filepatterns.items():
+        filepath = os.path.join(srcdir, filename)
+        if not os.path.isfile(filepath): continue
+        with open(filepath, 'r', encoding='utf-8', newline='') as f:
+            text = f.read()
+        for pattern in patterns:
+            for match in re.finditer(pattern, text, re.M):
+                occurrences.append({'file': filename, 'line': text.count('\n', 0, match.start(2)) + 1, 'version': match.group(2), 'span': match.span(2)})
+                texts[filename] = text
+    return occurrences, texts
+
+
+# %% Rewrite
+def write_atomic(files):
+    """Write all files or none of them.
+
+    Every file is written to a temporary file in the same directory first. Only when all of them are
+    written, they are renamed over the originals. The permissions of the originals are kept.
+
+    Parameters
+    ----------
+    files : dict
+        {filepath: text}.
+
+    """
+    tmpfiles = {}
+    try:
+        for filepath, text in files.items():
+            fd, tmpfile = tempfile.mkstemp(prefix='.' + os.path.basename(filepath) + '.', suffix='.tmp', dir=os.path.dirname(os.path.abspath(filepath)))
+            tmpfiles[filepath] = tmpfile
+            with os.fdopen(fd, 'w', encoding='utf-8', newline='') as f:
+                f.write(text)
+            os.chmod(tmpfile, os.stat(filepath).st_mode & 0o7777)
+    except BaseException:
+        for tmpfile in tmpfiles.values():
+            if os.path.exists(tmpfile): os.remove(tmpfile)
+        raise
+    for filepath, tmpfile in tmpfiles.items():
+        os.replace(tmpfile, filepath)
+
+
+def bump(part, srcdir='.', version=None, dry_run=False, verbose=3):
+    """Increase the version and rewrite it in all files of the project.
+
+    The new version is the next version after the highest of the local version and the latest
+    version tag, so it is always newer than the released version. The version is replaced in the
+    version file of the package, pyproject.toml, setup.cfg, setup.py, CITATION.cff (and its
+    date-released) and the docs conf.py. All files are rewritten atomically.
+
+    Parameters
+    ----------
+    part : str
+        'major', 'minor', 'patch' or 'pre'.
+    srcdir : str, optional
+        Root directory of the package. The default is '.'.
+    version : str, optional
+        Set this version instead of increasing part.
+    dry_run : bool, optional
+        Only show the changes. The default is False.
+    verbose : int, optional
+        Print message. The default is 3.
+
+    Returns
+    -------
+    results : dict
+        previous : Version before the bump.
+        version : New version.
+        files : {file: [(line, old, new)]} of the replaced versions.
+
+    Examples
+    --------
+    >>> from irelease import bump
+    >>> results = bump.bump('patch')
+
+    """
+    from packaging.version import Version
+    from irelease import gitops
+    from irelease.context import RepoContext
+    context = RepoContext.get(srcdir)
+    if context.initfile is None or context.version is None:
+        raise Exception('The version of the package can not be found in %s' %(os.path.abspath(srcdir)))
+
+    with trace.span('bump', part=part) as event:
+        previous = context.version
+        if version is None:
+            released = gitops.tag_version(srcdir, prereleases=True, verbose=verbose)
+            base = max(Version(previous), Version(released)) if released!=gitops.NO_RELEASE else Version(previous)
+            version = next_version(str(base), part)
+        event['version'] = version
+
+        files = {}
+        occurrences, texts = _scan(srcdir, context.initfile)
+        for occurrence in occurrences:
+            new = _short(occurrence['version'], version) if occurrence['file'].endswith('conf.py') else version
+            files.setdefault(occurrence['file'], []).append((occurrence['line'], occurrence['version'], new, occurrence['span']))
+
+        changed = {}
+        for filename, replacements in files.items():
+            text = texts[filename]
+            # Replace from the end, so the spans of the other versions stay valid
+            for _, _, new, (start, stop) in sorted(replacements, key=lambda r: r[3][0], reverse=True):
+                text = text[:start] + new + text[stop:]
+            if filename=='CITATION.cff':
+                text = re.sub(DATE_PATTERN, lambda m: m.group(1) + time.strftime('%Y-%m-%d'), text, flags=re.M)
+            if text!=texts[filename]: changed[os.path.join(srcdir, filename)] = text
+
+        if verbose>=3:
+            for filename, replacements in files.items():
+                for line, old, new, _ in replacements:
+                    if old!=new: print('[irelease] %s%s:%d  %s -> %s' %('(dry-run) ' if dry_run else '', filename, line, old, new))
+        if not dry_run: write_atomic(changed)
+        if verbose>=3 and not dry_run: print('[irelease] Version %s -> %s in %d files.' %(previous, version, len(changed)))
+    return {'previous': previous, 'version': version, 'files': {f: [(line, old, new) for line, old, new, _ in r] for f, r in files.items()}}
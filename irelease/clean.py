@@ -0,0 +1,161 @@
+"""Remove build output, caches and other leftovers from the package directory."""
+# --------------------------------------------------
+# Name        : clean.py
+# Author      : E.Taskesen
+# Contact     : erdogant@gmail.com
+# github      : https://github.com/erdogant/irelease
+# Licence     : MIT
+# --------------------------------------------------
+
+import os
+import time
+import fnmatch
+from concurrent.futures import ThreadPoolExecutor
+import toml
+
+# Paths relative to the package root. Patterns that start with '**/' match at any depth, other patterns
+# match the path from the root. A * does not match a /. Override them with 'clean' or add to them with
+# 'extend-clean' in the [tool.irelease] table of the pyproject.toml.
+DEFAULT_PATTERNS = ['dist', 'build', '*.egg-info', 'src/*.egg-info', '**/__pycache__', '**/*.py[co]', '.pytest_cache', '**/.mypy_cache', '.ruff_cache', '.pylint.d']
+# Directories that are never walked into: version control and virtual environments.
+SKIP_DIRS = ['.git', '.hg', '.svn', '.venv', 'venv', '.tox', '.nox', 'node_modules']
+
+
+# %% Patterns
+def read_patterns(srcdir='.'):
+    """Clean patterns of the package in srcdir.
+
+    Examples
+    --------
+    >>> # pyproject.toml
+    >>> [tool.irelease]
+    >>> extend-clean = ["docs/_build", "**/.ipynb_checkpoints"]
+
+    """
+    patterns = list(DEFAULT_PATTERNS)
+    filepath = os.path.join(srcdir, 'pyproject.toml')
+    if os.path.isfile(filepath):
+        config = toml.load(filepath).get('tool', {}).get('irelease', {})
+        patterns = list(config.get('clean', patterns)) + list(config.get('extend-clean', []))
+    return patterns
+
+
+def _compile(patterns):
+    # (any depth, path segments) per pattern. The segments are matched one by one, so a * does not match a /.
+    return [(pattern.startswith('**/'), pattern[3:].split('/') if pattern.startswith('**/') else pattern.split('/')) for pattern in patterns]
+
+
+def _matches(relpath, patterns):
+    parts = relpath.split('/')
+    for anywhere, segments in patterns:
+        # A pattern at any depth matches the last segments of the path, the others the complete path.
+        tail = parts[-len(segments):] if anywhere else parts
+        if len(tail)==len(segments) and all(fnmatch.fnmatchcase(p, s) for p, s in zip(tail, segments)):
+            return True
+    return False
+
+
+def find_matches(srcdir='.', patterns=None):
+    """Walk srcdir once and return the paths that match the patterns.
+
+    Matching directories are not walked into. Symbolic links are never followed.
+
+    Returns
+    -------
+    paths : list of str
+        Matching files and directories relative to srcdir, sorted.
+
+    """
+    if patterns is None: patterns = read_patterns(srcdir)
+    patterns = _compile(patterns)
+    paths, stack = [], ['']
+    while stack:
+        reldir = stack.pop()
+        with os.scandir(os.path.join(srcdir, reldir) if reldir else srcdir) as entries:
+            for entry in entries:
+                relpath = reldir + '/' + entry.name if reldir else entry.name
+                if _matches(relpath, patterns):
+                    paths.append(relpath)
+                elif entry.is_dir(follow_symlinks=False) and entry.name not in SKIP_DIRS:
+                    stack.append(relpath)
+    return sorted(paths)
+
+
+# %% Remove
+def _remove(path, dry_run=False):
+    # Remove (or only measure) a file or tree bottom-up in one walk. Returns the number of files and bytes.
+    if os.path.islink(path) or not os.path.isdir(path):
+        size = os.lstat(path).st_size
+        if not dry_run: os.unlink(path)
+        return 1, size
+    files, size = 0, 0
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                n, s = _remove(entry.path, dry_run=dry_run)
+                files, size = files + n, size + s
+            else:
+                files, size = files + 1, size + entry.stat(follow_symlinks=False).st_size
+                if not dry_run: os.unlink(entry.path)
+    if not dry_run: os.rmdir(path)
+    return files, size
+
+
+def clean(srcdir='.', patterns=None, dry_run=False, n_jobs=8, verbose=3):
+    """Remove the files and directories that match the clean patterns.
+
+    Parameters
+    ----------
+    srcdir : str, optional
+        Root directory of the package. The default is '.'.
+    patterns : list of str, optional
+        Glob patterns relative to srcdir. The default is read from the pyproject.toml, see :func:`read_patterns`.
+    dry_run : bool, optional
+        Only list what would be removed. The default is False.
+    n_jobs : int, optional
+        Number of paths that are removed concurrently. The default is 8.
+    verbose : int, optional
+        Print message. The default is 3.
+
+    Returns
+    -------
+    results : dict
+        paths : Matching paths relative to srcdir.
+        files : Number of files that are (or would be) removed.
+        bytes : Number of bytes that are (or would be) freed.
+        errors : {path: error} of paths that could not be removed.
+        time : Wall-time in seconds.
+
+    Examples
+    --------
+    >>> from irelease import clean
+    >>> results = clean.clean('.', dry_run=True)
+
+    """
+    start = time.perf_counter()
+    paths = find_matches(srcdir, patterns=patterns)
+    results = {'paths': paths, 'files': 0, 'bytes': 0, 'errors': {}, 'time': 0.0}
+    if len(paths)>0:
+        with ThreadPoolExecutor(max_workers=max(1, min(n_jobs, len(paths)))) as executor:
+            futures = [executor.submit(_remove, os.path.join(srcdir, p), dry_run) for p in paths]
+            for path, future in zip(paths, futures):
+                try:
+                    files, size = future.result()
+                except OSError as e:
+                    results['errors'][path] = str(e)
+                    if verbose>=2: print('[irelease] Warning: [%s] can not be removed: %s' %(path, e))
+                    continue
+                results['files'], results['bytes'] = results['files'] + files, results['bytes'] + size
+                if verbose>=3 and dry_run: print('[irelease] [%s] would be removed (%d files, %s)' %(path, files, _format_bytes(size)))
+                if verbose>=4 and not dry_run: print('[irelease] [%s] is removed from packagedir' %(path))
+    results['time'] = time.perf_counter() - start
+    if verbose>=3:
+        print('[irelease] %s %d files (%s) in %d paths in %.2fs.' %('Would free' if dry_run else 'Freed', results['files'], _format_bytes(results['bytes']), len(paths) - len(results['errors']), results['time']))
+    return results
+
+
+def _format_bytes(size):
+    for unit in ['B', 'kB', 'MB']:
+        if size<1024: return '%.0f %s' %(size, unit) if unit=='B' else '%.1f %s' %(size, unit)
+        size = size / 1024
+    return '%.1f GB' %(size)
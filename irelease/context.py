@@ -0,0 +1,225 @@
+"""Repository context: git config, project metadata and version, parsed once and cached."""
+# --------------------------------------------------
+# Name        : context.py
+# Author      : E.Taskesen
+# Contact     : erdogant@gmail.com
+# github      : https://github.com/erdogant/irelease
+# Licence     : MIT
+# --------------------------------------------------
+
+import os
+import re
+import threading
+from irelease.discover import discover
+
+# Parsed contexts per directory: {path: (stamp, RepoContext)}
+_CACHE = {}
+_LOCK = threading.Lock()
+
+
+# %% Git config
+def find_gitdir(path='.'):
+    """Find the .git directory of the repository that contains path, None if there is none.
+
+    In a linked worktree or a submodule, .git is a file with the path to the git directory.
+    """
+    path = os.path.abspath(path)
+    while True:
+        gitdir = os.path.join(path, '.git')
+        if os.path.isdir(gitdir):
+            return gitdir
+        if os.path.isfile(gitdir):
+            with open(gitdir, 'r') as f:
+                line = f.read().strip()
+            if line.startswith('gitdir:'):
+                return os.path.normpath(os.path.join(path, line[len('gitdir:'):].strip()))
+        parent = os.path.dirname(path)
+        if parent==path:
+            return None
+        path = parent
+
+
+def common_gitdir(gitdir):
+    """Directory with the config, refs and objects that all worktrees of the repository share."""
+    commondir = os.path.join(gitdir, 'commondir')
+    if os.path.isfile(commondir):
+        with open(commondir, 'r') as f:
+            return os.path.normpath(os.path.join(gitdir, f.read().strip()))
+    return gitdir
+
+
+def parse_gitconfig(filepath):
+    """Parse a git config file.
+
+    Returns
+    -------
+    config : dict
+        {section: {key: value}}. Subsections are named like git does: 'remote.origin'.
+
+    """
+    config, section = {}, None
+    with open(filepath, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line=='' or line[0] in '#;':
+                continue
+            match = re.match(r'^\[\s*([^\s\]"]+)(?:\s+"(.*)")?\s*\]$', line)
+            if match:
+                section = match.group(1).lower() + ('.' + match.group(2) if match.group(2) is not None else '')
+                config.setdefault(section, {})
+            elif section is not None:
+                key, _, value = line.partition('=')
+                config[section][key.strip().lower()] = value.strip().strip('"')
+    return config
+
+
+def parse_remote_url(url):
+    """Split a remote url into the host, owner, subgroup path and repository name.
+
+    Both ssh (git@github.com:owner/repo.git, ssh://git@host/owner/repo) and https urls are supported.
+
+    Returns
+    -------
+    remote : dict
+        hostname : e.g. 'github.com'.
+        host : 'github', 'gitlab' or None.
+        owner : Account or top-level group.
+        subgroup : Path between the owner and the repository, '/' when there are no subgroups.
+        repo : Repository name without .git.
+
+    """
+    match = re.match(r'^(?:[a-z+]+://)?(?:[^@/]+@)?([^:/]+)(?::\d+)?[:/](.+?)(?:\.git)?/?$', url.strip())
+    if match is None:
+        return {'hostname': None, 'host': None, 'owner': None, 'subgroup': '', 'repo': None}
+    hostname, parts = match.group(1).lower(), match.group(2).split('/')
+    host = 'github' if 'github' in hostname else ('gitlab' if 'gitlab' in hostname else None)
+    return {'hostname': hostname,
+            'host': host,
+            'owner': parts[0] if len(parts)>1 else None,
+            'subgroup': '/' + ''.join(p + '/' for p in parts[1:-1]),
+            'repo': parts[-1]}
+
+
+# %% Context
+class RepoContext:
+    """Everything irelease needs to know about a repository, read in one pass.
+
+    Use :meth:`RepoContext.get` to share the parsed context: it is parsed again only when
+    one of the files it is based on has been changed.
+
+    Parameters
+    ----------
+    path : str, optional
+        Root directory of the package. The default is '.'.
+
+    Attributes
+    ----------
+    path : str
+        Absolute path of the package root.
+    gitdir : str or None
+        Path to the .git directory.
+    remotes : dict
+        Remote name to url.
+    remote : str or None
+        Name of the remote that is used: origin, or the first remote.
+    url : str or None
+        Url of the remote.
+    branch : str or None
+        Checked out branch.
+    host : str or None
+        'github' or 'gitlab'.
+    hostname : str or None
+        Hostname of the remote, e.g. 'github.com'.
+    owner : str or None
+        Account or top-level group of the remote.
+    subgroup : str
+        Path between owner and repository, '/' when there are no subgroups.
+    repo : str or None
+        Repository name.
+    project_name : str or None
+        Name in pyproject.toml, setup.cfg or setup.py.
+    packagename : str or None
+        Import name of the package.
+    packagedir : str or None
+        Directory of the package, relative to path. E.g. 'src/pca' for a src-layout.
+    initfile : str or None
+        Path to the file with __version__, relative to path.
+    versionfile : str or None
+        Path to the file the version is read from, relative to path: the metadata file with a static version, else the initfile.
+    version : str or None
+        Version of the package.
+
+    See Also
+    --------
+    irelease.discover.discover
+
+    """
+
+    def __init__(self, path='.', cache=True):
+        self.path = os.path.abspath(path)
+        self.gitdir = find_gitdir(self.path)
+        self._read_git()
+        self._read_project(cache=cache)
+
+    def _read_git(self):
+        self.remotes, self.remote, self.url, self.branch = {}, None, None, None
+        configfile = os.path.join(common_gitdir(self.gitdir), 'config') if self.gitdir is not None else None
+        if configfile is not None and os.path.isfile(configfile):
+            config = parse_gitconfig(configfile)
+            self.remotes = {s.split('.', 1)[1]: v['url'] for s, v in config.items() if s.startswith('remote.') and 'url' in v}
+            if len(self.remotes)>0:
+                self.remote = 'origin' if 'origin' in self.remotes else sorted(self.remotes)[0]
+                self.url = self.remotes[self.remote]
+            headfile = os.path.join(self.gitdir, 'HEAD')
+            if os.path.isfile(headfile):
+                with open(headfile, 'r') as f:
+                    head = f.read().strip()
+                if head.startswith('ref: refs/heads/'):
+                    self.branch = head[len('ref: refs/heads/'):]
+
+        remote = parse_remote_url(self.url) if self.url else parse_remote_url('')
+        self.host, self.hostname, self.owner, self.subgroup, self.repo = remote['host'], remote['hostname'], remote['owner'], remote['subgroup'], remote['repo']
+
+    def _read_project(self, cache=True):
+        project = discover(self.path, cache=cache)
+        self.project_name, self.packagename, self.packagedir = project['name'], project['packagename'], project['packagedir']
+        self.initfile, self.versionfile, self.version, self.layout = project['initfile'], project['versionfile'], project['version'], project['layout']
+
+    def _stamp(self):
+        return _stamp(self.path, self.gitdir, self.initfile)
+
+    @classmethod
+    def get(cls, path='.', cache=True):
+        """Get the (cached) context of path. cache='read' does not write the discovery cache, see :func:`irelease.discover.discover`."""
+        path = os.path.abspath(path)
+        with _LOCK:
+            cached = _CACHE.get(path)
+        if cached is not None and cached[0]==cached[1]._stamp():
+            return cached[1]
+        context = cls(path, cache=cache)
+        with _LOCK:
+            _CACHE[path] = (context._stamp(), context)
+        return context
+
+    def __repr__(self):
+        return 'RepoContext(%s, %s/%s%s, package=%s, version=%s)' %(self.path, self.host, self.owner, self.subgroup, self.packagename, self.version)
+
+
+def _stamp(path, gitdir, initfile):
+    # Modification times of all files the context is based on.
+    filepaths = [os.path.join(path, f) for f in ['pyproject.toml', 'setup.cfg', 'setup.py', 'src']] + [path]
+    if gitdir is not None: filepaths += [os.path.join(common_gitdir(gitdir), 'config'), os.path.join(gitdir, 'HEAD')]
+    if initfile is not None: filepaths.append(os.path.join(path, initfile))
+    stamp = []
+    for filepath in filepaths:
+        try:
+            stamp.append(os.stat(filepath).st_mtime_ns)
+        except OSError:
+            stamp.append(None)
+    return tuple(stamp)
+
+
+def clear_cache():
+    """Remove all cached contexts."""
+    with _LOCK:
+        _CACHE.clear()
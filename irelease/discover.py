@@ -0,0 +1,357 @@
+"""Discover the package of a repository from its metadata, without importing or executing anything."""
+# --------------------------------------------------
+# Name        : discover.py
+# Author      : E.Taskesen
+# Contact     : erdogant@gmail.com
+# github      : https://github.com/erdogant/irelease
+# Licence     : MIT
+# --------------------------------------------------
+
+import os
+import re
+import ast
+import json
+import toml
+
+# Directories that are never the package.
+EXCLUDE_DIR = ['build', 'dist', 'doc', 'docs', 'depricated', 'test', 'tests', 'example', 'examples', 'benchmarks', 'scripts', 'tools', 'venv', 'env', 'site-packages', 'node_modules']
+# Files the discovery is based on. The discovery is cached until one of these, or the directories that are scanned, change.
+METADATA_FILES = ['pyproject.toml', 'setup.cfg', 'setup.py']
+# Version in a .py file, or the complete content of a plain version file.
+VERSION_PATTERN = re.compile(r"^__version__ = ['\"]([^'\"]*)['\"]", re.M)
+PLAIN_VERSION_PATTERN = re.compile(r'^\s*(\S+)\s*$')
+CACHE_FILE = 'discovery.json'
+# Increase when the result of the discovery changes, so that old caches are not used.
+CACHE_VERSION = 2
+
+
+# %% Metadata readers
+def read_pyproject(filepath):
+    """Name, packages, package directories and version source from the [project] and [tool.setuptools] tables."""
+    with open(filepath, 'r') as f:
+        data = toml.load(f)
+    project, tool = data.get('project', {}), data.get('tool', {})
+    setuptools = tool.get('setuptools', {})
+    metadata = {'name': project.get('name'), 'version': project.get('version'), 'package_dir': setuptools.get('package-dir', {}), 'packages': None, 'py_modules': setuptools.get('py-modules'), 'where': None, 'namespaces': False}
+    packages = setuptools.get('packages')
+    if isinstance(packages, list):
+        metadata['packages'] = packages
+    elif isinstance(packages, dict) and 'find' in packages:
+        metadata['where'] = (packages['find'].get('where') or [None])[0]
+        metadata['namespaces'] = packages['find'].get('namespaces', True)
+
+    dynamic = setuptools.get('dynamic', {}).get('version', {})
+    if 'attr' in dynamic: metadata['version_attr'] = dynamic['attr']
+    if 'file' in dynamic: metadata['version_file'] = dynamic['file'] if isinstance(dynamic['file'], str) else dynamic['file'][0]
+    # hatch and pdm point to the version file directly
+    path = tool.get('hatch', {}).get('version', {}).get('path') or tool.get('pdm', {}).get('version', {}).get('path')
+    if path: metadata['version_file'] = path
+    return metadata
+
+
+def read_setupcfg(filepath):
+    """Name, packages, package directories and version source from the [metadata] and [options] sections."""
+    import configparser
+    config = configparser.ConfigParser(interpolation=None)
+    config.read(filepath)
+    get = lambda section, key: config.get(section, key, fallback=None)  # noqa: E731
+    metadata = {'name': get('metadata', 'name'), 'version': None, 'package_dir': _parse_mapping(get('options', 'package_dir')), 'packages': None, 'py_modules': _parse_list(get('options', 'py_modules')) or None, 'where': get('options.packages.find', 'where'), 'namespaces': False}
+    packages = (get('options', 'packages') or '').strip()
+    if packages.startswith('find'):
+        metadata['namespaces'] = packages.startswith('find_namespace')
+    elif packages!='':
+        metadata['packages'] = _parse_list(packages)
+
+    version = (get('metadata', 'version') or '').strip()
+    if version.startswith('attr:'):
+        metadata['version_attr'] = version[5:].strip()
+    elif version.startswith('file:'):
+        metadata['version_file'] = version[5:].strip()
+    elif version!='':
+        metadata['version'] = version
+    return metadata
+
+
+def read_setuppy(filepath):
+    """Arguments of the setup() call in setup.py, read with a static parse: setup.py is never executed.
+
+    String constants that are assigned at module level are resolved, e.g. ``NAME = 'pca'`` and ``setup(name=NAME)``.
+    Arguments that can only be known by running setup.py are None.
+    """
+    with open(filepath, 'rb') as f:
+        tree = ast.parse(f.read(), filename=filepath)
+
+    constants, call = {}, None
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Assign) and len(node.targets)==1 and isinstance(node.targets[0], ast.Name):
+            value = _literal(node.value, constants)
+            if value is not None: constants[node.targets[0].id] = value
+        elif isinstance(node, ast.Call) and _call_name(node.func)=='setup':
+            call = node
+
+    metadata = {'name': None, 'version': None, 'package_dir': {}, 'packages': None, 'py_modules': None, 'where': None, 'namespaces': False}
+    if call is None: return metadata
+    keywords = {k.arg: k.value for k in call.keywords if k.arg is not None}
+    for key in ['name', 'version', 'package_dir', 'py_modules']:
+        if key in keywords:
+            value = _literal(keywords[key], constants)
+            if value is not None: metadata[key] = value
+
+    packages = keywords.get('packages')
+    if isinstance(packages, ast.Call) and _call_name(packages.func) in ('find_packages', 'find_namespace_packages'):
+        # find_packages('src') or find_packages(where='src')
+        where = packages.args[0] if len(packages.args)>0 else {k.arg: k.value for k in packages.keywords}.get('where')
+        metadata['where'] = _literal(where, constants) if where is not None else None
+        metadata['namespaces'] = _call_name(packages.func)=='find_namespace_packages'
+    elif packages is not None:
+        metadata['packages'] = _literal(packages, constants)
+    return metadata
+
+
+def _call_name(func):
+    return func.id if isinstance(func, ast.Name) else (func.attr if isinstance(func, ast.Attribute) else None)
+
+
+def _literal(node, constants):
+    # Value of a literal or a module-level constant, None when it can not be known without running the code.
+    if isinstance(node, ast.Name):
+        return constants.get(node.id)
+    try:
+        return ast.literal_eval(node)
+    except ValueError:
+        return None
+
+
+def _parse_list(value):
+    return [v.strip() for v in re.split(r'[,\n]', value or '') if v.strip()!='']
+
+
+def _parse_mapping(value):
+    # package_dir in setup.cfg: "=src" or "pkg = lib/pkg" on separate lines
+    mapping = {}
+    for line in _parse_list(value):
+        key, _, path = line.partition('=')
+        mapping[key.strip()] = path.strip()
+    return mapping
+
+
+# %% Locate the package
+def _package_path(srcdir, package, package_dir):
+    # Directory of a dotted package name, following package_dir like setuptools does.
+    parts = package.split('.')
+    for n in range(len(parts), 0, -1):
+        if '.'.join(parts[:n]) in package_dir:
+            return os.path.join(package_dir['.'.join(parts[:n])], *parts[n:])
+    return os.path.join(package_dir.get('', ''), *parts)
+
+
+def _find_packages(srcdir, where, namespaces, depth=3):
+    # Top-level packages in srcdir/where. Directories without an __init__.py are namespace packages and are searched for
+    # the packages inside them.
+    packages, stack = [], [('', 0)]
+    while stack:
+        prefix, level = stack.pop()
+        dirpath = os.path.join(srcdir, where or '', *prefix.split('.')) if prefix else os.path.join(srcdir, where or '')
+        try:
+            entries = sorted(os.scandir(dirpath), key=lambda e: e.name)
+        except OSError:
+            continue
+        for entry in entries:
+            if not entry.is_dir() or entry.name[0] in ('.', '_') or not entry.name.isidentifier() or (level==0 and entry.name.lower() in EXCLUDE_DIR):
+                continue
+            name = prefix + '.' + entry.name if prefix else entry.name
+            if os.path.isfile(os.path.join(entry.path, '__init__.py')):
+                packages.append(name)
+            elif (namespaces or level>0 or where) and level<depth:
+                stack.append((name, level + 1))
+    return packages
+
+
+def normalize_name(name):
+    """Normalized project name as in the filenames of wheels: 'scikit-learn' -> 'scikit_learn'."""
+    return re.sub(r'[-_.]+', '_', name).lower()
+
+
+def _choose(packages, name):
+    # The package with the name of the project, else the first one.
+    if len(packages)==0: return None
+    if name is not None:
+        for package in packages:
+            if normalize_name(package)==normalize_name(name) or normalize_name(package.rsplit('.', 1)[-1])==normalize_name(name):
+                return package
+    return packages[0]
+
+
+def _attr_file(srcdir, attr, package_dir):
+    # File of 'pkg.module.__version__': pkg/module.py or pkg/module/__init__.py.
+    module = attr.rsplit('.', 1)[0]
+    path = _package_path(srcdir, module, package_dir)
+    for filepath in [os.path.join(path, '__init__.py'), path + '.py']:
+        if os.path.isfile(os.path.join(srcdir, filepath)):
+            return filepath
+    return None
+
+
+def read_version(filepath):
+    """Match of the version in filepath: ``__version__ = '1.0.0'`` in a .py file or the content of a plain version file."""
+    with open(filepath, 'rt') as f:
+        text = f.read()
+    return VERSION_PATTERN.search(text) if filepath.endswith('.py') else PLAIN_VERSION_PATTERN.match(text)
+
+
+def _discover(srcdir):
+    metadata = {'name': None, 'version': None, 'package_dir': {}, 'packages': None, 'py_modules': None, 'where': None, 'namespaces': False}
+    source, version_source = None, None
+    # setup.py overrides setup.cfg overrides pyproject.toml, like setuptools does.
+    for filename, reader in [('pyproject.toml', read_pyproject), ('setup.cfg', read_setupcfg), ('setup.py', read_setuppy)]:
+        filepath = os.path.join(srcdir, filename)
+        if not os.path.isfile(filepath): continue
+        try:
+            found = reader(filepath)
+        except Exception:
+            continue
+        for key, value in found.items():
+            if value not in (None, {}, False, ''): metadata[key] = value
+        if found.get('name'): source = filename
+        if found.get('version'): version_source = filename
+
+    package_dir = {k: v.strip('/') for k, v in (metadata['package_dir'] or {}).items()}
+    where = metadata['where'] or package_dir.get('')
+    if where is None and metadata['packages'] is None and os.path.isdir(os.path.join(srcdir, 'src')):
+        # setuptools auto-discovery: the src-layout wins over the flat layout.
+        where = 'src'
+    if where and '' not in package_dir: package_dir[''] = where
+
+    result = {'name': metadata['name'], 'packagename': None, 'packagedir': None, 'initfile': None, 'versionfile': None, 'version': None,
+              'layout': 'src' if package_dir.get('') else 'flat', 'source': source}
+    if metadata['packages']:
+        # The top-level packages: packages that are not inside another listed package
+        packages = [p for p in metadata['packages'] if not any(p.startswith(q + '.') for q in metadata['packages'])]
+    else:
+        packages = _find_packages(srcdir, package_dir.get(''), metadata['namespaces'])
+    result['packagename'] = _choose(packages, metadata['name'])
+
+    if result['packagename'] is not None:
+        result['packagedir'] = _package_path(srcdir, result['packagename'], package_dir).replace(os.sep, '/')
+        result['initfile'] = os.path.join(result['packagedir'], '__init__.py').replace(os.sep, '/')
+    elif metadata['py_modules']:
+        module = _choose(list(metadata['py_modules']), metadata['name'])
+        result['packagename'], result['layout'] = module, 'module'
+        result['initfile'] = (_package_path(srcdir, module, package_dir) + '.py').replace(os.sep, '/')
+
+    # The version file of tool.setuptools.dynamic, attr: or file: in setup.cfg and hatch/pdm.
+    if metadata.get('version_attr'):
+        filepath = _attr_file(srcdir, metadata['version_attr'], package_dir)
+        if filepath is not None: result['initfile'] = filepath.replace(os.sep, '/')
+    elif metadata.get('version_file'):
+        result['initfile'] = metadata['version_file']
+    if result['name'] is None: result['name'] = result['packagename']
+    if metadata['version'] is not None and not metadata.get('version_attr') and not metadata.get('version_file'):
+        # Static version in the metadata
+        result['version'], result['versionfile'] = str(metadata['version']), version_source
+    else:
+        result['versionfile'] = result['initfile']
+    return result
+
+
+# %% Cache
+def _stamp(srcdir, result):
+    # Modification times of the metadata files and of the directories that are scanned for packages.
+    filepaths = [os.path.join(srcdir, f) for f in METADATA_FILES] + [srcdir, os.path.join(srcdir, 'src')]
+    if result.get('initfile'): filepaths.append(os.path.join(srcdir, result['initfile']))
+    stamp = []
+    for filepath in filepaths:
+        try:
+            stamp.append(os.stat(filepath).st_mtime_ns)
+        except OSError:
+            stamp.append(None)
+    return [CACHE_VERSION] + stamp
+
+
+def _cachefile(srcdir):
+    # One cache per repository, in the .git directory so it is never committed and survives the clean step.
+    from irelease.context import find_gitdir
+    gitdir = find_gitdir(srcdir)
+    if gitdir is None: return None
+    return os.path.join(gitdir, 'irelease', CACHE_FILE)
+
+
+def _read_cache(cachefile, srcdir):
+    try:
+        with open(cachefile, 'r') as f:
+            return json.load(f).get(srcdir)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_cache(cachefile, srcdir, entry):
+    try:
+        with open(cachefile, 'r') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        data = {}
+    data[srcdir] = entry
+    try:
+        os.makedirs(os.path.dirname(cachefile), exist_ok=True)
+        tmpfile = '%s.%d.tmp' %(cachefile, os.getpid())
+        with open(tmpfile, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmpfile, cachefile)
+    except OSError:
+        pass
+
+
+# %% Discover
+def discover(path='.', cache=True):
+    """Discover the package in path from pyproject.toml, setup.cfg and setup.py.
+
+    The [project] and [tool.setuptools] tables of the pyproject.toml, the [metadata] and [options]
+    sections of the setup.cfg and the arguments of setup() in the setup.py are read. The setup.py is
+    parsed, never executed. Flat and src-layouts, package_dir, namespace packages and single modules
+    are found the way setuptools finds them. The version is read from the file of the version attr
+    (tool.setuptools.dynamic, attr: in setup.cfg), the version file, or the __init__.py of the package.
+
+    Parameters
+    ----------
+    path : str, optional
+        Root directory of the package. The default is '.'.
+    cache : bool or str, optional
+        Use the cache in .git/irelease/discovery.json. The cache is used until the metadata files,
+        the version file or the directories change. 'read' uses the cache without writing it. The default is True.
+
+    Returns
+    -------
+    result : dict
+        name : Project name.
+        packagename : Import name of the package, dotted for namespace packages.
+        packagedir : Directory of the package relative to path, None for a single module.
+        initfile : File with __version__ relative to path: the file of the version attr, the version file or the __init__.py of the package.
+        versionfile : File the version is read from: the metadata file with the static version, else the initfile.
+        version : Static version in the metadata, or the version in the initfile.
+        layout : 'flat', 'src' or 'module'.
+        source : Metadata file with the name of the project, None when the package directory is guessed.
+
+    Examples
+    --------
+    >>> from irelease import discover
+    >>> result = discover.discover('.')
+
+    """
+    srcdir = os.path.abspath(path)
+    cachefile = _cachefile(srcdir) if cache else None
+    result = None
+    if cachefile is not None:
+        entry = _read_cache(cachefile, srcdir)
+        if entry is not None and entry['stamp']==_stamp(srcdir, entry['result']):
+            result = entry['result']
+    if result is None:
+        result = _discover(srcdir)
+        if cachefile is not None and cache!='read': _write_cache(cachefile, srcdir, {'stamp': _stamp(srcdir, result), 'result': result})
+
+    result = dict(result)
+    filepath = os.path.join(srcdir, result['initfile']) if result['initfile'] else None
+    if result['version'] is None and filepath is not None and os.path.isfile(filepath):
+        # The version changes every release, so it is read from the file and never cached.
+        match = read_version(filepath)
+        if match: result['version'] = match.group(1)
+    return result
@@ -19,3 +19,10 @@ import irelease
 irelease.run('erdogant', 'pca', clean=False, install=False, twine=None, verbose=3)
 
 
+
+# %% Benchmark discovery and clean on synthetic repositories
+from irelease import benchmark
+results = benchmark.run_suite(sizes=['small', 'medium'])
+
+# %% Also the full release pipeline, from a checkout of the source repository
+results = benchmark.run_suite(sizes=['small'], pipeline=True)
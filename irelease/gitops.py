@@ -0,0 +1,341 @@
+"""Git operations: tags and versions read straight from the repository."""
+# --------------------------------------------------
+# Name        : gitops.py
+# Author      : E.Taskesen
+# Contact     : erdogant@gmail.com
+# github      : https://github.com/erdogant/irelease
+# Licence     : MIT
+# --------------------------------------------------
+
+import os
+import time
+import shutil
+import tempfile
+import contextlib
+import subprocess
+from irelease import trace
+from irelease import runner
+from irelease.context import find_gitdir, common_gitdir
+
+NO_RELEASE = '0.0.0'
+# Name of the temporary worktrees of worktree(), git names the per-worktree git directory after it.
+WORKTREE_PREFIX = 'irelease-worktree-'
+WORKTREE_RESUME = 'Resume can not be used with a worktree: the worktree and its dist/ are removed after the release. Run again without resume.'
+
+
+# %% Tags
+def list_tags(path='.', method='refs'):
+    """List the tags of the repository that contains path.
+
+    Parameters
+    ----------
+    path : str, optional
+        Directory in the repository. The default is '.'.
+    method : str, optional
+        'refs' : Read .git/packed-refs and .git/refs/tags without starting git.
+        'git'  : One call to git for-each-ref.
+        The default is 'refs'.
+
+    Returns
+    -------
+    tags : list of str
+        Tag names.
+
+    """
+    if method=='git':
+        output = subprocess.run(['git', 'for-each-ref', '--format=%(refname:short)', 'refs/tags'], cwd=path, capture_output=True, text=True, check=True).stdout
+        return [t for t in output.splitlines() if t!='']
+
+    gitdir = find_gitdir(path)
+    if gitdir is None: return []
+    # Linked worktrees share the tags of the main repository
+    gitdir = common_gitdir(gitdir)
+    tags = set()
+    packed_refs = os.path.join(gitdir, 'packed-refs')
+    if os.path.isfile(packed_refs):
+        with open(packed_refs, 'r') as f:
+            for line in f:
+                # Lines are '<sha> <ref>'; '^<sha>' lines hold the peeled commit of the annotated tag above.
+                parts = line.split()
+                if len(parts)==2 and parts[1].startswith('refs/tags/'):
+                    tags.add(parts[1][len('refs/tags/'):])
+    tagsdir = os.path.join(gitdir, 'refs', 'tags')
+    for root, _, files in os.walk(tagsdir):
+        for f in files:
+            tags.add(os.path.relpath(os.path.join(root, f), tagsdir).replace(os.sep, '/'))
+    return sorted(tags)
+
+
+def latest_version(tags, prereleases=False, prefix=''):
+    """Highest version in the tags, sorted with packaging.version.
+
+    Parameters
+    ----------
+    tags : list of str
+        Tag names. Tags that are not a version are ignored; a leading 'v' is allowed.
+    prereleases : bool, optional
+        Include pre-releases and development releases. The default is False.
+    prefix : str, optional
+        Only use tags that start with prefix, e.g. 'mypackage-' in a monorepo. The default is ''.
+
+    Returns
+    -------
+    str
+        The tag name of the highest version, '0.0.0' when there is none.
+
+    """
+    from packaging.version import Version, InvalidVersion
+    versions = []
+    for tag in tags:
+        if not tag.startswith(prefix): continue
+        try:
+            parsed = Version(tag[len(prefix):])
+        except InvalidVersion:
+            continue
+        if parsed.is_prerelease and not prereleases: continue
+        versions.append((parsed, tag))
+    if len(versions)==0:
+        return NO_RELEASE
+    return max(versions)[1][len(prefix):]
+
+
+def tag_version(path='.', method='refs', prereleases=False, prefix='', verbose=3):
+    """Latest released version from the git tags, without network access.
+
+    Returns
+    -------
+    str
+        Latest version, '0.0.0' when there are no version tags.
+
+    """
+    version = latest_version(list_tags(path, method=method), prereleases=prereleases, prefix=prefix)
+    if verbose>=4: print('[irelease] Latest version from git tags: %s' %(version))
+    return version
+
+
+def previous_tag(tag, path='.', method='refs'):
+    """Highest version tag below tag, None when there is none."""
+    from packaging.version import Version, InvalidVersion
+    older = []
+    for t in list_tags(path, method=method):
+        try:
+            if Version(t)<Version(tag): older.append(t)
+        except InvalidVersion:
+            continue
+    previous = latest_version(older, prereleases=True)
+    return None if previous==NO_RELEASE else previous
+
+
+# %% Git backend
+class GitError(Exception):
+    """A git command failed."""
+
+
+class Git:
+    """Run git commands in a repository, check their exit codes and time them.
+
+    The checks around the commands are batched: the branch is read from .git/HEAD without starting git,
+    the existing tag and HEAD are resolved by one git cat-file, and git diff only runs when git commit
+    fails. A release commits, tags and pushes with 5 git processes instead of 7.
+
+    Pull, commit, tag and push are run by :func:`irelease.runner.run`: their output is written to the log of
+    the step (git_pull, git_commit, git_tag or git_push) and git is killed after the timeout of the step.
+    Git can not prompt for credentials, so a missing credential fails the command instead of blocking it.
+
+    Parameters
+    ----------
+    path : str, optional
+        Directory in the repository. The default is '.'.
+    remote : str, optional
+        Remote to pull from and push to. The default is 'origin'.
+    package : str, optional
+        Name of the package, for the prefix of the output and the log directory of the steps.
+    verbose : int, optional
+        Print message. The default is 3.
+
+    Attributes
+    ----------
+    timings : list of tuple
+        (command, seconds) of every git command that was run.
+
+    Examples
+    --------
+    >>> repo = Git('.')
+    >>> repo.commit_all('1.0.0')
+    >>> repo.tag('1.0.0')
+    >>> repo.push(tags=['1.0.0'])
+
+    """
+
+    def __init__(self, path='.', remote='origin', package=None, verbose=3):
+        self.path = path
+        self.remote = remote
+        self.package = package
+        self.verbose = verbose
+        self.timings = []
+
+    def run(self, *args, check=True, step=None):
+        """Run git with args and return the completed process. Raises GitError when check and git fails.
+
+        With step, the output is streamed into the log of step and git is killed after the timeout of step,
+        see :func:`irelease.runner.run`. Stdout and stderr of the process are both the tail of the output then.
+        A timeout raises GitError, also without check.
+        """
+        start = time.perf_counter()
+        if step is not None:
+            process = self._run_step(args, step)
+        else:
+            with trace.span('git ' + args[0], command=' '.join(args)) as event:
+                process = subprocess.run(['git'] + list(args), cwd=self.path, capture_output=True, text=True)
+                event['returncode'] = process.returncode
+        elapsed = time.perf_counter() - start
+        self.timings.append((' '.join(args), elapsed))
+        if self.verbose>=4: print('[irelease] git %s (%.2fs)' %(' '.join(args), elapsed))
+        if check and process.returncode!=0:
+            raise GitError('git %s failed with exit code %d: %s' %(' '.join(args), process.returncode, (process.stderr or process.stdout).strip()))
+        return process
+
+    def _run_step(self, args, step):
+        # No terminal prompts: git fails at once when it needs credentials that are not configured.
+        env = dict(os.environ, GIT_TERMINAL_PROMPT='0')
+        timeout = runner.step_timeout(step, self.path)
+        with runner.StepLog(step, package=self.package, logdir=runner.log_dir(self.package, self.path), verbose=self.verbose) as log:
+            results = runner.run(['git'] + list(args), step, package=self.package, cwd=self.path, env=env, timeout=timeout, log=log, check=False, verbose=self.verbose)
+        if results['timed_out']:
+            raise GitError('git %s timed out after %ss (log: %s)' %(' '.join(args), timeout, results['logfile']))
+        output = '\n'.join(results['tail'])
+        return subprocess.CompletedProcess(['git'] + list(args), results['returncode'], stdout=output, stderr=output)
+
+    def branch(self):
+        """Name of the checked out branch, 'HEAD' when HEAD is detached."""
+        gitdir = find_gitdir(self.path)
+        if gitdir is not None and os.path.isfile(os.path.join(gitdir, 'HEAD')):
+            with open(os.path.join(gitdir, 'HEAD'), 'r') as f:
+                head = f.read().strip()
+            return head[len('ref: refs/heads/'):] if head.startswith('ref: refs/heads/') else 'HEAD'
+        return self.run('rev-parse', '--abbrev-ref', 'HEAD').stdout.strip()
+
+    def resolve(self, *revisions):
+        """Object names of the revisions in one call to git cat-file, None for a revision that does not exist."""
+        start = time.perf_counter()
+        with trace.span('git cat-file', command='cat-file --batch-check ' + ' '.join(revisions)):
+            process = subprocess.run(['git', 'cat-file', '--batch-check=%(objectname)'], cwd=self.path, input='\n'.join(revisions) + '\n', capture_output=True, text=True)
+        self.timings.append(('cat-file --batch-check ' + ' '.join(revisions), time.perf_counter() - start))
+        if process.returncode!=0:
+            raise GitError('git cat-file failed with exit code %d: %s' %(process.returncode, process.stderr.strip()))
+        # A missing revision is printed as '<revision> missing'
+        return [None if line.endswith(' missing') else line for line in process.stdout.splitlines()]
+
+    def is_detached(self):
+        """True when HEAD is detached, as in the worktree of :func:`worktree`."""
+        return self.branch()=='HEAD'
+
+    def pull(self):
+        """Pull the checked out branch."""
+        if self.verbose>=3: print('[irelease] git pull')
+        return self.run('pull', step='git_pull')
+
+    def commit_all(self, message, pathspec='.'):
+        """Stage pathspec and commit. Nothing is committed when there are no changes.
+
+        Returns
+        -------
+        bool
+            True when a commit was made.
+
+        """
+        self.run('add', pathspec, step='git_commit')
+        process = self.run('commit', '-m', message, check=False, step='git_commit')
+        if process.returncode==0: return True
+        # Exit code 0 means that nothing is staged, anything else is a failing commit (e.g. a hook).
+        if self.run('diff', '--cached', '--quiet', check=False).returncode==0:
+            if self.verbose>=3: print('[irelease] Nothing to commit.')
+            return False
+        raise GitError('git commit failed with exit code %d: %s' %(process.returncode, (process.stderr or process.stdout).strip()))
+
+    def tag(self, name, message=None):
+        """Create an annotated tag on HEAD. An existing tag is accepted when it already points to HEAD."""
+        head, existing = self.resolve('HEAD', 'refs/tags/%s^{commit}' %(name))
+        if existing is not None:
+            if existing==head:
+                return
+            raise GitError('Tag %s already exists on another commit.' %(name))
+        self.run('tag', '-a', name, '-m', message or name, step='git_tag')
+
+    def push(self, tags=None, branch=None):
+        """Push the branch and only the given tags in one atomic push.
+
+        Parameters
+        ----------
+        tags : list of str, optional
+            Tags to push.
+        branch : str, optional
+            Branch to push. The default is the checked out branch, no branch is pushed when HEAD is detached.
+
+        """
+        branch = branch or self.branch()
+        refspecs = ([] if branch=='HEAD' else ['refs/heads/%s' %(branch)]) + ['refs/tags/%s' %(t) for t in (tags or [])]
+        if self.verbose>=3: print('[irelease] git push %s %s' %(self.remote, ' '.join(refspecs)))
+        process = self.run('push', '--atomic', self.remote, *refspecs, check=False, step='git_push')
+        if process.returncode!=0 and 'atomic' in process.stderr:
+            # The server does not support atomic pushes
+            process = self.run('push', self.remote, *refspecs, check=False, step='git_push')
+        if process.returncode!=0:
+            raise GitError('git push failed: %s' %(process.stderr.strip()))
+        return process
+
+
+# %% Worktrees
+@contextlib.contextmanager
+def worktree(path='.', ref='HEAD', verbose=3):
+    """Check out ref in a temporary worktree of the repository and remove it afterwards.
+
+    The worktree shares the objects, tags and config of the repository, so nothing is cloned. Its HEAD
+    is detached. Clean, build and tag in the worktree do not touch the working copy of path, and
+    several worktrees of one repository can be used at the same time.
+
+    Parameters
+    ----------
+    path : str, optional
+        Directory in the repository. The default is '.'.
+    ref : str, optional
+        Commit, branch or tag to check out. The default is 'HEAD'.
+    verbose : int, optional
+        Print message. The default is 3.
+
+    Yields
+    ------
+    str
+        The directory of path in the worktree.
+
+    Examples
+    --------
+    >>> with worktree('.') as workdir:
+    >>>     print(os.listdir(workdir))
+
+    See Also
+    --------
+    is_temporary_worktree
+
+    """
+    repo = Git(path, verbose=verbose)
+    # Package directories in a subdirectory of the repository (monorepos)
+    prefix = repo.run('rev-parse', '--show-prefix').stdout.strip()
+    if verbose>=2 and repo.run('status', '--porcelain', '--untracked-files=no', check=False).stdout.strip()!='':
+        print('[irelease] Warning: uncommitted changes are not released from the worktree.')
+    workdir = tempfile.mkdtemp(prefix=WORKTREE_PREFIX)
+    with trace.span('git worktree', ref=ref):
+        repo.run('worktree', 'add', '--detach', '--force', workdir, ref)
+    if verbose>=3: print('[irelease] Worktree of %s: %s' %(ref, workdir))
+    try:
+        yield os.path.join(workdir, prefix)
+    finally:
+        repo.run('worktree', 'remove', '--force', workdir, check=False)
+        shutil.rmtree(workdir, ignore_errors=True)
+        repo.run('worktree', 'prune', check=False)
+
+
+def is_temporary_worktree(path='.'):
+    """True when path is in a temporary worktree of :func:`worktree`, which is removed with its dist/ afterwards."""
+    gitdir = find_gitdir(path)
+    return gitdir is not None and gitdir!=common_gitdir(gitdir) and os.path.basename(gitdir).startswith(WORKTREE_PREFIX)
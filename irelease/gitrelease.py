@@ -0,0 +1,248 @@
+"""Create the release on GitHub or GitLab through their APIs and attach the distribution archives."""
+# --------------------------------------------------
+# Name        : gitrelease.py
+# Author      : E.Taskesen
+# Contact     : erdogant@gmail.com
+# github      : https://github.com/erdogant/irelease
+# Licence     : MIT
+# --------------------------------------------------
+
+import os
+import re
+import time
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
+from irelease import trace
+from irelease.httpclient import HTTPClient
+from irelease.lookup import GITHUB_API
+
+# Commits of irelease itself have the version as message and are left out of the release notes.
+VERSION_COMMIT = re.compile(r'^v?\d+(\.\d+)*\S*$')
+
+
+# %% Release notes
+def release_notes(tag, previous=None, path='.'):
+    """Release notes with the commits since the previous version tag.
+
+    Parameters
+    ----------
+    tag : str
+        Tag of the release.
+    previous : str, optional
+        Tag of the previous release. The default is the highest version tag below tag.
+    path : str, optional
+        Directory in the repository. The default is '.'.
+
+    Returns
+    -------
+    str
+        Markdown list of the commit messages, newest first.
+
+    """
+    from irelease.gitops import Git, previous_tag
+    if previous is None: previous = previous_tag(tag, path)
+    revisions = '%s..%s' %(previous, tag) if previous else tag
+    process = Git(path, verbose=0).run('log', '--no-merges', '--pretty=format:%s (%h)', revisions, check=False)
+    commits = [line for line in process.stdout.splitlines() if line.strip()!='' and not VERSION_COMMIT.match(line.rsplit(' (', 1)[0])]
+    if len(commits)==0: commits = ['No changes.']
+    title = '## Changes since %s' %(previous) if previous else '## Changes'
+    return '\n'.join([title, ''] + ['- ' + c for c in commits])
+
+
+# %% GitHub
+class GitHubReleases:
+    """Create releases and upload assets with the GitHub REST API.
+
+    Parameters
+    ----------
+    api_url : str, optional
+        GitHub API url. The default is https://api.github.com or GITHUB_API_URL.
+    token : str, optional
+        Token with write access to the repository. The default is read from GITHUB_TOKEN.
+
+    """
+
+    def __init__(self, api_url=GITHUB_API, token=None):
+        self.api_url = api_url.rstrip('/')
+        self.token = token or os.environ.get('GITHUB_TOKEN')
+        headers = {'Accept': 'application/vnd.github+json', 'User-Agent': 'irelease'}
+        if self.token: headers['Authorization'] = 'Bearer ' + self.token
+        self.http = HTTPClient(timeout=60, headers=headers)
+
+    def create(self, owner, subgroup, repo, tag, name, notes, prerelease=False):
+        """Create the release of tag, or return the release when it already exists."""
+        url = '%s/repos/%s/%s/releases' %(self.api_url, owner, repo)
+        response = self.http.request('POST', url, body={'tag_name': tag, 'name': name, 'body': notes, 'prerelease': prerelease})
+        status = 'created'
+        if response.status==422 and 'already_exists' in response.text():
+            response, status = self.http.request('GET', '%s/tags/%s' %(url, quote(tag, safe=''))), 'exists'
+        if not response.ok:
+            raise Exception('Github release %s of %s/%s: HTTP %d %s' %(tag, owner, repo, response.status, response.text()[:200]))
+        data = response.json()
+        return {'status': status, 'url': data.get('html_url'), 'upload_url': data['upload_url'].split('{')[0], 'assets': [a['name'] for a in data.get('assets', [])]}
+
+    def upload(self, release, filepath):
+        """Attach one file to the release."""
+        with open(filepath, 'rb') as f:
+            content = f.read()
+        response = self.http.request('POST', release['upload_url'], body=content, params={'name': os.path.basename(filepath)}, headers={'Content-Type': 'application/octet-stream'})
+        if response.status==422 and 'already_exists' in response.text():
+            return 'skipped'
+        if not response.ok:
+            raise Exception('HTTP %d %s' %(response.status, response.text()[:200]))
+        return 'uploaded'
+
+
+# %% GitLab
+class GitLabReleases:
+    """Create releases and attach files with the GitLab REST API (v4).
+
+    Files are uploaded to the project and linked as release assets.
+
+    Parameters
+    ----------
+    api_url : str
+        GitLab API url, e.g. https://gitlab.com/api/v4.
+    token : str, optional
+        Personal or project access token with api scope. The default is read from GITLAB_TOKEN.
+
+    """
+
+    def __init__(self, api_url, token=None):
+        self.api_url = api_url.rstrip('/')
+        self.token = token or os.environ.get('GITLAB_TOKEN')
+        headers = {'User-Agent': 'irelease'}
+        if self.token: headers['PRIVATE-TOKEN'] = self.token
+        self.http = HTTPClient(timeout=60, headers=headers)
+
+    def create(self, owner, subgroup, repo, tag, name, notes, prerelease=False):
+        """Create the release of tag, or return the release when it already exists."""
+        path = owner + subgroup + repo
+        url = '%s/projects/%s/releases' %(self.api_url, quote(path, safe=''))
+        response = self.http.request('POST', url, body={'tag_name': tag, 'name': name, 'description': notes})
+        status = 'created'
+        if response.status==409:
+            response, status = self.http.request('GET', '%s/%s' %(url, quote(tag, safe=''))), 'exists'
+        if not response.ok:
+            raise Exception('Gitlab release %s of %s: HTTP %d %s' %(tag, path, response.status, response.text()[:200]))
+        data = response.json()
+        # Uploads are linked relative to the web page of the project
+        web_url = self.api_url.rsplit('/api/', 1)[0] + '/' + path
+        return {'status': status, 'url': data.get('_links', {}).get('self'), 'project_url': url.rsplit('/releases', 1)[0], 'web_url': web_url, 'tag': tag,
+                'assets': [a['name'] for a in data.get('assets', {}).get('links', [])]}
+
+    def upload(self, release, filepath):
+        """Upload one file to the project and link it to the release."""
+        from irelease.upload import _multipart
+        filename = os.path.basename(filepath)
+        with open(filepath, 'rb') as f:
+            body, content_type = _multipart([], filename, f.read(), name='file')
+        response = self.http.request('POST', release['project_url'] + '/uploads', body=body, headers={'Content-Type': content_type})
+        if not response.ok:
+            raise Exception('HTTP %d %s' %(response.status, response.text()[:200]))
+        link = {'name': filename, 'url': release['web_url'] + response.json()['url']}
+        response = self.http.request('POST', '%s/releases/%s/assets/links' %(release['project_url'], quote(release['tag'], safe='')), body=link)
+        if response.status==400 and 'taken' in response.text():
+            return 'skipped'
+        if not response.ok:
+            raise Exception('HTTP %d %s' %(response.status, response.text()[:200]))
+        return 'uploaded'
+
+
+# %% Release
+def get_token(host):
+    """Token for the API of host ('github' or 'gitlab') from GITHUB_TOKEN or GITLAB_TOKEN, None when it is not set."""
+    return {'github': os.environ.get('GITHUB_TOKEN'), 'gitlab': os.environ.get('GITLAB_TOKEN')}.get(host)
+
+
+def create_release(tag, artifacts=None, notes=None, name=None, host=None, owner=None, subgroup=None, repo=None, api_url=None, token=None, n_jobs=4, verbose=3):
+    """Create the release of tag on GitHub or GitLab and attach the artifacts concurrently.
+
+    The host, owner, subgroup path and repository are read from the git remote, the same as the
+    release uses for the version lookup.
+
+    Parameters
+    ----------
+    tag : str
+        Tag of the release, the tag must be pushed.
+    artifacts : list of str, optional
+        Files that are attached to the release.
+    notes : str, optional
+        Release notes. The default is the commits since the previous version tag, see :func:`release_notes`.
+    name : str, optional
+        Title of the release. The default is 'v<tag>'.
+    host : str, optional
+        'github' or 'gitlab'. The default is read from the git remote.
+    owner, subgroup, repo : str, optional
+        Repository on the host. The default is read from the git remote.
+    api_url : str, optional
+        API url. The default is GITHUB_API_URL or https://api.github.com for github, and
+        CI_API_V4_URL or https://<hostname>/api/v4 for gitlab.
+    token : str, optional
+        API token. The default is read from GITHUB_TOKEN or GITLAB_TOKEN.
+    n_jobs : int, optional
+        Number of concurrent uploads. The default is 4.
+    verbose : int, optional
+        Print message. The default is 3.
+
+    Returns
+    -------
+    results : dict
+        status ('created' or 'exists'), url of the release and assets [{file, status, time, error}].
+
+    Examples
+    --------
+    >>> from irelease import gitrelease
+    >>> results = gitrelease.create_release('1.0.0', artifacts=['dist/pca-1.0.0.tar.gz'])
+
+    """
+    from irelease import irelease
+    from irelease.context import RepoContext
+    context = RepoContext.get()
+    host = host or irelease._git_host(verbose=verbose)
+    repo = repo or context.repo
+    if owner is None: owner = irelease._git_username(host, verbose=verbose)
+    if subgroup is None: subgroup = irelease._git_pathname(host, owner, repo, verbose=verbose)
+    if host=='github':
+        client = GitHubReleases(api_url=api_url or GITHUB_API, token=token)
+    elif host=='gitlab':
+        client = GitLabReleases(api_url=api_url or os.environ.get('CI_API_V4_URL') or 'https://%s/api/v4' %(context.hostname), token=token)
+    else:
+        raise Exception('Releases can only be created on github or gitlab, not on: %s' %(context.url))
+    if client.token is None:
+        raise Exception('A token is required to create the %s release. Set %s.' %(host, 'GITHUB_TOKEN' if host=='github' else 'GITLAB_TOKEN'))
+
+    from packaging.version import Version, InvalidVersion
+    try:
+        prerelease = Version(tag).is_prerelease
+    except InvalidVersion:
+        # A tag that is not a version, like 'latest', is a normal release.
+        prerelease = False
+    if notes is None: notes = release_notes(tag)
+    with trace.span('%s release' %(host), tag=tag):
+        release = client.create(owner, subgroup or '/', repo, tag, name or 'v' + tag, notes, prerelease=prerelease)
+    if verbose>=3: print('[irelease] %s release %s: %s' %(host, release['status'], release['url']))
+
+    def _upload(filepath):
+        result = {'file': os.path.basename(filepath), 'status': 'failed', 'time': 0.0, 'error': None}
+        if result['file'] in release['assets']:
+            result['status'] = 'skipped'
+            return result
+        start = time.perf_counter()
+        try:
+            with trace.span('asset ' + result['file']):
+                result['status'] = client.upload(release, filepath)
+        except Exception as e:
+            result['error'] = str(e)
+        result['time'] = time.perf_counter() - start
+        return result
+
+    assets = []
+    if len(artifacts or [])>0:
+        with ThreadPoolExecutor(max_workers=max(1, n_jobs)) as executor:
+            assets = list(executor.map(trace.bind(_upload), artifacts))
+    for a in assets:
+        if verbose>=3 and a['status']!='failed': print('[irelease] Asset %s %s' %(a['file'], a['status']))
+        if verbose>=1 and a['status']=='failed': print('[irelease] ERROR: Asset %s can not be uploaded: %s' %(a['file'], a['error']))
+    client.http.close()
+    return {'status': release['status'], 'url': release['url'], 'assets': assets}
@@ -0,0 +1,150 @@
+"""Small HTTP client with keep-alive connections that are reused per host and thread."""
+# --------------------------------------------------
+# Name        : httpclient.py
+# Author      : E.Taskesen
+# Contact     : erdogant@gmail.com
+# github      : https://github.com/erdogant/irelease
+# Licence     : MIT
+# --------------------------------------------------
+
+import json
+import ssl
+import threading
+import http.client
+from urllib.parse import urlsplit, urlencode
+
+
+class Response:
+    """Response of :meth:`HTTPClient.request`."""
+
+    def __init__(self, status, headers, data, url):
+        self.status = status
+        self.headers = headers
+        self.data = data
+        self.url = url
+
+    @property
+    def ok(self):
+        return 200 <= self.status < 300
+
+    def json(self):
+        return json.loads(self.data.decode('utf-8'))
+
+    def text(self):
+        return self.data.decode('utf-8', errors='replace')
+
+    def __repr__(self):
+        return 'Response(%d, %s)' %(self.status, self.url)
+
+
+class HTTPClient:
+    """HTTP client that keeps one connection open per host for every thread.
+
+    Parameters
+    ----------
+    timeout : float, optional
+        Socket timeout in seconds. The default is 60.
+    headers : dict, optional
+        Headers that are send with every request.
+
+    Examples
+    --------
+    >>> client = HTTPClient(headers={'User-Agent': 'irelease'})
+    >>> response = client.request('GET', 'https://pypi.org/pypi/irelease/json')
+    >>> response.json()['info']['version']
+
+    """
+
+    def __init__(self, timeout=60, headers=None):
+        self.timeout = timeout
+        self.headers = dict(headers or {})
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+
+    def _connection(self, scheme, netloc):
+        pool = getattr(self._local, 'pool', None)
+        if pool is None:
+            pool = self._local.pool = {}
+        conn = pool.get((scheme, netloc))
+        if conn is None:
+            if scheme=='https':
+                conn = http.client.HTTPSConnection(netloc, timeout=self.timeout, context=ssl.create_default_context())
+            else:
+                conn = http.client.HTTPConnection(netloc, timeout=self.timeout)
+            pool[(scheme, netloc)] = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _drop(self, scheme, netloc):
+        conn = self._local.pool.pop((scheme, netloc), None)
+        if conn is not None: conn.close()
+
+    def request(self, method, url, body=None, headers=None, params=None):
+        """Send a request and read the complete response.
+
+        Parameters
+        ----------
+        method : str
+            'GET', 'POST', ..
+        url : str
+            Absolute url.
+        body : bytes, str, dict or file, optional
+            A dict is send as json.
+        headers : dict, optional
+            Extra headers of this request.
+        params : dict, optional
+            Query parameters.
+
+        Returns
+        -------
+        Response
+
+        """
+        parts = urlsplit(url)
+        path = parts.path or '/'
+        query = parts.query
+        if params: query = (query + '&' if query else '') + urlencode(params)
+        if query: path = path + '?' + query
+
+        headers = {**self.headers, **(headers or {})}
+        if isinstance(body, dict):
+            body = json.dumps(body).encode('utf-8')
+            headers.setdefault('Content-Type', 'application/json')
+        elif isinstance(body, str):
+            body = body.encode('utf-8')
+
+        # A kept-alive connection can be closed by the server in the mean time: retry once on a new connection.
+        for attempt in range(2):
+            conn = self._connection(parts.scheme, parts.netloc)
+            try:
+                if hasattr(body, 'seek'): body.seek(0)
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                data = response.read()
+                break
+            except (http.client.RemoteDisconnected, http.client.CannotSendRequest, ConnectionResetError, BrokenPipeError):
+                self._drop(parts.scheme, parts.netloc)
+                if attempt==1: raise
+            except Exception:
+                self._drop(parts.scheme, parts.netloc)
+                raise
+
+        if response.getheader('Connection', '').lower()=='close':
+            self._drop(parts.scheme, parts.netloc)
+        return Response(response.status, {k.lower(): v for k, v in response.getheaders()}, data, url)
+
+    def close(self):
+        """Close all connections."""
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -9,23 +9,21 @@
 
 import sys
 import os
-import re
 # import platform
 import argparse
-import numpy as np
-import urllib.request
+import json
+import subprocess
 import shutil
-from packaging import version
-import webbrowser
-import configparser
 import glob
-import toml
-
-IGNORE_DIRS_IN_PACKAGE = np.array([f for f in os.listdir('.') if os.path.isdir(f) and (f[0]=='.' or f[0]=='_')])
-EXCLUDE_DIR = np.unique(np.array(list(IGNORE_DIRS_IN_PACKAGE) + ['build', 'dist', 'doc', 'docs', 'depricated']))
+from irelease import trace
+from irelease.context import RepoContext
+from irelease import discover
+# Heavy modules (webbrowser, urllib.request, configparser, packaging and the build machinery) are imported
+# where they are used so that starting irelease stays fast.
 
 # %%
 def get_pypi_credentials(verbose=3):
+    import configparser
     config = configparser.ConfigParser()
     config.read('.pypirc')
 
@@ -63,7 +61,7 @@ def make_script():
 
 
 # %% def main(username, packagename=None, verbose=3):
-def run(username, packagename, clean=True, install=False, twine=None, verbose=3):
+def run(username, packagename, clean=True, install=False, twine=None, build_mode='single', force_rebuild=False, version_source='tags', verbose=3):
 
     """Make new release on git and PyPi.
 
@@ -90,6 +88,19 @@ def run(username, packagename, clean=True, install=False, twine=None, verbose=3)
         Clean local distribution files for packaging.
     twine : str
         Filepath to the executable of twine.
+    build_mode : str
+        'single'   : Build the sdist and then the wheel with one build environment.
+        'sdist'    : Build the wheel from the unpacked sdist.
+        'parallel' : Build the sdist and, from a copy of the source directory, the wheel concurrently.
+        The default is 'single'.
+    force_rebuild : bool
+        Build even if the sources are unchanged since the artifacts in dist/ were build. The default is False.
+    version_source : str
+        Where the latest released version is read from.
+        'tags'   : The git tags, without network access.
+        'remote' : The github releases.
+        'both'   : The git tags, cross-checked with the github releases.
+        The default is 'tags'.
     verbose : int
         Print message. The default is 3.
 
@@ -121,13 +132,10 @@ def run(username, packagename, clean=True, install=False, twine=None, verbose=3)
     if username is None: raise Exception('[irelease] ERROR: %s name does not exists.' %(git))
 
     # Get init file from the dir of interest
-    initfile = os.path.join(packagename, "__init__.py")
+    initfile = _initfile(packagename)
 
     if verbose>=3:
-        if _get_platform()=='windows':
-            os.system('cls')
-        else:
-            os.system('clear')
+        subprocess.run('cls' if _get_platform()=='windows' else 'clear', shell=True)
         print('[irelease] ================================================================')
         print('[irelease] username  : %s' %username)
         print('[irelease] Package   : %s' %packagename)
@@ -137,13 +145,12 @@ def run(username, packagename, clean=True, install=False, twine=None, verbose=3)
         print('[irelease] init file : %s' %initfile)
         print('[irelease] ================================================================')
 
-    if os.path.isfile(initfile):
-        # Extract version from __init__.py
-        getversion = _getversion(initfile)
-        if getversion:
-            _try_to_release(username, packagename, getversion, initfile, install, clean, twine, git, git_pathname, verbose)
-        else:
-            if verbose>=1: print("[irelease] ERROR: Unable to find version string in %s. Make sure that the operators are space seperated eg.: __version__ = '0.1.0'" % (initfile,))
+    # Extract version from the metadata or __init__.py
+    current_version = _getversion(packagename)
+    if current_version:
+        _try_to_release(username, packagename, current_version, initfile, install, clean, twine, git, git_pathname, verbose, build_mode=build_mode, force_rebuild=force_rebuild, version_source=version_source)
+    elif os.path.isfile(initfile):
+        if verbose>=1: print("[irelease] ERROR: Unable to find version string in %s. Make sure that the operators are space seperated eg.: __version__ = '0.1.0'" % (initfile,))
     else:
         if verbose>=2: print('[irelease] Warning: __init__.py File not found: %s' %(initfile))
 
@@ -154,6 +161,8 @@ def run(username, packagename, clean=True, install=False, twine=None, verbose=3)
 
 # %% Final message
 def _fin_message(username, packagename, current_version, git_version, git, git_pathname, user_input, verbose):
+    if user_input=='' and _create_git_release(current_version, git, verbose=verbose):
+        return
     if user_input=='':
         if verbose>=2:
             print('[irelease] ================================================================')
@@ -172,14 +181,31 @@ def _fin_message(username, packagename, current_version, git_version, git, git_p
             git_release_link = 'https://github.com/' + username + '/' + packagename + '/releases/tag/' + current_version
         elif git=='gitlab':
             git_release_link = 'https://gitlab.com/' + username + git_pathname + packagename + '/-/tags/' + current_version
+        import webbrowser
         webbrowser.open(git_release_link, new=2)
         if verbose>=2:
             print('[irelease] %s' %(git_release_link))
             print('[irelease] ================================================================')
 
 
+def _create_git_release(current_version, git, verbose=3):
+    # Create the release with the API when a token is available. Returns False to fall back to the browser.
+    from irelease import gitrelease
+    if gitrelease.get_token(git) is None: return False
+    try:
+        results = gitrelease.create_release(current_version, artifacts=sorted(glob.glob(os.path.join('dist', '*' + current_version + '*'))), host=git, verbose=verbose)
+    except Exception as e:
+        if verbose>=1: print('[irelease] ERROR: %s' %(e))
+        return False
+    if verbose>=2:
+        print('[irelease] ================================================================')
+        print('[irelease] Fin! %s' %(results['url']))
+        print('[irelease] ================================================================')
+    return all(a['status']!='failed' for a in results['assets'])
+
+
 # %% Get latest github/gitlab version
-def github_version(username, packagename, verbose=3):
+def github_version(username, packagename, pull=True, verbose=3):
     """Get latest github version for package.
 
     Parameters
@@ -188,6 +214,8 @@ def github_version(username, packagename, verbose=3):
         Name of the github account.
     packagename : String
         Name of the package.
+    pull : bool, optional
+        Git pull before the version is requested. The default is True.
     verbose : int, optional
         Print message. The default is 3.
 
@@ -200,49 +228,17 @@ def github_version(username, packagename, verbose=3):
 
     """
     # Pull latest from github
-    print('[irelease] git pull')
-    os.system('git pull')
-
-    # Check whether username/repo exists and not private
-    try:
-        github_page = None
-        github_url = 'https://api.github.com/repos/' + username + '/' + packagename + '/releases'
-        github_page = str(urllib.request.urlopen(github_url).read())
-        tag_name = re.search('"tag_name"', github_page)
-    except:
-        if verbose>=1: print('[irelease] ERROR: github %s does not exists or is private.' %(github_url))
-        git_version = '9.9.9'
-        return git_version
-
-    # Continue and check whether this is the very first tag/release or a multitude are readily there.
-    if tag_name is None:
-        if verbose>=4: print('[release.debug] github exists but tags and releases are empty [%s]' %(github_url))
-        # Tag with 0.0.0 to indicate that this is a very first tag
-        git_version = '0.0.0'
-    else:
-        try:
-            # Get the latest release
-            github_url = 'https://api.github.com/repos/' + username + '/' + packagename + '/releases/latest'
-            github_page = str(urllib.request.urlopen(github_url).read())
-            tag_name = re.search('"tag_name"', github_page)
-            # Find the next tag by the seperation of the comma. Do +20 or so to make sure a very very long version would also be included.
-            # git_version = yaml.load(github_page)['tag_name']
-            tag_ver = github_page[tag_name.end() + 1:(tag_name.end() + 20)]
-            next_char = re.search(',', tag_ver)
-            git_version = tag_ver[:next_char.start()].replace('"', '')
-        except:
-            if verbose>=1:
-                print('[irelease] ERROR: Can not find the latest Github version!')
-                print('[irelease] ERROR: Maybe repo Private or does not exists?')
-            git_version = '9.9.9'
+    if pull: _git_pull(verbose=verbose)
 
+    from irelease import lookup
+    # One request for the releases, revalidated with the ETag of the previous lookup.
+    git_version = lookup.get_client(verbose=verbose).latest_version(username, packagename)
     if verbose>=4: print('[irelease] Github version: %s' %(git_version))
-    if verbose>=4: print('[irelease] Github version requested from: %s' %(github_url))
     return git_version
 
 
 # %% Helper functions
-def _make_build_and_install(packagename, current_version, install):
+def _make_build_and_install(packagename, current_version, install, build_mode='single', force_rebuild=False, verbose=3):
     # Provide option to continue with the release
     print('[irelease] ================================================================')
     print("[irelease] Type [Q] to Quit and [Enter] to create the Distribution Archives.")
@@ -250,37 +246,69 @@ def _make_build_and_install(packagename, current_version, install):
     user_input = input("[irelease] > ")
 
     if user_input=='':
-        # Make new build
-        print('[irelease] ================================================================')
-        print('[irelease] Making new wheel..')
-        print('[irelease] python -m build --wheel')
-        print('[irelease] ================================================================')
-        if os.path.isfile('setup.py'):
-            os.system('python setup.py bdist_wheel')
-        else:
-            os.system('python -m build --wheel')
+        # Spans are around the work only, not around the time spent at the prompts.
+        try:
+            with trace.span('build', mode=build_mode):
+                _build_and_install(packagename, current_version, install, build_mode=build_mode, force_rebuild=force_rebuild, verbose=verbose)
+        except Exception as e:
+            print('[irelease] ERROR: %s' %(e))
+            user_input = 'Q'
+    return user_input
 
-        # Make new build
-        print('[irelease] ================================================================')
-        print('[irelease] Making source build..')
-        print('[irelease] python -m build --sdist')
-        print('[irelease] ================================================================')
-        if os.path.isfile('setup.py'):
-            os.system('python setup.py sdist')
-        else:
-            os.system('python -m build --sdist')
 
-        # Install new wheel
-        if install:
-            # command = 'pip install -U dist/' + packagename + '-' + current_version + '-py3-none-any.whl'
-            wheel_file = glob.glob(f"dist/{packagename}-{current_version}-*.whl")[0]
-            command = f'pip install -U {wheel_file}'
+def _build_and_install(packagename, current_version, install, build_mode='single', force_rebuild=False, runner=None, verbose=3):
+    from irelease import builder
+    from irelease.runner import hook_runner, run
+    # The output of the build backend is written to the build log
+    if runner is None: runner = hook_runner('build', packagename, verbose=verbose)
+    # Reuse the artifacts in dist/ when the sources are unchanged
+    artifacts = None if force_rebuild else builder.is_up_to_date('.', packagename, current_version)
+    if artifacts is not None:
+        if verbose>=3: print('[irelease] Sources are unchanged, reuse: %s' %(', '.join(map(os.path.basename, artifacts))))
+    else:
+        # The same commit, version and build configuration may have been build in another checkout or run
+        from irelease import store
+        key, meta = store.artifact_key('.', packagename, current_version, build_mode=build_mode)
+        artifacts = None if force_rebuild else store.get(key, 'dist', verbose=verbose)
+        if artifacts is None:
+            # Make the sdist and wheel with one build environment
+            if verbose>=3:
+                print('[irelease] ================================================================')
+                print('[irelease] Making source build and wheel [%s]..' %(build_mode))
+                print('[irelease] ================================================================')
+            results = builder.build_artifacts('.', 'dist', mode=build_mode, runner=runner, verbose=verbose)
+            artifacts = [results['sdist']['file'], results['wheel']['file']]
+            try:
+                store.put(key, artifacts, meta=meta, verbose=verbose)
+            except OSError as e:
+                if verbose>=2: print('[irelease] Warning: artifacts can not be stored: %s' %(e))
+        builder.write_manifest('.', packagename, current_version, artifacts)
+
+    # Install new wheel
+    if install:
+        # command = 'pip install -U dist/' + packagename + '-' + current_version + '-py3-none-any.whl'
+        wheel_file = [f for f in glob.glob(f"dist/*-{current_version}-*.whl") if discover.normalize_name(os.path.basename(f).split('-')[0])==discover.normalize_name(packagename)][0]
+        command = [sys.executable, '-m', 'pip', 'install', '-U', wheel_file]
+        if verbose>=3:
             print('[irelease] ================================================================')
-            print('[irelease] Installing new wheel:\n%s' %(command))
+            print('[irelease] Installing new wheel:\n%s' %(' '.join(command)))
             print('[irelease] ================================================================')
-            os.system(command)
+        run(command, 'install', package=packagename, verbose=verbose)
+    if verbose>=3:
         print('[irelease] ================================================================')
         print("[irelease] Distribution archives are created on your local machine!")
+
+
+def _verify_artifacts(packagename, current_version, user_input, verbose=3):
+    # Only continue if the previous state was not to [Q]uit!
+    if user_input=='':
+        from irelease import verify
+        with trace.span('verify') as event:
+            results = verify.verify_dist('dist', name=RepoContext.get().project_name or packagename, version=current_version, verbose=verbose)
+            event['ok'] = results['ok']
+        if not results['ok']:
+            if verbose>=1: print('[irelease] ERROR: The distribution archives in dist/ are not released. Clean dist/ and build again.')
+            user_input = 'Q'
     return user_input
 
 
@@ -294,39 +322,62 @@ def _github_set_tag_and_push(current_version, user_input, verbose=3):
         user_input = input("[irelease] > ")
 
         if user_input=='':
-            # git commit
-            if verbose>=3: print('[irelease] git add->commit->push')
-            os.system('git add .')
-            os.system('git commit -m ' + current_version)
-            # os.system('git commit -m v' + current_version)
-            # os.system('git push')
-            # Set tag for this version
-            if verbose>=3: print('[irelease] Set new version tag: %s' %(current_version))
-            # git tag -a 0.1.0 -d "0.1.0"
-            # os.system('git tag -a v' + current_version + ' -m "v' + current_version + '"')
-            os.system('git tag -a ' + current_version + ' -m "' + current_version + '"')
-            os.system('git push origin --tags')
+            from irelease.gitops import GitError
+            try:
+                with trace.span('tag', version=current_version):
+                    _set_tag_and_push(current_version, verbose=verbose)
+            except GitError as e:
+                # Do not upload a version that is not tagged.
+                if verbose>=1: print('[irelease] ERROR: %s' %(e))
+                user_input = 'Q'
 
     return user_input
 
 
-def _make_clean(packagename, verbose=3):
+def _set_tag_and_push(current_version, packagename=None, verbose=3):
+    # git add->commit->tag and push the branch with only the new tag in one atomic push.
+    from irelease.gitops import Git
+    repo = Git('.', remote=RepoContext.get().remote or 'origin', package=packagename, verbose=verbose)
+    if repo.is_detached():
+        # Worktree release: the checked out commit is released as it is, only the tag is pushed.
+        if verbose>=3: print('[irelease] Detached worktree: tag the checked out commit.')
+    else:
+        if verbose>=3: print('[irelease] git add->commit->push')
+        repo.commit_all(current_version)
+    # Set tag for this version
+    if verbose>=3: print('[irelease] Set new version tag: %s' %(current_version))
+    repo.tag(current_version, current_version)
+    repo.push(tags=[current_version])
+    if verbose>=4:
+        for command, elapsed in repo.timings:
+            print('[irelease] %6.2fs git %s' %(elapsed, command))
+
+
+def _commit_files(files, message, verbose=3):
+    # Commit only these files, other changes in the working copy are left alone.
+    from irelease.gitops import Git
+    if verbose>=3: print('[irelease] git commit %s' %(' '.join(files)))
+    Git('.', verbose=verbose).run('commit', '-m', message, '--', *files, step='git_commit')
+
+
+def _git_pull(verbose=3):
+    # Pull the latest changes and tags. A failing pull (e.g. no upstream branch) is reported but does not stop the release.
+    from irelease.gitops import Git, GitError
+    try:
+        repo = Git('.', verbose=verbose)
+        if repo.is_detached():
+            if verbose>=3: print('[irelease] Detached worktree: the checked out commit is not pulled.')
+        else:
+            repo.pull()
+    except GitError as e:
+        if verbose>=2: print('[irelease] Warning: %s' %(e))
+
+
+def _make_clean(packagename, dry_run=False, verbose=3):
+    # Remove build output and caches that match the clean patterns ([tool.irelease] in pyproject.toml) at any depth.
+    from irelease import clean
     if verbose>=3: print('[irelease] Removing local build directories..')
-    # if os.path.isdir('dist'): shutil.rmtree('dist')
-    # if os.path.isdir('build'): shutil.rmtree('build')
-    # if os.path.isdir(packagename + '.egg-info'): shutil.rmtree(packagename + '.egg-info')
-    directories_to_remove = ['dist',
-                            'build',
-                            packagename + '.egg-info',
-                            os.path.join(packagename, '__pycache__'),
-                            os.path.join(packagename, 'tests', '__pycache__'),
-                            '.pytest_cache',
-                            '.pylint.d']
-
-    for directory in directories_to_remove:
-        if os.path.isdir(directory):
-            if verbose>=3: print('[irelease] [%s] is removed from packagedir' %(directory))
-            shutil.rmtree(directory)
+    return clean.clean('.', dry_run=dry_run, verbose=verbose)
 
 
 def _get_platform():
@@ -342,109 +393,43 @@ def _get_platform():
 
 
 def _git_host(verbose=3):
-    # Extract github/gitlab from config file
-    git=None
-    f = open('./.git/config')
-    gitconfig = f.readlines()
-    for line in gitconfig:
-        line = line.replace('\t', '')
-        if re.search('github.com', line) is not None:
-            git = 'github'
-        if re.search('gitlab.com', line) is not None:
-            git = 'gitlab'
-    return git
+    # Extract github/gitlab from the remote in the git config
+    return RepoContext.get().host
 
 
 def _git_username(git, verbose=3):
     # Extract github username from config file
-    username=None
     if verbose>=4: print('[release.debug] Extracting github name from .git folder')
-    # Open github config file
-    f = open('./.git/config')
-    gitconfig = f.readlines()
-    # Iterate over the lines and search for git@github.com
-    for line in gitconfig:
-        line = line.replace('\t', '')
-        line = line.replace('\n', '')
-        geturl = re.search(git + '.com', line)  # SSH
-        if not geturl or geturl is None:
-            if git =='gitlab':
-                geturl = re.search('https://' + git, line)  # HTTPs
-            elif git =='github':
-                geturl = re.search('https://' + git + '.com', line)  # HTTPs
-        # Extract the username
-        if geturl:
-            # exract the username
-            username_line = line[geturl.end() + 1:]
-            username_line = username_line.split('/', 2)[0]
-            username = username_line.split('.git', 2)[0]
-
-    return username
+    return RepoContext.get().owner
 
 
 def _git_pathname(git, username, packagename, verbose=3):
-    # Extract github username from config file
-    git_pathname = ''
+    # Extract the (sub)group path between the username and the repository
     if verbose>=4: print('[release.debug] Extracting git path from .git folder')
-    # Open github config file
-    f = open('./.git/config')
-    gitconfig = f.readlines()
-    # Iterate over the lines and search for git@github.com
-    for line in gitconfig:
-        line = line.replace('\t', '')
-        geturl = re.search('@' + git + '.com', line)  # SSH
-        # Extract the pathname
-        if geturl:
-            repo_line = line[geturl.end():]
-            start_pos = re.search(username, repo_line)
-            end_pos = re.search(packagename, repo_line)
-            if start_pos is not None and end_pos is not None:
-                git_pathname = repo_line[start_pos.end():end_pos.start()]
-
-    return git_pathname
+    return RepoContext.get().subgroup
 
 
 def _package_name_infer(packagename, verbose=3):
-    # Infer name of the package by excluding all known-required-files-and-folders.
+    # Infer name of the package from the package directories that are found by the discovery.
     if packagename is None:
         if verbose>=4: print('[irelease] Infer name of the package from the directory..')
-        # List all folders in dir
-        filesindir = np.array(os.listdir())
-        getdirs = filesindir[list(map(lambda x: os.path.isdir(x), filesindir))]
-        # Remove all the known not relevant files and dirs
-        Iloc = np.isin(np.array(list(map(str.lower, getdirs))), EXCLUDE_DIR)==False  # noqa
-        if np.any(Iloc):
-            packagename = getdirs[Iloc][0]
+        packagename = RepoContext.get().packagename
 
     if verbose>=4: print('[irelease] Working on package: [%s]' %(packagename))
     return packagename
 
+
+def _initfile(packagename, path='.', cache=True):
+    # File with the version of the package: found by the discovery (static version in the metadata, src-layouts, version attr/file) or <packagename>/__init__.py
+    context = RepoContext.get(path, cache=cache)
+    if context.versionfile is not None and packagename in (context.project_name, context.packagename):
+        return context.versionfile
+    return os.path.join(packagename, '__init__.py')
+
 def _package_name(git, verbose=3):
-    # Extract github username from config file
-    package = None
-    if verbose>=4: print('[release.debug] Extracting package name from .git folder')
-
-    # Open github config file
-    if os.path.isfile('setup.py'):
-        f = open('setup.py')
-        gitconfig = f.readlines()
-        # Iterate over the lines and search for git@github.com
-        for line in gitconfig:
-            line = line.replace('\t', '')
-            geturl = re.search(r'name\s*=', line)
-            # If name= detected: exract the package
-            if geturl:
-                package = line[geturl.end():]
-                package = package.replace('\n', '')
-                package = package.replace(',', '')
-                package = package.replace("'", '')
-                package = package.replace('"', '')
-    elif os.path.isfile('pyproject.toml'):
-        with open("pyproject.toml", "r") as f:
-            data = toml.load(f)
-        package = data["project"]["name"]
-
-    return package
+    # Extract the package name from setup.py or pyproject.toml
+    if verbose>=4: print('[release.debug] Extracting package name from setup.py or pyproject.toml')
+    return RepoContext.get().project_name
 
 
 def _set_defaults(username, packagename, clean, install, twine, verbose):
@@ -471,7 +456,7 @@ def _set_defaults(username, packagename, clean, install, twine, verbose):
     git = _git_host(verbose=verbose)
 
     # Get username
-    if (username is None):
+    if (username is None) and (git is not None):
         username = _git_username(git, verbose=verbose)
 
     # Get package name
@@ -479,64 +464,102 @@ def _set_defaults(username, packagename, clean, install, twine, verbose):
         packagename = _package_name(git, verbose=verbose)
 
     # Pathname
-    git_pathname = _git_pathname(git, username, packagename, verbose=verbose)
+    git_pathname = ''
+    if (git is not None) and (username is not None):
+        git_pathname = _git_pathname(git, username, packagename, verbose=verbose)
 
     return username, packagename, clean, install, twine, git, git_pathname, verbose
 
 
-def _getversion(initfile):
-    # Check version
-    return re.search(r"^__version__ = ['\"]([^'\"]*)['\"]", open(initfile, "rt").read(), re.M)
+def _getversion(packagename, path='.', cache=True):
+    # Version of the package found by the discovery: the static version in the metadata or the version in the file of
+    # the version attr/file. Otherwise __version__ in <packagename>/__init__.py. None when there is no version.
+    context = RepoContext.get(path, cache=cache)
+    if context.version is not None and packagename in (context.project_name, context.packagename):
+        return context.version
+    initfile = os.path.join(path, _initfile(packagename, path=path, cache=cache))
+    match = discover.read_version(initfile) if os.path.isfile(initfile) else None
+    return match.group(1) if match else None
+
+
+def _remote_version(username, packagename, git, pull=True, source='tags', verbose=3):
+    # Latest released version from the git tags (offline) and/or the github releases.
+    if pull: _git_pull(verbose=verbose)
+
+    git_version = '0.0.0'
+    if source in ('tags', 'both'):
+        from irelease import gitops
+        git_version = gitops.tag_version('.', verbose=verbose)
+    if source in ('remote', 'both') and git=='github':
+        remote_version = github_version(username, packagename, pull=False, verbose=verbose)
+        if source=='remote':
+            git_version = remote_version
+        elif remote_version not in ('0.0.0', '9.9.9') and remote_version!=git_version:
+            # Cross-check: a release on github without a local tag means the tags are not up to date.
+            if verbose>=2: print('[irelease] Warning: latest git tag is %s but the latest github release is %s.' %(git_version, remote_version))
+            if not _check_version(git_version, remote_version): git_version = remote_version
+    elif source=='remote' and git=='gitlab':
+        if verbose>=3: print("[irelease] Version is not checked on %s." %(git))
+    return git_version
+
+
+def _check_version(current_version, git_version):
+    # True when the local version can be released on top of the remote version
+    from packaging import version
+    if git_version=='0.0.0':
+        return True
+    elif git_version=='9.9.9':
+        return False
+    return version.parse(current_version)>version.parse(git_version)
 
 
 # %% try to Release
-def _try_to_release(username, packagename, getversion, initfile, install, clean, twine, git, git_pathname, verbose):
-    # Remove build directories
+def _try_to_release(username, packagename, current_version, initfile, install, clean, twine, git, git_pathname, verbose, build_mode='single', force_rebuild=False, version_source='tags'):
+    from irelease import builder
+    # Remove build directories, unless the previous build can be reused
+    if clean and (not force_rebuild) and builder.is_up_to_date('.', packagename, current_version):
+        clean = False
     if verbose>=3 and clean:
         input("[irelease] Press [Enter] to clean previous local builds from the package directory..")
         print('[irelease] =========================================================')
-        _make_clean(packagename, verbose=verbose)
-    # Version found, lets move on:
-    current_version = getversion.group(1)
+        with trace.span('clean'):
+            _make_clean(packagename, verbose=verbose)
     # Get latest version of github release
-    if git=='github':
-        git_version = github_version(username, packagename, verbose=verbose)
-    elif git=='gitlab':
-        git_version = '0.0.0'
-        if verbose>=3: print("[irelease] Version is not checked on %s." %(git))
+    with trace.span('remote_version', source=version_source) as event:
+        git_version = _remote_version(username, packagename, git, source=version_source, verbose=verbose)
+        event['version'] = git_version
 
     # Print info about the version
     print('[irelease] =========================================================')
+    VERSION_OK = _check_version(current_version, git_version)
     if git_version=='0.0.0':
         if verbose>=3: print("[irelease] Release package: [%s]" %(packagename))
-        VERSION_OK = True
     elif git_version=='9.9.9':
         if verbose>=3: print("[irelease] %s/%s not available at %s." %(username, packagename, git))
-        VERSION_OK = False
-    elif version.parse(current_version)>version.parse(git_version):
+    elif VERSION_OK:
         if verbose>=3: print('[irelease] Current local version from %s: %s and from __init__.py: %s' %(git, git_version, current_version))
-        VERSION_OK = True
-    else:
-        VERSION_OK = False
 
     if (not VERSION_OK) and (git_version != '9.9.9') and (git_version != '0.0.0'):
         if verbose>=2:
             print('[irelease] WARNING: You may need to increase your version: [%s]' %(initfile))
             print('[irelease] WARNING: Local version : %s' %(current_version))
             print('[irelease] WARNING: %s version: %s' %(git, git_version))
+            print('[irelease] WARNING: Increase the version and release with: irelease bump patch')
 
     # Make build and install
-    user_input = _make_build_and_install(packagename, current_version, install)
+    user_input = _make_build_and_install(packagename, current_version, install, build_mode=build_mode, force_rebuild=force_rebuild, verbose=verbose)
+    # Verify the distribution archives before anything is tagged or uploaded
+    user_input = _verify_artifacts(packagename, current_version, user_input, verbose=verbose)
     # Set tag to github and push
     user_input = _github_set_tag_and_push(current_version, user_input, verbose=verbose)
     # Upload to pypi
-    user_input = _upload_to_pypi(twine, user_input, verbose=verbose)
+    user_input = _upload_to_pypi(twine, user_input, packagename=packagename, verbose=verbose)
     # Fin message and webbrowser
     _fin_message(username, packagename, current_version, git_version, git, git_pathname, user_input, verbose)
 
 
 # %% Upload to pypi
-def _upload_to_pypi(twine, user_input, verbose=3):
+def _upload_to_pypi(twine, user_input, packagename=None, verbose=3):
     # Push to git and set the Tag.
     # Only continue if the previous state was not to [Q]uit!
     if user_input=='':
@@ -546,33 +569,87 @@ def _upload_to_pypi(twine, user_input, verbose=3):
         user_input = input("[irelease] > ")
 
         if user_input=='':
-            bashCommand=''
-            if twine is None:
-                bashCommand = "twine" + ' upload dist/*'
-            elif os.path.isfile(twine):
-                bashCommand = twine + ' upload dist/*'
-
-            if verbose>=3: print('[irelease] %s' %(bashCommand))
-
             # Get PyPI credentials
+            credentials = None
             username, password = get_pypi_credentials(verbose=verbose)
 
             if (username is not None) and (password is not None):
                 print('[irelease] =========================================================')
                 print("[irelease] Hit <enter> use the username and password from .pypirc")
                 print('[irelease] =========================================================')
-                user_input = input("[irelease] > ")
-                if user_input=='':
-                    bashCommand = bashCommand + ' -u ' + username + ' -p ' + password
+                if input("[irelease] > ")=='': credentials = (username, password)
+            if credentials is None:
+                # Twine does not prompt, its output is captured. Empty uses the configuration of twine (~/.pypirc, keyring or environment).
+                import getpass
+                username = input("[irelease] Username (empty for the twine configuration) > ")
+                if username!='': credentials = (username, getpass.getpass("[irelease] Password > "))
+            # Upload to every publish target. The credentials are for pypi or the default repository of twine.
+            from irelease import publish
             try:
-                os.system(bashCommand)
-            except:
-                pass
+                targets = publish.read_targets('.')
+                for target in targets:
+                    if credentials is not None and (target['implicit'] or target['name']=='pypi'): target['username'], target['password'] = credentials
+                artifacts = sorted(glob.glob(os.path.join('dist', '*')))
+                results = publish.publish(artifacts, targets=targets, twine=twine or 'twine', packagename=packagename, verbose=verbose)
+                failed = [r for r in results if r['status']=='failed']
+            except Exception as e:
+                failed = [{'name': 'publish', 'error': str(e)}]
+            for r in failed:
+                print('[irelease] ERROR: Upload to [%s] failed: %s' %(r['name'], r['error']))
+            if len(failed)>0: user_input = 'Q'
 
     # return
     return user_input
 
 
+def _twine_noninteractive(twine, artifacts=None, credentials=None, repository_url=None, skip_existing=False, verbose=3):
+    # Twine command and environment without prompts. Credentials are taken from .pypirc or the TWINE_USERNAME/TWINE_PASSWORD environment.
+    # The credentials are passed in the environment, so they are not in the command line or the log.
+    options = '--non-interactive ' + ('--skip-existing ' if skip_existing else '') + ('--repository-url %s ' %(repository_url) if repository_url else '')
+    bashCommand = _twine_command(twine, artifacts=artifacts).replace(' upload ', ' upload ' + options, 1)
+    env = os.environ.copy()
+    if repository_url is not None:
+        # Another repository than the default of twine: the credentials of pypi are not passed on.
+        for key in ['TWINE_USERNAME', 'TWINE_PASSWORD', 'TWINE_REPOSITORY', 'TWINE_REPOSITORY_URL']:
+            env.pop(key, None)
+    if credentials is not None:
+        env['TWINE_USERNAME'], env['TWINE_PASSWORD'] = credentials
+    elif repository_url is None:
+        username, password = get_pypi_credentials(verbose=verbose)
+        if (username is not None) and (password is not None):
+            env.setdefault('TWINE_USERNAME', username)
+            env.setdefault('TWINE_PASSWORD', password)
+    return bashCommand, env
+
+
+def _twine_command(twine, artifacts=None):
+    # Upload exactly the artifacts that are verified, dist/* when they are not given.
+    files = 'dist/*' if artifacts is None else ' '.join(_quote(f) for f in artifacts)
+    bashCommand=''
+    if twine is None:
+        bashCommand = "twine" + ' upload ' + files
+    elif os.path.isfile(twine) or shutil.which(twine):
+        bashCommand = twine + ' upload ' + files
+    return bashCommand
+
+
+def _quote(filepath):
+    # Quote a filepath for the shell that runs the command
+    if sys.platform=='win32': return subprocess.list2cmdline([filepath])
+    import shlex
+    return shlex.quote(filepath)
+
+
+def _twine_upload(twine, artifacts=None, packagename=None, credentials=None, repository_url=None, skip_existing=False, step='upload', verbose=3):
+    # Upload without prompting. Raises runner.CommandFailed with the tail of the output when twine fails.
+    from irelease import runner
+    bashCommand, env = _twine_noninteractive(twine, artifacts=artifacts, credentials=credentials, repository_url=repository_url, skip_existing=skip_existing, verbose=verbose)
+    if bashCommand=='': raise Exception('Twine is not found: %s' %(twine))
+    if verbose>=3: print('[irelease] %s' %(bashCommand))
+    with trace.span('upload', tool='twine'):
+        return runner.run(bashCommand, step, package=packagename, env=env, verbose=verbose)
+
+
 # %% Main function
 def main():
     """Run the Main function.
@@ -591,7 +668,134 @@ def main():
     parser.add_argument("-i", "--install", action="store_true", default=False, help="Install this version locally (default: no).")
     parser.add_argument("-t", "--twine", type=str, help="Path to twine if you have a custom build.")
     parser.add_argument("-v", "--verbosity", type=int, default=3, choices=[0,1,2,3,4,5], help="Verbosity level (default: 3).")
+    parser.add_argument("--batch", type=str, nargs='+', metavar="PATH", help="Release all packages found in these directories without user interaction.")
+    parser.add_argument("--manifest", type=str, help="Workspace manifest (toml) with the package directories to release in batch.")
+    parser.add_argument("-r", "--repository-url", type=str, default='https://upload.pypi.org/legacy/', help="Upload url of the package index in non-interactive and batch mode (default: PyPi).")
+    parser.add_argument("-b", "--build-mode", type=str, default='single', choices=['single', 'sdist', 'parallel'], help="Build the wheel after the sdist from the source (single), from the sdist (sdist) or concurrently (parallel) (default: single).")
+    parser.add_argument("--force-rebuild", action="store_true", default=False, help="Build even if the sources are unchanged since the previous build.")
+    parser.add_argument("--version-source", type=str, default='tags', choices=['tags', 'remote', 'both'], help="Read the latest released version from the git tags, the github releases or both (default: tags).")
+    parser.add_argument("-y", "--yes", action="store_true", default=False, help="Run the release pipeline without user interaction.")
+    parser.add_argument("--resume", action="store_true", default=False, help="Continue the release pipeline at the step that failed in the previous run.")
+    parser.add_argument("--worktree", action="store_true", default=False, help="Release the committed HEAD from a temporary git worktree: the working copy is not cleaned, committed or pulled. Can not be used with --resume.")
+    parser.add_argument("--async", dest="run_async", action="store_true", default=False, help="Run the release pipeline with asyncio without user interaction and stream the output of git, the build and twine.")
+    parser.add_argument("-j", "--jobs", type=int, default=4, help="Number of packages that are released concurrently in batch mode (default: 4).")
+    parser.add_argument("--trace-file", type=str, help="Write the duration of every release stage and subprocess to this file (json lines, or a json list for a .json file).")
+    parser.add_argument("--profile", type=str, nargs='?', const='irelease.prof', help="Run with cProfile and write the stats to this file (default: irelease.prof).")
+    commands = parser.add_subparsers(dest='command', metavar='command', help="Run a single command instead of a release.")
+    clean_parser = commands.add_parser('clean', help="Remove build output and caches that match the clean patterns of [tool.irelease] in pyproject.toml.")
+    clean_parser.add_argument("-n", "--dry-run", action="store_true", default=False, help="Only list what would be removed.")
+    verify_parser = commands.add_parser('verify', help="Verify the distribution archives and write the provenance manifest.")
+    verify_parser.add_argument("dist", type=str, nargs='?', default='dist', help="Directory with the distribution archives (default: dist).")
+    cache_parser = commands.add_parser('cache', help="Show or prune the artifact store and the cached build environments.")
+    cache_parser.add_argument("action", type=str, choices=['stats', 'prune'], help="Show the statistics or remove the least recently used entries.")
+    cache_parser.add_argument("--max-size", type=float, help="Maximum size of the artifact store in MB when pruning (default: 1024).")
+    cache_parser.add_argument("--all", dest="prune_all", action="store_true", default=False, help="Remove all artifacts and build environments.")
+    bump_parser = commands.add_parser('bump', help="Increase the version in all files of the project and release it.")
+    bump_parser.add_argument("part", type=str, choices=['major', 'minor', 'patch', 'pre'], help="Part of the version that is increased.")
+    bump_parser.add_argument("--set", dest="new_version", type=str, help="Set this version instead.")
+    bump_parser.add_argument("-n", "--dry-run", action="store_true", default=False, help="Only show the changes.")
+    bump_parser.add_argument("--no-release", action="store_true", default=False, help="Only increase the version.")
+    plan_parser = commands.add_parser('plan', help="Show what a release would do (package, versions, build, tag, push and upload) without side effects.")
+    plan_parser.add_argument("paths", type=str, nargs='*', default=['.'], metavar="PATH", help="Package directories or directories with packages (default: .).")
+    plan_parser.add_argument("--json", action="store_true", default=False, help="Print the plans as json.")
+    serve_parser = commands.add_parser('serve', help="Run a release server that accepts release jobs over a local HTTP api, -j sets the number of concurrent jobs.")
+    serve_parser.add_argument("--host", type=str, default='127.0.0.1', help="Address to listen on (default: 127.0.0.1).")
+    serve_parser.add_argument("--port", type=int, default=8765, help="Port to listen on (default: 8765).")
+    serve_parser.add_argument("--socket", dest="socket_path", type=str, help="Listen on this Unix socket instead of host and port.")
     args = parser.parse_args()
 
+    trace.start(args.trace_file)
+    try:
+        if args.profile:
+            exitcode = trace.profile(lambda: _main(args), args.profile, verbose=args.verbosity)
+        else:
+            exitcode = _main(args)
+    finally:
+        spans = trace.stop()
+        if args.trace_file:
+            trace.summary(spans, verbose=args.verbosity)
+            if args.verbosity>=3: print('[irelease] Trace is written to %s' %(args.trace_file))
+    sys.exit(exitcode)
+
+
+def _main(args):
+    if args.worktree and args.resume:
+        if args.verbosity>=1: print('[irelease] ERROR: --resume can not be used with --worktree: the worktree and its dist/ are removed after the release. Run again without --resume.')
+        return 1
+    # Commands
+    if args.command=='clean':
+        from irelease import clean
+        results = clean.clean('.', dry_run=args.dry_run, n_jobs=max(args.jobs, 1) * 2, verbose=args.verbosity)
+        return int(len(results['errors'])>0)
+    if args.command=='verify':
+        from irelease import verify
+        _, packagename, _, _, _, _, _, verbose = _set_defaults(args.username, args.package, True, False, None, args.verbosity)
+        packagename = _package_name_infer(packagename, verbose=verbose)
+        results = verify.verify_dist(args.dist, name=RepoContext.get().project_name or packagename, version=_getversion(packagename) if packagename else None, verbose=verbose)
+        return int(not results['ok'])
+    if args.command=='cache':
+        from irelease import store, builder
+        if args.action=='prune':
+            max_size = 0 if args.prune_all else (args.max_size * 1024 ** 2 if args.max_size is not None else store.MAX_SIZE)
+            removed = store.prune(max_size=max_size, verbose=args.verbosity)
+            if args.prune_all: removed += builder.prune_envs(max_envs=0, max_size=0, verbose=args.verbosity)
+            if args.verbosity>=3: print('[irelease] %d entries removed.' %(len(removed)))
+        store.stats(verbose=args.verbosity)
+        return 0
+    if args.command=='bump':
+        from irelease import bump
+        results = bump.bump(args.part, version=args.new_version, dry_run=args.dry_run, verbose=args.verbosity)
+        if args.dry_run or args.no_release: return 0
+        # The worktree is checked out from HEAD, so the new version is committed first.
+        if args.worktree: _commit_files(list(results['files']), results['version'], verbose=args.verbosity)
+    if args.command=='plan':
+        from irelease import plan
+        plans = plan.plan_batch(args.paths, n_jobs=args.jobs * 2, clean=args.clean, repository_url=args.repository_url, build_mode=args.build_mode, force_rebuild=args.force_rebuild, version_source=args.version_source)
+        if args.json:
+            print(json.dumps(plans, indent=2))
+        else:
+            plan.print_plan(plans, verbose=args.verbosity)
+        return int(len(plans)==0 or any(p['action']=='error' for p in plans))
+    if args.command=='serve':
+        from irelease.server import ReleaseServer
+        ReleaseServer(host=args.host, port=args.port, socket_path=args.socket_path, n_jobs=args.jobs, verbose=args.verbosity).serve_forever()
+        return 0
+
+    # Batch mode
+    if args.batch or args.manifest:
+        from irelease import batch
+        paths = list(args.batch or [])
+        if args.manifest: paths = paths + batch.read_manifest(args.manifest)
+        results = batch.run_batch(paths, n_jobs=args.jobs, clean=args.clean, twine=args.twine, repository_url=args.repository_url, build_mode=args.build_mode, force_rebuild=args.force_rebuild, version_source=args.version_source, resume=args.resume, worktree=args.worktree, verbose=args.verbosity)
+        return int(any(r['status']=='failed' for r in results))
+
+    # Release the committed HEAD in a temporary worktree
+    if args.worktree:
+        from irelease import gitops
+        cwd = os.getcwd()
+        with gitops.worktree('.', verbose=args.verbosity) as workdir:
+            os.chdir(workdir)
+            try:
+                return _release(args)
+            finally:
+                os.chdir(cwd)
+    return _release(args)
+
+
+def _release(args):
+    # Non-interactive pipeline with asyncio
+    if args.run_async:
+        import asyncio
+        from irelease import aio
+        results = asyncio.run(aio.run_async(args.username, args.package, clean=args.clean, install=args.install, twine=args.twine, repository_url=args.repository_url, build_mode=args.build_mode, force_rebuild=args.force_rebuild, version_source=args.version_source, resume=args.resume, verbose=args.verbosity))
+        return int(results['status']=='failed')
+
+    # Non-interactive pipeline
+    if args.yes or args.resume:
+        from irelease import pipeline
+        results = pipeline.release(args.username, args.package, clean=args.clean, install=args.install, twine=args.twine, repository_url=args.repository_url, build_mode=args.build_mode, force_rebuild=args.force_rebuild, version_source=args.version_source, resume=args.resume, verbose=args.verbosity)
+        return int(results['status']=='failed')
+
     # Go to main
-    run(args.username, args.package, clean=args.clean, twine=args.twine, verbose=args.verbosity)
+    run(args.username, args.package, clean=args.clean, twine=args.twine, build_mode=args.build_mode, force_rebuild=args.force_rebuild, version_source=args.version_source, verbose=args.verbosity)
+    return 0
@@ -0,0 +1,195 @@
+"""Look up the latest released versions on GitHub with one request per repository."""
+# --------------------------------------------------
+# Name        : lookup.py
+# Author      : E.Taskesen
+# Contact     : erdogant@gmail.com
+# github      : https://github.com/erdogant/irelease
+# Licence     : MIT
+# --------------------------------------------------
+
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from irelease import trace
+from irelease.httpclient import HTTPClient
+
+# GitHub Actions sets GITHUB_API_URL, which also makes GitHub Enterprise work.
+GITHUB_API = os.environ.get('GITHUB_API_URL', 'https://api.github.com')
+CACHE_DIR = os.environ.get('IRELEASE_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'irelease'))
+# Versions with the same meaning as github_version returns
+NO_RELEASE = '0.0.0'
+NOT_FOUND = '9.9.9'
+
+_CLIENTS = {}
+_CLIENTS_LOCK = threading.Lock()
+
+
+class VersionClient:
+    """Client for the latest release of GitHub repositories.
+
+    All requests share kept-alive connections. Responses are cached on disk with their ETag and
+    revalidated with If-None-Match; GitHub does not count a 304 response against the rate limit.
+
+    Parameters
+    ----------
+    api_url : str, optional
+        GitHub API url. The default is https://api.github.com or GITHUB_API_URL.
+    token : str, optional
+        GitHub token. The default is read from GITHUB_TOKEN. Required for graphql.
+    cachedir : str, optional
+        Directory of the ETag cache. None disables the disk cache. The default is ~/.cache/irelease.
+    cache : bool or str, optional
+        Use the disk cache. 'read' uses the cache without writing it, new responses are only kept in memory.
+        The default is True.
+    verbose : int, optional
+        Print message. The default is 3.
+
+    Examples
+    --------
+    >>> client = VersionClient()
+    >>> client.latest_version('erdogant', 'irelease')
+    >>> client.latest_versions([('erdogant', 'pca'), ('erdogant', 'bnlearn')])
+
+    """
+
+    def __init__(self, api_url=GITHUB_API, token=None, cachedir=CACHE_DIR, cache=True, verbose=3):
+        self.api_url = api_url.rstrip('/')
+        self.token = token or os.environ.get('GITHUB_TOKEN')
+        self.verbose = verbose
+        headers = {'Accept': 'application/vnd.github+json', 'User-Agent': 'irelease'}
+        if self.token: headers['Authorization'] = 'Bearer ' + self.token
+        self.http = HTTPClient(timeout=30, headers=headers)
+        self.cachefile = os.path.join(cachedir, 'versions.json') if cachedir and cache else None
+        self.cache = cache
+        self._cache = None
+        self._lock = threading.Lock()
+
+    # %% Cache
+    def _load_cache(self):
+        if self._cache is None:
+            self._cache = {}
+            if self.cachefile and os.path.isfile(self.cachefile):
+                try:
+                    with open(self.cachefile, 'r') as f:
+                        self._cache = json.load(f)
+                except ValueError:
+                    self._cache = {}
+        return self._cache
+
+    def _store(self, url, etag, version):
+        with self._lock:
+            self._load_cache()[url] = {'etag': etag, 'version': version, 'time': time.time()}
+            if self.cachefile is None or self.cache=='read': return
+            os.makedirs(os.path.dirname(self.cachefile), exist_ok=True)
+            tmpfile = '%s.%d.tmp' %(self.cachefile, os.getpid())
+            with open(tmpfile, 'w') as f:
+                json.dump(self._cache, f)
+            os.replace(tmpfile, self.cachefile)
+
+    # %% Lookup
+    def latest_version(self, owner, repo):
+        """Latest release of owner/repo.
+
+        Returns
+        -------
+        str
+            Tag name of the latest release that is not a draft or prerelease.
+            '0.0.0' when the repository has no release yet, '9.9.9' when it does not exist or is private.
+
+        """
+        url = '%s/repos/%s/%s/releases?per_page=20' %(self.api_url, owner, repo)
+        with self._lock:
+            cached = self._load_cache().get(url)
+        headers = {'If-None-Match': cached['etag']} if cached and cached.get('etag') else {}
+
+        try:
+            with trace.span('github releases', repo='%s/%s' %(owner, repo)) as event:
+                response = self.http.request('GET', url, headers=headers)
+                event['http_status'] = response.status
+        except Exception as e:
+            if self.verbose>=1: print('[irelease] ERROR: Can not reach %s: %s' %(url, e))
+            # Offline: the last known version is better than nothing.
+            return cached['version'] if cached else NOT_FOUND
+
+        if response.status==304 and cached:
+            if self.verbose>=4: print('[irelease] %s/%s not modified: %s' %(owner, repo, cached['version']))
+            return cached['version']
+        if response.status==404:
+            if self.verbose>=1: print('[irelease] ERROR: github %s/%s does not exists or is private.' %(owner, repo))
+            return NOT_FOUND
+        if not response.ok:
+            if self.verbose>=1: print('[irelease] ERROR: github %s/%s: HTTP %d' %(owner, repo, response.status))
+            return cached['version'] if cached else NOT_FOUND
+
+        version = _latest_tag(response.json(), 'tag_name', 'prerelease', 'draft')
+        self._store(url, response.headers.get('etag'), version)
+        if self.verbose>=4: print('[irelease] Github version of %s/%s: %s' %(owner, repo, version))
+        return version
+
+    def latest_versions(self, repos, n_jobs=8):
+        """Latest release of many repositories concurrently.
+
+        Parameters
+        ----------
+        repos : list of tuple
+            (owner, repo) pairs.
+        n_jobs : int, optional
+            Number of concurrent requests. The default is 8.
+
+        Returns
+        -------
+        dict
+            {(owner, repo): version}
+
+        """
+        repos = list(dict.fromkeys(repos))
+        with ThreadPoolExecutor(max_workers=max(1, n_jobs)) as executor:
+            versions = executor.map(lambda r: self.latest_version(*r), repos)
+            return dict(zip(repos, versions))
+
+    def latest_versions_graphql(self, repos):
+        """Latest release of many repositories in a single graphql query. A token is required.
+
+        Returns
+        -------
+        dict
+            {(owner, repo): version}
+
+        """
+        repos = list(dict.fromkeys(repos))
+        if len(repos)==0: return {}
+        query = 'query {' + ' '.join(
+            'r%d: repository(owner: %s, name: %s) { releases(first: 20, orderBy: {field: CREATED_AT, direction: DESC}) { nodes { tagName isPrerelease isDraft } } }'
+            %(i, json.dumps(owner), json.dumps(repo)) for i, (owner, repo) in enumerate(repos)) + '}'
+        response = self.http.request('POST', self.api_url + '/graphql', body={'query': query})
+        if not response.ok:
+            raise Exception('[irelease] ERROR: graphql query failed: HTTP %d %s' %(response.status, response.text()[:200]))
+        data = response.json().get('data') or {}
+        versions = {}
+        for i, repo in enumerate(repos):
+            node = data.get('r%d' %(i))
+            versions[repo] = NOT_FOUND if node is None else _latest_tag(node['releases']['nodes'], 'tagName', 'isPrerelease', 'isDraft')
+        return versions
+
+    def close(self):
+        self.http.close()
+
+
+def _latest_tag(releases, tag_key, prerelease_key, draft_key):
+    # Releases are sorted on creation date, newest first.
+    if len(releases)==0:
+        return NO_RELEASE
+    for release in releases:
+        if not release.get(prerelease_key) and not release.get(draft_key):
+            return release[tag_key]
+    return releases[0][tag_key]
+
+
+def get_client(api_url=GITHUB_API, cache=True, verbose=3):
+    """Shared client per api url and cache mode, so that all lookups in one process reuse the connections and the cache."""
+    with _CLIENTS_LOCK:
+        if (api_url, cache) not in _CLIENTS:
+            _CLIENTS[(api_url, cache)] = VersionClient(api_url=api_url, cache=cache, verbose=verbose)
+        return _CLIENTS[(api_url, cache)]
@@ -0,0 +1,408 @@
+"""Non-interactive release pipeline with concurrent steps and resumable checkpoints."""
+# --------------------------------------------------
+# Name        : pipeline.py
+# Author      : E.Taskesen
+# Contact     : erdogant@gmail.com
+# github      : https://github.com/erdogant/irelease
+# Licence     : MIT
+# --------------------------------------------------
+
+import os
+import glob
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from irelease import irelease
+from irelease import builder
+from irelease import upload
+from irelease import gitops
+from irelease import trace
+from irelease.context import RepoContext, common_gitdir
+
+
+class ReleaseSkipped(Exception):
+    """Raised by a step to stop the pipeline without marking the release as failed."""
+
+
+# %% Step
+class Step:
+    """A single step of the pipeline.
+
+    Parameters
+    ----------
+    name : str
+        Name of the step.
+    func : callable
+        Function that is called with the pipeline context (dict) and returns a dict with the outputs.
+    requires : list of str
+        Context keys that must be available before the step can start.
+    provides : list of str
+        Context keys that are returned by the step.
+    checkpoint : bool, optional
+        Store the outputs in the state file so that the step is not repeated on resume. The default is True.
+
+    """
+
+    def __init__(self, name, func, requires=None, provides=None, checkpoint=True):
+        self.name = name
+        self.func = func
+        self.requires = list(requires or [])
+        self.provides = list(provides or [])
+        self.checkpoint = checkpoint
+
+    def __repr__(self):
+        return 'Step(%s: %s -> %s)' %(self.name, self.requires, self.provides)
+
+
+# %% Pipeline
+def run_pipeline(steps, context=None, state_file=None, resume=False, n_jobs=4, verbose=3):
+    """Run the steps in dependency order, steps that do not depend on each other run concurrently.
+
+    Parameters
+    ----------
+    steps : list of Step
+        Steps of the pipeline.
+    context : dict, optional
+        Initial inputs of the pipeline.
+    state_file : str, optional
+        Json file in which completed steps are checkpointed. None disables checkpointing.
+    resume : bool, optional
+        Skip the steps that are completed in the state file. The default is False.
+    n_jobs : int, optional
+        Maximum number of steps that run concurrently. The default is 4.
+    verbose : int, optional
+        Print message. The default is 3.
+
+    Returns
+    -------
+    results : dict
+        context : dict with all outputs.
+        status : 'completed', 'skipped' or 'failed'.
+        failed : name of the step that failed or skipped the pipeline.
+        error : error message.
+        timings : dict with the wall-time per step.
+
+    """
+    context = dict(context or {})
+    state, done = _restore(steps, context, state_file, resume, verbose)
+    _check_steps(steps, context)
+    results = {'context': context, 'status': 'completed', 'failed': None, 'error': None, 'timings': {}}
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        while True:
+            # Start all steps that have their inputs available
+            if results['failed'] is None:
+                for step in _ready(steps, context, done, running.values()):
+                    if verbose>=4: print('[irelease] [%s] started.' %(step.name))
+                    # Steps run in worker threads, their spans are children of the span of the caller.
+                    running[executor.submit(trace.bind(_run_step), step, dict(context))] = step.name
+
+            if len(running)==0:
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                _collect(steps, running.pop(future), future, results, state, state_file, done, verbose)
+
+    return _finish(steps, results, state_file, done)
+
+
+def _run_step(step, context):
+    start = time.perf_counter()
+    try:
+        with trace.span(step.name):
+            outputs = step.func(context) or {}
+        _check_outputs(step, outputs)
+    except Exception as e:
+        # The time until the step failed is reported with the error.
+        e.elapsed = time.perf_counter() - start
+        raise
+    return outputs, time.perf_counter() - start
+
+
+def _check_outputs(step, outputs):
+    missing = [key for key in step.provides if key not in outputs]
+    if len(missing)>0:
+        raise Exception('Step did not provide: %s' %(missing))
+
+
+def _restore(steps, context, state_file, resume, verbose):
+    # Load the checkpoint and put the outputs of completed steps in the context.
+    state = _load_state(state_file)
+    if not resume: state['done'] = {}
+    done = set()
+    for step in steps:
+        if step.checkpoint and step.name in state['done']:
+            context.update(state['done'][step.name])
+            done.add(step.name)
+            if verbose>=3: print('[irelease] [%s] is restored from checkpoint.' %(step.name))
+    return state, done
+
+
+def _ready(steps, context, done, running):
+    # Steps that are not done or running and have all their inputs available.
+    running = set(running)
+    return [s for s in steps if s.name not in done and s.name not in running and all(key in context for key in s.requires)]
+
+
+def _collect(steps, name, future, results, state, state_file, done, verbose):
+    # Add the outputs of a finished step (a concurrent or asyncio future) to the results and the checkpoint.
+    step = [s for s in steps if s.name==name][0]
+    try:
+        outputs, elapsed = future.result()
+    except ReleaseSkipped as e:
+        results['status'], results['failed'], results['error'] = 'skipped', name, str(e)
+        if hasattr(e, 'elapsed'): results['timings'][name] = e.elapsed
+        if verbose>=2: print('[irelease] [%s] release is skipped: %s' %(name, e))
+        return
+    except Exception as e:
+        results['status'], results['failed'], results['error'] = 'failed', name, str(e)
+        if hasattr(e, 'elapsed'): results['timings'][name] = e.elapsed
+        if verbose>=1: print('[irelease] ERROR: [%s] failed: %s' %(name, e))
+        return
+
+    results['context'].update(outputs)
+    done.add(name)
+    results['timings'][name] = elapsed
+    if step.checkpoint:
+        state['done'][name] = outputs
+        _save_state(state_file, state)
+    if verbose>=3: print('[irelease] [%s] done in %.1fs.' %(name, elapsed))
+
+
+def _finish(steps, results, state_file, done):
+    if results['status']=='completed' and len(done)<len(steps):
+        results['status'], results['error'] = 'failed', 'Steps can not be started: %s' %([s.name for s in steps if s.name not in done])
+    if results['status']=='completed' and state_file is not None and os.path.isfile(state_file):
+        os.remove(state_file)
+    return results
+
+
+def _check_steps(steps, context):
+    # Every requirement must be provided by a step or by the initial context.
+    available = set(context.keys())
+    for step in steps:
+        available.update(step.provides)
+    for step in steps:
+        missing = [key for key in step.requires if key not in available]
+        if len(missing)>0:
+            raise Exception('[irelease] ERROR: Step [%s] requires %s that is not provided by any step.' %(step.name, missing))
+
+
+def _load_state(state_file):
+    if state_file is None or not os.path.isfile(state_file):
+        return {'done': {}}
+    with open(state_file, 'r') as f:
+        return json.load(f)
+
+
+def _save_state(state_file, state):
+    if state_file is None:
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(state_file)), exist_ok=True)
+    tmpfile = state_file + '.tmp'
+    with open(tmpfile, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmpfile, state_file)
+
+
+def state_filepath(packagename):
+    """Location of the checkpoint file for packagename, None when the release can not be resumed.
+
+    The file is stored in the .git directory that is shared by all worktrees, so that it is never committed and
+    survives the clean step. A temporary worktree is removed with its dist/ after the release and is not checkpointed.
+    """
+    gitdir = RepoContext.get().gitdir
+    if gitops.is_temporary_worktree('.'):
+        return None
+    if gitdir is not None:
+        return os.path.join(common_gitdir(gitdir), 'irelease', packagename + '.json')
+    return '.irelease_state.json'
+
+
+# %% Release steps
+def _current_version(packagename, path='.', cache=True):
+    # File and version of the package that is released, the plan resolves the version the same way.
+    initfile = irelease._initfile(packagename, path=path, cache=cache)
+    current_version = irelease._getversion(packagename, path=path, cache=cache)
+    if current_version is None:
+        if not os.path.isfile(os.path.join(path, initfile)): raise Exception('__init__.py File not found: %s' %(initfile))
+        raise Exception('Unable to find version string in %s' %(initfile))
+    return initfile, current_version
+
+
+def _release_metadata(ctx):
+    username, packagename, _, _, twine, git, git_pathname, verbose = irelease._set_defaults(ctx.get('username'), ctx.get('packagename'), True, False, ctx.get('twine'), ctx['verbose'])
+    packagename = irelease._package_name_infer(packagename, verbose=verbose)
+    if packagename is None: raise Exception('Package directory does not exists.')
+    initfile, current_version = _current_version(packagename)
+    return {'username': username, 'packagename': packagename, 'git': git, 'git_pathname': git_pathname, 'initfile': initfile, 'current_version': current_version}
+
+
+def _step_git_pull(ctx):
+    # A failing pull (e.g. no upstream branch) is reported but does not stop the release, the same as the interactive release.
+    repo = gitops.Git('.', remote=RepoContext.get().remote or 'origin', package=ctx.get('packagename'), verbose=ctx['verbose'])
+    if repo.is_detached():
+        # Worktree release: the checked out commit is released as it is.
+        if ctx['verbose']>=3: print('[irelease] Detached worktree: the checked out commit is not pulled.')
+        return {'pulled': False}
+    try:
+        repo.pull()
+    except gitops.GitError as e:
+        if ctx['verbose']>=2: print('[irelease] Warning: %s' %(e))
+        return {'pulled': False}
+    return {'pulled': True}
+
+
+def _step_remote_version(ctx):
+    return {'git_version': irelease._remote_version(ctx['username'], ctx['packagename'], ctx['git'], pull=False, source=ctx['version_source'], verbose=ctx['verbose'])}
+
+
+def _step_version_check(ctx):
+    if not irelease._check_version(ctx['current_version'], ctx['git_version']):
+        raise ReleaseSkipped('Version %s is not newer than the released version %s. Increase it with: irelease bump patch' %(ctx['current_version'], ctx['git_version']))
+    return {'version_ok': True}
+
+
+def _step_clean(ctx):
+    # Keep dist/ when the previous build can be reused
+    reuse = (not ctx['force_rebuild']) and builder.is_up_to_date('.', ctx['packagename'], ctx['current_version']) is not None
+    if ctx['clean'] and not reuse: irelease._make_clean(ctx['packagename'], verbose=ctx['verbose'])
+    return {'cleaned': True}
+
+
+def _step_build(ctx):
+    irelease._build_and_install(ctx['packagename'], ctx['current_version'], ctx['install'], build_mode=ctx['build_mode'], force_rebuild=ctx['force_rebuild'], verbose=ctx['verbose'])
+    artifacts = sorted(glob.glob(os.path.join('dist', '*' + ctx['current_version'] + '*')))
+    if len(artifacts)==0: raise Exception('No distribution archives are created for version %s.' %(ctx['current_version']))
+    return {'artifacts': artifacts}
+
+
+def _step_verify(ctx):
+    from irelease import verify
+    results = verify.verify_dist('dist', name=RepoContext.get().project_name or ctx['packagename'], version=ctx['current_version'], artifacts=ctx['artifacts'], verbose=ctx['verbose'])
+    if not results['ok']: raise Exception('Verification of the distribution archives failed, see %s.' %(results['manifest']))
+    return {'verified': results['manifest']}
+
+
+def _step_tag(ctx):
+    irelease._set_tag_and_push(ctx['current_version'], packagename=ctx['packagename'], verbose=ctx['verbose'])
+    return {'tag': ctx['current_version']}
+
+
+def _step_upload(ctx):
+    if ctx['upload']:
+        from irelease import publish
+        results = publish.publish(ctx['artifacts'], twine=ctx['twine'], packagename=ctx['packagename'], repository_url=ctx['repository_url'], verbose=ctx['verbose'])
+        failed = [r for r in results if r['status']=='failed']
+        if len(failed)>0: raise Exception('Upload failed for: %s' %('; '.join('[%s] %s' %(r['name'], r['error']) for r in failed)))
+    return {'uploaded': ctx['upload']}
+
+
+def _step_git_release(ctx):
+    from irelease import gitrelease
+    if ctx['git'] not in ('github', 'gitlab') or gitrelease.get_token(ctx['git']) is None:
+        if ctx['verbose']>=3: print('[irelease] No %s token: create the release from tag %s manually.' %(ctx['git'] or 'git', ctx['tag']))
+        return {'release_url': None}
+    results = gitrelease.create_release(ctx['tag'], artifacts=ctx['artifacts'], host=ctx['git'], verbose=ctx['verbose'])
+    failed = [a['file'] for a in results['assets'] if a['status']=='failed']
+    if len(failed)>0: raise Exception('Release assets can not be uploaded: %s' %(', '.join(failed)))
+    return {'release_url': results['url']}
+
+
+def release_steps(version_source='tags'):
+    """Steps of a release.
+
+    The released version is resolved after git pull, alongside clean and build. Tagging waits for
+    the verified build and the version check. The upload and the github/gitlab release wait for the tag
+    and run concurrently. The github releases do
+    not depend on the pull, so with version_source='remote' the lookup starts right away.
+    """
+    pulled = [] if version_source=='remote' else ['pulled']
+    return [
+        Step('git_pull', _step_git_pull, requires=['verbose'], provides=['pulled']),
+        Step('remote_version', _step_remote_version, requires=['username', 'packagename', 'git'] + pulled, provides=['git_version']),
+        Step('version_check', _step_version_check, requires=['current_version', 'git_version'], provides=['version_ok'], checkpoint=False),
+        Step('clean', _step_clean, requires=['packagename', 'current_version', 'pulled'], provides=['cleaned']),
+        Step('build', _step_build, requires=['current_version', 'cleaned'], provides=['artifacts']),
+        Step('verify', _step_verify, requires=['packagename', 'current_version', 'artifacts'], provides=['verified']),
+        Step('tag', _step_tag, requires=['artifacts', 'verified', 'version_ok'], provides=['tag']),
+        Step('upload', _step_upload, requires=['artifacts', 'tag'], provides=['uploaded']),
+        Step('git_release', _step_git_release, requires=['git', 'artifacts', 'tag'], provides=['release_url']),
+    ]
+
+
+def release(username=None, packagename=None, clean=True, install=False, upload=True, twine=None, repository_url=upload.PYPI_URL, build_mode='single', force_rebuild=False, version_source='tags', resume=False, verbose=3):
+    """Release the package in the current directory without user interaction.
+
+    Parameters
+    ----------
+    username : str, optional
+        Name of the git account.
+    packagename : str, optional
+        Name of the package.
+    clean : bool, optional
+        Clean local distribution files for packaging. The default is True.
+    install : bool, optional
+        Install the new wheel locally. The default is False.
+    upload : bool, optional
+        Upload the distribution archives to PyPi. The default is True.
+    twine : str, optional
+        Filepath to the executable of twine. None uploads the files concurrently without twine.
+    repository_url : str, optional
+        Upload url of the repository. The default is 'https://upload.pypi.org/legacy/'.
+    build_mode : str, optional
+        How the sdist and wheel are build, see :func:`irelease.builder.build_artifacts`. The default is 'single'.
+    force_rebuild : bool, optional
+        Build even if the sources are unchanged since the artifacts in dist/ were build. The default is False.
+    version_source : str, optional
+        Read the latest released version from the git 'tags', the github releases ('remote') or 'both'. The default is 'tags'.
+    resume : bool, optional
+        Continue at the step that failed in the previous run. The default is False.
+    verbose : int, optional
+        Print message. The default is 3.
+
+    Returns
+    -------
+    results : dict
+        See :func:`run_pipeline`.
+
+    Examples
+    --------
+    >>> from irelease import pipeline
+    >>> results = pipeline.release()
+    >>> # After a failure, continue where it stopped
+    >>> results = pipeline.release(resume=True)
+
+    """
+    context = {'username': username, 'packagename': packagename, 'clean': clean, 'install': install, 'upload': upload, 'twine': twine, 'repository_url': repository_url, 'build_mode': build_mode, 'force_rebuild': force_rebuild, 'version_source': version_source, 'verbose': verbose}
+    state_file, resume = _prepare(context, resume, verbose)
+    with trace.span('release', package=context['packagename'], version=context['current_version']) as event:
+        results = run_pipeline(release_steps(version_source), context=context, state_file=state_file, resume=resume, verbose=verbose)
+        event['status'] = results['status']
+    _report(results, verbose)
+    return results
+
+
+def _prepare(context, resume, verbose):
+    # Add the release metadata to the context and start the checkpoint file of this version.
+    # The package name is needed for the location of the state file.
+    metadata = _release_metadata(context)
+    context.update(metadata)
+    state_file = state_filepath(metadata['packagename'])
+    if resume and state_file is None: raise ValueError(gitops.WORKTREE_RESUME)
+    state = _load_state(state_file)
+    if resume and state.get('current_version') not in (None, metadata['current_version']):
+        if verbose>=2: print('[irelease] Warning: checkpoint is for version %s and is ignored.' %(state.get('current_version')))
+        resume = False
+    _save_state(state_file, {'current_version': metadata['current_version'], 'done': state['done'] if resume else {}})
+    return state_file, resume
+
+
+def _report(results, verbose):
+    if verbose>=2 and results['status']=='failed':
+        if gitops.is_temporary_worktree('.'):
+            print('[irelease] The worktree is removed: run again to release from the start, --resume is not available with --worktree.')
+        else:
+            print('[irelease] Run again with --resume to continue at step [%s].' %(results['failed']))
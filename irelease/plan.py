@@ -0,0 +1,194 @@
+"""Release plan: what a release would do, computed without side effects."""
+# --------------------------------------------------
+# Name        : plan.py
+# Author      : E.Taskesen
+# Contact     : erdogant@gmail.com
+# github      : https://github.com/erdogant/irelease
+# Licence     : MIT
+# --------------------------------------------------
+
+import os
+import re
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from irelease import gitops
+from irelease.context import RepoContext
+from irelease.upload import PYPI_URL
+
+
+# %% Plan
+def _expected_artifacts(name, version):
+    # Filenames of the sdist and a pure python wheel, the build backend normalizes the name like this.
+    from packaging.version import Version
+    base = re.sub(r'[-_.]+', '_', name).lower()
+    version = str(Version(version))
+    return ['%s-%s.tar.gz' %(base, version), '%s-%s-py3-none-any.whl' %(base, version)]
+
+
+def _released_version(path, context, version_source):
+    # Same resolution as irelease._remote_version, for path instead of the working directory and without pulling.
+    released, warnings = gitops.NO_RELEASE, []
+    if version_source in ('tags', 'both'):
+        released = gitops.tag_version(path, verbose=0)
+    if version_source in ('remote', 'both') and context.host=='github' and context.owner:
+        from irelease import lookup
+        remote = lookup.get_client(cache='read', verbose=0).latest_version(context.owner, context.repo)
+        if version_source=='remote':
+            released = remote
+        elif remote not in ('0.0.0', '9.9.9') and remote!=released:
+            warnings.append('Latest git tag is %s but the latest github release is %s.' %(released, remote))
+            from irelease.irelease import _check_version
+            if not _check_version(released, remote): released = remote
+    return released, warnings
+
+
+def plan_release(path='.', clean=True, upload=True, repository_url=PYPI_URL, build_mode='single', force_rebuild=False, version_source='tags'):
+    """Compute the release plan of the package in path.
+
+    The package, the local version, the released version, the paths that are cleaned, the artifacts
+    that are reused or build, the commit, the tag and the push, and the uploads are resolved from the
+    project files, the local git tags, the build manifest in dist/ and the artifact store. Nothing is
+    pulled, cleaned, build, committed, tagged or uploaded, and the discovery and version caches are not
+    written. With version_source='remote' or 'both' the github releases are looked up with the (cached)
+    version client.
+
+    Parameters
+    ----------
+    path : str, optional
+        Root directory of the package. The default is '.'.
+    clean, upload, repository_url, build_mode, force_rebuild, version_source
+        See :func:`irelease.pipeline.release`.
+
+    Returns
+    -------
+    plan : dict
+        path, name, package, version, released, action ('release', 'skip' or 'error'), reason,
+        build ('reuse', 'store' or 'build'), artifacts, clean, commit, tag, push, upload (targets and files), git_release,
+        warnings and time.
+
+    Examples
+    --------
+    >>> from irelease import plan
+    >>> results = plan.plan_release('.')
+
+    """
+    start = time.perf_counter()
+    path = os.path.abspath(path)
+    plan = {'path': path, 'name': None, 'package': None, 'version': None, 'released': None, 'action': 'error', 'reason': None, 'build': None, 'artifacts': [],
+            'clean': [], 'commit': [], 'tag': None, 'push': None, 'upload': None, 'git_release': None, 'warnings': [], 'time': 0.0}
+    try:
+        from irelease import builder, store
+        from irelease.irelease import _check_version
+        # The discovery and version caches are read, not written.
+        context = RepoContext.get(path, cache='read')
+        if context.packagename is None: raise Exception('Package directory does not exists.')
+        # The version is resolved like the release pipeline does, so a package that can not be released is an error.
+        from irelease.pipeline import _current_version
+        _, version = _current_version(context.project_name or context.packagename, path=path, cache='read')
+        plan.update({'name': context.project_name or context.packagename, 'package': context.packagename, 'version': version})
+        plan['released'], plan['warnings'] = _released_version(path, context, version_source)
+
+        # Version check
+        if _check_version(version, plan['released']):
+            plan['action'] = 'release'
+        else:
+            plan['action'], plan['reason'] = 'skip', 'Version %s is not newer than the released version %s. Increase it with: irelease bump patch' %(version, plan['released'])
+
+        # Build: reuse dist/, hard-link from the artifact store or build
+        existing = None if force_rebuild else builder.is_up_to_date(path, context.packagename, version)
+        if existing is not None:
+            plan['build'], plan['artifacts'] = 'reuse', [os.path.basename(a) for a in existing]
+        else:
+            key, _ = store.artifact_key(path, context.packagename, version, build_mode=build_mode)
+            metafile = os.path.join(store._entrydir(key), store.META_FILE)
+            if not force_rebuild and os.path.isfile(metafile):
+                with open(metafile, 'r') as f:
+                    plan['build'], plan['artifacts'] = 'store', sorted(json.load(f)['files'])
+            else:
+                plan['build'], plan['artifacts'] = 'build (%s)' %(build_mode), _expected_artifacts(plan['name'], version)
+            if clean:
+                from irelease.clean import find_matches
+                plan['clean'] = find_matches(path)
+
+        # Commit, tag and push
+        git = gitops.Git(path, verbose=0)
+        if context.branch is not None:
+            # Optional locks are skipped, so git status does not write the index.
+            status = git.run('--no-optional-locks', 'status', '--porcelain', check=False).stdout
+            plan['commit'] = [line[3:] for line in status.splitlines() if line.strip()]
+            if len(plan['commit'])>0: plan['warnings'].append('%d uncommitted changes are committed with the release.' %(len(plan['commit'])))
+        plan['tag'] = version
+        if version in gitops.list_tags(path): plan['warnings'].append('Tag %s already exists.' %(version))
+        if context.remote is None:
+            plan['warnings'].append('No git remote: the tag can not be pushed.')
+        else:
+            plan['push'] = '%s %s' %(context.remote, ' '.join(([] if context.branch is None else ['refs/heads/' + context.branch]) + ['refs/tags/' + version]))
+
+        # Upload and github/gitlab release
+        if upload:
+            from irelease import publish
+            targets = publish.read_targets(path, repository_url=repository_url)
+            plan['upload'] = {'targets': [{'name': t['name'], 'repository_url': t['repository_url']} for t in targets], 'files': plan['artifacts']}
+            plan['warnings'] += ['No credentials for publish target [%s].' %(t['name']) for t in targets if not t['implicit'] and t['password'] is None]
+        if context.host in ('github', 'gitlab'):
+            from irelease.gitrelease import get_token
+            plan['git_release'] = '%s api' %(context.host) if get_token(context.host) else '%s manual' %(context.host)
+    except Exception as e:
+        plan['action'], plan['reason'] = 'error', str(e)
+    plan['time'] = time.perf_counter() - start
+    return plan
+
+
+def plan_batch(paths, n_jobs=8, **kwargs):
+    """Release plans of all packages that are found in paths, computed concurrently.
+
+    Parameters
+    ----------
+    paths : list of str
+        Package directories or directories that contain packages, see :func:`irelease.batch.find_packages`.
+    n_jobs : int, optional
+        Number of packages that are planned concurrently. The default is 8.
+    **kwargs
+        See :func:`plan_release`.
+
+    Returns
+    -------
+    plans : list of dict
+        One plan per package, see :func:`plan_release`.
+
+    Examples
+    --------
+    >>> from irelease import plan
+    >>> plans = plan.plan_batch(['~/repos/'])
+    >>> plan.print_plan(plans)
+
+    """
+    from irelease.batch import find_packages
+    packages = find_packages([os.path.expanduser(p) for p in paths], verbose=0)
+    if len(packages)==0: return []
+    with ThreadPoolExecutor(max_workers=max(1, min(n_jobs, len(packages)))) as executor:
+        return list(executor.map(lambda p: plan_release(p, **kwargs), packages))
+
+
+# %% Print
+def print_plan(plans, verbose=3):
+    """Print the plans as a table, followed by the details per package when verbose>=3."""
+    print('[irelease] %-24s %-12s %-12s %-8s %-16s %s' %('package', 'version', 'released', 'action', 'build', 'push'))
+    for plan in plans:
+        print('[irelease] %-24s %-12s %-12s %-8s %-16s %s' %(plan['name'] or os.path.basename(plan['path']), plan['version'] or '-', plan['released'] or '-', plan['action'], plan['build'] or '-', plan['push'] or '-'))
+
+    for plan in plans:
+        if verbose<3 and plan['action']!='error' and len(plan['warnings'])==0: continue
+        print('[irelease] ----------------------------------------------------------------')
+        print('[irelease] %s (%s) in %.2fs' %(plan['name'] or '-', plan['path'], plan['time']))
+        if plan['reason']: print('[irelease]   %s: %s' %(plan['action'], plan['reason']))
+        if verbose>=3:
+            if plan['clean']: print('[irelease]   clean    : %s' %(', '.join(plan['clean'])))
+            if plan['artifacts']: print('[irelease]   artifacts: %s' %(', '.join(plan['artifacts'])))
+            if plan['commit']: print('[irelease]   commit   : %s' %(', '.join(plan['commit'])))
+            if plan['tag']: print('[irelease]   tag      : %s' %(plan['tag']))
+            if plan['upload']: print('[irelease]   upload   : %s' %(', '.join('%s (%s)' %(t['name'], t['repository_url']) for t in plan['upload']['targets'])))
+            if plan['git_release']: print('[irelease]   release  : %s' %(plan['git_release']))
+        for warning in plan['warnings']:
+            print('[irelease]   Warning: %s' %(warning))
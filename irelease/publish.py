@@ -0,0 +1,221 @@
+"""Publish the distribution archives to several package indexes concurrently."""
+# --------------------------------------------------
+# Name        : publish.py
+# Author      : E.Taskesen
+# Contact     : erdogant@gmail.com
+# github      : https://github.com/erdogant/irelease
+# Licence     : MIT
+# --------------------------------------------------
+
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from irelease import trace
+from irelease import upload
+
+# .pypirc files, the first file that defines a repository wins.
+PYPIRC_FILES = ['.pypirc', '~/.pypirc']
+# Upload urls of the repositories that do not need a url in the .pypirc.
+KNOWN_REPOSITORIES = {'pypi': upload.PYPI_URL, 'testpypi': 'https://test.pypi.org/legacy/'}
+RETRIES = 3
+N_JOBS = 4
+
+
+# %% Targets
+def read_pypirc(filepaths=None):
+    """Repositories of the .pypirc files.
+
+    Returns
+    -------
+    repositories : dict
+        {name: {repository, username, password}} of every section except [distutils].
+
+    """
+    import configparser
+    repositories = {}
+    for filepath in filepaths or PYPIRC_FILES:
+        filepath = os.path.expanduser(filepath)
+        if not os.path.isfile(filepath): continue
+        config = configparser.ConfigParser(interpolation=None)
+        config.read(filepath)
+        for name in config.sections():
+            if name!='distutils' and name not in repositories:
+                repositories[name] = dict(config[name])
+    return repositories
+
+
+def _env_name(name):
+    # IRELEASE_<NAME>_PASSWORD: the name in upper case with other characters than letters and digits replaced by _
+    return 'IRELEASE_' + re.sub(r'[^A-Za-z0-9]', '_', name).upper()
+
+
+def read_targets(srcdir='.', repository_url=None, pypirc=None):
+    """Repositories to publish to.
+
+    The targets are the names in ``publish`` of [tool.irelease] in the pyproject.toml. The settings of a
+    target are read from [tool.irelease.targets.<name>] and the section of the same name in the .pypirc
+    (./.pypirc, then ~/.pypirc). The credentials are read from IRELEASE_<NAME>_USERNAME and
+    IRELEASE_<NAME>_PASSWORD, the username and password of the .pypirc section and, for pypi only,
+    TWINE_USERNAME and TWINE_PASSWORD. Credentials are never passed to another target.
+
+    >>> [tool.irelease]
+    >>> publish = ["pypi", "mirror"]
+    >>>
+    >>> [tool.irelease.targets.mirror]
+    >>> repository = "https://pypi.example.com/legacy/"
+    >>> index = "https://pypi.example.com/simple/"
+    >>> retries = 5
+    >>> jobs = 2
+
+    Parameters
+    ----------
+    srcdir : str, optional
+        Root directory of the package. The default is '.'.
+    repository_url : str, optional
+        An explicit upload url, other than pypi, is the only target and gets the credentials of
+        TWINE_USERNAME and TWINE_PASSWORD. Without publish targets, pypi is the only target.
+    pypirc : list of str, optional
+        .pypirc files. The default is PYPIRC_FILES.
+
+    Returns
+    -------
+    targets : list of dict
+        name, repository_url, index_url, username, password, retries, n_jobs, skip_existing and
+        implicit (True only for the default pypi target when no targets are configured: without username and
+        password it uses the credentials of :func:`irelease.upload.get_credentials`, or the configuration of twine).
+
+    """
+    config = {}
+    filepath = os.path.join(srcdir, 'pyproject.toml')
+    if os.path.isfile(filepath):
+        import toml
+        config = toml.load(filepath).get('tool', {}).get('irelease', {})
+    names = config.get('publish', [])
+    if isinstance(names, str): names = [names]
+    if repository_url is not None and repository_url!=upload.PYPI_URL:
+        # An explicit url gets only the credentials of the environment, the pypi credentials of the .pypirc are not sent to it.
+        username, password = os.environ.get('TWINE_USERNAME'), os.environ.get('TWINE_PASSWORD')
+        if password is not None and username is None:
+            username = '__token__'
+        name = re.sub(r'^\w+://', '', repository_url).split('/')[0]
+        return [{'name': name, 'repository_url': repository_url, 'index_url': None, 'username': username, 'password': password, 'retries': RETRIES, 'n_jobs': N_JOBS, 'skip_existing': True, 'implicit': False}]
+    if len(names)==0:
+        return [{'name': 'pypi', 'repository_url': upload.PYPI_URL, 'index_url': None, 'username': None, 'password': None, 'retries': RETRIES, 'n_jobs': N_JOBS, 'skip_existing': True, 'implicit': True}]
+
+    repositories = read_pypirc(pypirc)
+    targets = []
+    for name in names:
+        settings = dict(repositories.get(name, {}))
+        settings.update(config.get('targets', {}).get(name, {}))
+        url = settings.get('repository') or KNOWN_REPOSITORIES.get(name)
+        if url is None: raise ValueError('Publish target [%s] has no repository url in [tool.irelease.targets.%s] or the .pypirc.' %(name, name))
+        username = os.environ.get(_env_name(name) + '_USERNAME') or settings.get('username')
+        password = os.environ.get(_env_name(name) + '_PASSWORD') or settings.get('password')
+        if name=='pypi' and password is None:
+            username, password = upload.get_credentials(username, password, verbose=0)
+        if password is not None and username is None:
+            username = '__token__'
+        targets.append({'name': name, 'repository_url': url, 'index_url': settings.get('index'), 'username': username, 'password': password,
+                        'retries': int(settings.get('retries', RETRIES)), 'n_jobs': int(settings.get('jobs', N_JOBS)), 'skip_existing': settings.get('skip-existing', True), 'implicit': False})
+    return targets
+
+
+# %% Publish
+def _publish_target(target, artifacts, twine=None, packagename=None, verbose=3):
+    # Upload to one target. Failures are reported in the result, they do not stop the other targets.
+    result = {'name': target['name'], 'repository_url': target['repository_url'], 'status': 'failed', 'uploaded': 0, 'skipped': 0, 'failed': 0, 'attempts': 0, 'time': 0.0, 'error': None, 'files': []}
+    start = time.perf_counter()
+    with trace.span('publish ' + target['name'], repository_url=target['repository_url']):
+        try:
+            if twine is not None:
+                _publish_twine(target, twine, packagename, result, artifacts, verbose=verbose)
+            else:
+                auth = None if target['implicit'] else (target['username'], target['password'])
+                result['files'] = upload.upload_artifacts(artifacts, repository_url=target['repository_url'], index_url=target['index_url'], username=target['username'], password=target['password'], auth=auth, n_jobs=target['n_jobs'],
+                                                          retries=target['retries'], skip_existing=target['skip_existing'], verbose=verbose)
+                for status in ('uploaded', 'skipped', 'failed'):
+                    result[status] = sum(r['status']==status for r in result['files'])
+                result['attempts'] = max([r['attempts'] for r in result['files']] or [0])
+                errors = [os.path.basename(r['file']) + ': ' + r['error'] for r in result['files'] if r['status']=='failed']
+                result['error'] = '; '.join(errors) if errors else None
+        except Exception as e:
+            result['error'], result['failed'] = str(e), max(result['failed'], 1)
+    result['time'] = time.perf_counter() - start
+    if result['failed']==0:
+        result['status'] = 'uploaded' if result['uploaded']>0 or twine is not None else 'skipped'
+    return result
+
+
+def _publish_twine(target, twine, packagename, result, artifacts, verbose=3):
+    # Twine per target, retried with exponential backoff. The implicit pypi target uses the configuration of twine,
+    # every other url is passed to twine so that it never falls back to its default repository.
+    from irelease import irelease
+    credentials = None if target['password'] is None else (target['username'] or '__token__', target['password'])
+    repository_url = None if target['implicit'] and target['repository_url']==upload.PYPI_URL else target['repository_url']
+    step = 'upload' if target['implicit'] else 'upload-' + target['name']
+    # Twine refuses --skip-existing for other repositories than pypi and testpypi.
+    skip_existing = target['skip_existing'] and target['repository_url'] in KNOWN_REPOSITORIES.values()
+    for attempt in range(target['retries'] + 1):
+        result['attempts'] = attempt + 1
+        try:
+            irelease._twine_upload(twine, artifacts=artifacts, packagename=packagename, credentials=credentials, repository_url=repository_url, skip_existing=skip_existing, step=step, verbose=verbose)
+            result['uploaded'], result['error'] = len(artifacts), None
+            return
+        except Exception as e:
+            result['error'] = str(e)
+        if attempt<target['retries']:
+            if verbose>=3: print('[irelease] Retry upload to [%s] in %.0fs' %(target['name'], 2**attempt))
+            time.sleep(2**attempt)
+    result['failed'] = 1
+
+
+def publish(artifacts, targets=None, twine=None, packagename=None, srcdir='.', repository_url=None, verbose=3):
+    """Upload the same artifacts to all targets concurrently.
+
+    Every target has its own retries, concurrency and result. A failing target does not stop the others.
+
+    Parameters
+    ----------
+    artifacts : list of str
+        Wheels and sdists to upload.
+    targets : list of dict, optional
+        Targets, see :func:`read_targets`. The default is read from srcdir.
+    twine : str, optional
+        Filepath to the executable of twine. None uploads with :func:`irelease.upload.upload_artifacts`.
+    packagename : str, optional
+        Name of the package, printed in front of the output of twine.
+    srcdir : str, optional
+        Root directory of the package. The default is '.'.
+    repository_url : str, optional
+        See :func:`read_targets`.
+    verbose : int, optional
+        Print message. The default is 3.
+
+    Returns
+    -------
+    results : list of dict
+        One result per target: name, repository_url, status ('uploaded', 'skipped' or 'failed'), the number
+        of uploaded, skipped and failed files, attempts, time, error and the results per file.
+
+    Examples
+    --------
+    >>> from irelease import publish
+    >>> results = publish.publish(glob.glob('dist/*'))
+    >>> publish.print_report(results)
+
+    """
+    if targets is None: targets = read_targets(srcdir, repository_url=repository_url)
+    if verbose>=3 and len(targets)>1: print('[irelease] Publish to %s' %(', '.join(t['name'] for t in targets)))
+    with ThreadPoolExecutor(max_workers=max(1, len(targets))) as executor:
+        results = list(executor.map(trace.bind(lambda t: _publish_target(t, artifacts, twine=twine, packagename=packagename, verbose=verbose)), targets))
+    if verbose>=3 and len(targets)>1: print_report(results)
+    return results
+
+
+def print_report(results):
+    """Print the result per target."""
+    print('[irelease] %-16s %-9s %8s %8s %7s %9s %8s  %s' %('target', 'status', 'uploaded', 'skipped', 'failed', 'attempts', 'time', 'url'))
+    for r in results:
+        print('[irelease] %-16s %-9s %8d %8d %7d %9d %7.1fs  %s' %(r['name'], r['status'], r['uploaded'], r['skipped'], r['failed'], r['attempts'], r['time'], r['repository_url']))
+        if r['error']: print('[irelease]   ERROR: %s' %(r['error']))
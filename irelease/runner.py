@@ -0,0 +1,237 @@
+"""Run external commands with streamed output, per-step log files and timeouts."""
+# --------------------------------------------------
+# Name        : runner.py
+# Author      : E.Taskesen
+# Contact     : erdogant@gmail.com
+# github      : https://github.com/erdogant/irelease
+# Licence     : MIT
+# --------------------------------------------------
+
+import os
+import sys
+import time
+import signal
+import subprocess
+import threading
+from collections import deque
+from irelease import trace
+
+# Number of output lines that are kept in memory for the error message of a failed command.
+TAIL_LINES = 50
+# Number of lines of the tail that are shown in the error message.
+TAIL_SHOWN = 15
+# A log file is rotated above this size and the last LOG_BACKUPS files are kept.
+MAX_LOG_BYTES = 1024 ** 2
+LOG_BACKUPS = 3
+# Timeout of a single command per step in seconds. Override them in the pyproject.toml:
+# [tool.irelease.timeouts]
+# build = 600
+TIMEOUTS = {'git_pull': 300, 'git_commit': 300, 'git_tag': 300, 'git_push': 300, 'build': 3600, 'install': 900, 'upload': 1800}
+DEFAULT_TIMEOUT = 3600
+
+
+class CommandFailed(subprocess.CalledProcessError):
+    """Raised when a command exits with an error or exceeds its timeout. The message ends with the tail of the output."""
+
+    def __init__(self, returncode, cmd, tail=None, logfile=None, timeout=None):
+        super().__init__(returncode, cmd, output='\n'.join(tail or []))
+        self.tail, self.logfile, self.timeout = list(tail or []), logfile, timeout
+
+    def __reduce__(self):
+        return (CommandFailed, (self.returncode, self.cmd, self.tail, self.logfile, self.timeout))
+
+    def __str__(self):
+        name = self.cmd if isinstance(self.cmd, str) else ' '.join(self.cmd)
+        reason = 'timed out after %ss' %(self.timeout) if self.timeout else 'failed with exit code %s' %(self.returncode)
+        message = '%s %s' %(name, reason) + (' (log: %s)' %(self.logfile) if self.logfile else '')
+        return message + ''.join('\n  | ' + line for line in self.tail[-TAIL_SHOWN:])
+
+
+# %% Configuration
+def step_timeout(step, srcdir='.'):
+    """Timeout of the commands of step: [tool.irelease.timeouts] of the pyproject.toml, TIMEOUTS or DEFAULT_TIMEOUT.
+
+    A step <step>-<name>, like upload-mirror, has the timeout of <step> unless it has its own.
+    """
+    timeouts = dict(TIMEOUTS)
+    filepath = os.path.join(srcdir, 'pyproject.toml')
+    if os.path.isfile(filepath):
+        import toml
+        timeouts.update(toml.load(filepath).get('tool', {}).get('irelease', {}).get('timeouts', {}))
+    return timeouts.get(step, timeouts.get(step.split('-')[0], DEFAULT_TIMEOUT))
+
+
+def log_dir(package=None, srcdir='.'):
+    """Directory with the log files of package.
+
+    The logs are stored in the .git directory (shared by all worktrees) so that they are never committed and survive the clean step.
+    """
+    from irelease.context import RepoContext, common_gitdir
+    gitdir = RepoContext.get(srcdir).gitdir
+    root = os.path.join(common_gitdir(gitdir), 'irelease', 'logs') if gitdir is not None else os.path.join(srcdir, '.irelease_logs')
+    return os.path.join(root, package) if package else root
+
+
+# %% Logs
+class StepLog:
+    """Output of the commands of a step: appended to a rotating log file, kept in a ring buffer and printed with a prefix.
+
+    Parameters
+    ----------
+    step : str
+        Name of the step, also the name of the log file: <step>.log.
+    package : str, optional
+        Name of the package, printed in front of every line with the step: '[irelease] [package:step] line'.
+    logdir : str, optional
+        Directory of the log file. The default is :func:`log_dir`. False disables the log file.
+    verbose : int, optional
+        Print the output when verbose>=3. The default is 3.
+
+    """
+
+    def __init__(self, step, package=None, logdir=None, verbose=3):
+        self.step, self.package, self.verbose = step, package, verbose
+        self.prefix = '[irelease] [%s] ' %(package + ':' + step if package else step)
+        self.tail = deque(maxlen=TAIL_LINES)
+        self.logfile = None
+        self._file = None
+        self._lock = threading.Lock()
+        if logdir is not False:
+            try:
+                logdir = logdir or log_dir(package)
+                os.makedirs(logdir, exist_ok=True)
+                self.logfile = os.path.join(logdir, step + '.log')
+                _rotate(self.logfile)
+                self._file = open(self.logfile, 'a', encoding='utf-8', errors='replace')
+            except OSError as e:
+                if verbose>=2: print('[irelease] Warning: log file of [%s] can not be written: %s' %(step, e))
+                self.logfile = None
+
+    def start(self, command):
+        """Write the header of a command to the log."""
+        name = command if isinstance(command, str) else ' '.join(command)
+        self._log('==== %s  %s\n' %(time.strftime('%Y-%m-%d %H:%M:%S'), name))
+
+    def write(self, line):
+        """Add a line of output."""
+        line = line.rstrip('\r\n')
+        with self._lock:
+            self.tail.append(line)
+        self._log(line + '\n')
+        if self.verbose>=3: print(self.prefix + line, flush=True)
+
+    def finish(self, returncode, duration):
+        self._log('==== exit code %s in %.1fs\n' %(returncode, duration))
+
+    def _log(self, text):
+        if self._file is not None:
+            with self._lock:
+                self._file.write(text)
+                self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _rotate(logfile):
+    # step.log -> step.log.1 -> step.log.2 .. -> removed
+    if not os.path.isfile(logfile) or os.path.getsize(logfile)<MAX_LOG_BYTES: return
+    for i in range(LOG_BACKUPS - 1, 0, -1):
+        if os.path.isfile('%s.%d' %(logfile, i)): os.replace('%s.%d' %(logfile, i), '%s.%d' %(logfile, i + 1))
+    os.replace(logfile, logfile + '.1')
+
+
+# %% Run
+def _kill(process, killed=None):
+    # Kill the command and everything it started, like the programs of a shell command.
+    if killed is not None: killed.set()
+    try:
+        if sys.platform!='win32':
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except OSError:
+        pass
+
+
+def run(command, step, package=None, cwd=None, env=None, timeout=None, log=None, check=True, verbose=3):
+    """Run a command and stream its output line by line into the log of step.
+
+    Parameters
+    ----------
+    command : list of str or str
+        Command, a str is run in the shell.
+    step : str
+        Name of the step, see :class:`StepLog`.
+    package : str, optional
+        Name of the package, printed in front of the output with the step.
+    cwd : str, optional
+        Working directory.
+    env : dict, optional
+        Environment. The default is the current environment.
+    timeout : float, optional
+        Kill the command after this many seconds. The default is :func:`step_timeout`.
+    log : StepLog, optional
+        Write the output to this log. The default is a new log of step.
+    check : bool, optional
+        Raise :class:`CommandFailed` when the command fails or times out. The default is True.
+    verbose : int, optional
+        Print the output when verbose>=3. The default is 3.
+
+    Returns
+    -------
+    results : dict
+        returncode, tail (the last lines of the output), logfile, time and timed_out.
+
+    Examples
+    --------
+    >>> from irelease import runner
+    >>> results = runner.run(['git', 'pull'], 'git_pull', package='pca')
+
+    """
+    timeout = step_timeout(step, cwd or '.') if timeout is None else timeout
+    steplog = log or StepLog(step, package=package, verbose=verbose)
+    name = command if isinstance(command, str) else ' '.join(command)
+    start = time.perf_counter()
+    try:
+        with trace.span(' '.join(name.split()[:2]), command=name, step=step) as event:
+            steplog.start(command)
+            process = subprocess.Popen(command, shell=isinstance(command, str), cwd=cwd, env=env, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                       text=True, errors='replace', start_new_session=sys.platform!='win32')
+            killed = threading.Event()
+            timer = threading.Timer(timeout, _kill, [process, killed]) if timeout else None
+            if timer is not None: timer.start()
+            try:
+                for line in process.stdout:
+                    steplog.write(line)
+                process.wait()
+            finally:
+                if timer is not None: timer.cancel()
+                process.stdout.close()
+            timed_out = killed.is_set()
+            event['returncode'], event['timed_out'] = process.returncode, timed_out
+            steplog.finish(process.returncode, time.perf_counter() - start)
+    finally:
+        if log is None: steplog.close()
+
+    results = {'returncode': process.returncode, 'tail': list(steplog.tail), 'logfile': steplog.logfile, 'time': time.perf_counter() - start, 'timed_out': timed_out}
+    if check and (process.returncode!=0 or timed_out):
+        raise CommandFailed(process.returncode, command, tail=results['tail'], logfile=steplog.logfile, timeout=timeout if timed_out else None)
+    return results
+
+
+def hook_runner(step, package=None, verbose=3):
+    """Runner for the build backend hooks (pyproject_hooks) that streams their output into the log of step."""
+    def runner(cmd, cwd=None, extra_environ=None):
+        env = os.environ.copy()
+        env.update(extra_environ or {})
+        run(cmd, step, package=package, cwd=cwd, env=env, verbose=verbose)
+    return runner
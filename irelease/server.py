@@ -0,0 +1,346 @@
+"""Release daemon: a job queue with a local HTTP (or Unix socket) API and warm worker processes."""
+# --------------------------------------------------
+# Name        : server.py
+# Author      : E.Taskesen
+# Contact     : erdogant@gmail.com
+# github      : https://github.com/erdogant/irelease
+# Licence     : MIT
+# --------------------------------------------------
+
+import os
+import re
+import json
+import time
+import secrets
+import socketserver
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from concurrent.futures import ProcessPoolExecutor
+
+DEFAULT_PORT = 8765
+# Options of a job and their defaults, see :func:`irelease.batch.release_package`. The executable of twine and the
+# upload url are not options: a job can not run another program or send the credentials to another index.
+JOB_OPTIONS = {'package': None, 'clean': True, 'upload': True, 'build_mode': 'single', 'force_rebuild': False, 'version_source': 'tags', 'resume': False, 'worktree': False, 'verbose': 1}
+# Host headers that are accepted, other hosts are rejected against DNS rebinding from a browser.
+LOCAL_HOSTS = ['localhost', '127.0.0.1', '::1']
+# Number of finished jobs that are kept for the status API.
+MAX_FINISHED = 1000
+
+
+# %% Workers
+def _warm():
+    # Import everything a release needs once per worker process, not once per job.
+    import importlib
+    for name in ['batch', 'builder', 'lookup', 'verify', 'upload', 'gitrelease']:
+        importlib.import_module('irelease.' + name)
+
+
+def _run_job(path, options):
+    from irelease import batch
+    options = dict(options)
+    return batch.release_package(path, packagename=options.pop('package'), **options)
+
+
+# %% Server
+class ReleaseServer:
+    """Long-running release server with a job queue.
+
+    Jobs run in worker processes that are kept alive between jobs, so the imports, the parsed
+    repository contexts and the version lookups stay warm. The build environments and the artifacts are
+    cached on disk. Jobs of the same directory run one after another, unless they use a worktree.
+
+    Parameters
+    ----------
+    host : str, optional
+        Address to listen on. The default is '127.0.0.1'.
+    port : int, optional
+        Port number, 0 picks a free port. The default is 8765.
+    socket_path : str, optional
+        Listen on this Unix socket instead of host and port.
+    n_jobs : int, optional
+        Number of jobs that run concurrently. The default is 2.
+    token : str, optional
+        Require 'Authorization: Bearer <token>'. The default is read from IRELEASE_SERVER_TOKEN. Without a
+        token, the server on host and port generates one and prints it at the start. The Unix socket can only
+        be used by its owner and does not need a token.
+    verbose : int, optional
+        Print message. The default is 3.
+
+    Examples
+    --------
+    >>> from irelease.server import ReleaseServer
+    >>> with ReleaseServer(port=0) as server:
+    >>>     job = server.submit('~/repos/pca', upload=False)
+
+    """
+
+    def __init__(self, host='127.0.0.1', port=DEFAULT_PORT, socket_path=None, n_jobs=2, token=None, verbose=3):
+        self.host, self.port, self.socket_path = host, port, socket_path
+        self.n_jobs = max(1, n_jobs)
+        self.token = token or os.environ.get('IRELEASE_SERVER_TOKEN')
+        self.generated_token = self.token is None and socket_path is None
+        if self.generated_token: self.token = secrets.token_urlsafe(32)
+        self.verbose = verbose
+        self.jobs = {}
+        self._counter = 0
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._httpd, self._executor, self._threads = None, None, []
+        self.started = None
+
+    @property
+    def url(self):
+        if self.socket_path is not None: return 'unix:' + self.socket_path
+        return 'http://%s:%d/' %(self._httpd.server_address[0], self._httpd.server_address[1])
+
+    # Jobs
+    def submit(self, path, **options):
+        """Queue a release of the package in path. Returns the job."""
+        unknown = [k for k in options if k not in JOB_OPTIONS]
+        if len(unknown)>0: raise ValueError('Unknown options: %s' %(', '.join(unknown)))
+        if options.get('resume') and options.get('worktree'):
+            from irelease.gitops import WORKTREE_RESUME
+            raise ValueError(WORKTREE_RESUME)
+        path = os.path.abspath(os.path.expanduser(path))
+        if not os.path.isdir(path): raise ValueError('Directory does not exists: %s' %(path))
+        with self._cond:
+            self._counter += 1
+            job = {'id': str(self._counter), 'path': path, 'options': dict(JOB_OPTIONS, **options), 'status': 'queued', 'package': None, 'version': None,
+                   'error': None, 'submitted': time.time(), 'started': None, 'finished': None, 'queue_time': None, 'run_time': None, 'timings': {}}
+            self.jobs[job['id']] = job
+            if self.verbose>=3: print('[irelease] [job %s] queued: %s' %(job['id'], path))
+            self._cond.notify_all()
+            return dict(job)
+
+    def get(self, job_id):
+        """The job with job_id, None when it does not exist."""
+        with self._cond:
+            job = self.jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def list_jobs(self, status=None):
+        """All jobs, oldest first."""
+        with self._cond:
+            return [dict(j) for j in self.jobs.values() if status is None or j['status']==status]
+
+    def cancel(self, job_id):
+        """Cancel a queued job. Running jobs are not stopped. Returns the job."""
+        with self._cond:
+            job = self.jobs.get(job_id)
+            if job is not None and job['status']=='queued':
+                job['status'], job['finished'] = 'cancelled', time.time()
+            return dict(job) if job is not None else None
+
+    def stats(self):
+        """Uptime, workers and the number of jobs per status."""
+        with self._cond:
+            counts = {}
+            for job in self.jobs.values():
+                counts[job['status']] = counts.get(job['status'], 0) + 1
+            finished = [j['run_time'] for j in self.jobs.values() if j['run_time'] is not None]
+        return {'status': 'ok', 'pid': os.getpid(), 'uptime': time.time() - self.started if self.started else 0.0, 'workers': self.n_jobs, 'jobs': counts,
+                'mean_run_time': sum(finished) / len(finished) if finished else None}
+
+    def _next(self):
+        # The oldest queued job whose directory is not in use by a running job.
+        running = [j['path'] for j in self.jobs.values() if j['status']=='running' and not j['options']['worktree']]
+        if sum(j['status']=='running' for j in self.jobs.values())>=self.n_jobs: return None
+        for job in self.jobs.values():
+            if job['status']=='queued' and (job['options']['worktree'] or job['path'] not in running):
+                return job
+        return None
+
+    def _dispatch(self):
+        while True:
+            with self._cond:
+                job = self._next()
+                while job is None and not self._stopped:
+                    self._cond.wait()
+                    job = self._next()
+                if self._stopped: return
+                job['status'], job['started'] = 'running', time.time()
+                job['queue_time'] = job['started'] - job['submitted']
+            if self.verbose>=3: print('[irelease] [job %s] started: %s' %(job['id'], job['path']))
+            future = self._executor.submit(_run_job, job['path'], job['options'])
+            future.add_done_callback(lambda f, job=job: self._done(job, f))
+
+    def _done(self, job, future):
+        try:
+            result = future.result()
+            status, error = result['status'], result['error']
+        except Exception as e:
+            result, status, error = {}, 'failed', str(e)
+        with self._cond:
+            job.update({'status': status, 'error': error, 'package': result.get('package'), 'version': result.get('version'), 'timings': result.get('timings', {}), 'finished': time.time()})
+            job['run_time'] = job['finished'] - job['started']
+            # Forget the oldest finished jobs
+            finished = [j['id'] for j in self.jobs.values() if j['finished'] is not None]
+            for job_id in finished[:max(0, len(finished) - MAX_FINISHED)]:
+                del self.jobs[job_id]
+            self._cond.notify_all()
+        if self.verbose>=3: print('[irelease] [job %s] %s %s %s in %.1fs%s' %(job['id'], status, job['package'], job['version'], job['run_time'], ': ' + error if error else ''))
+
+    # Lifecycle
+    def start(self):
+        """Start the workers, the dispatcher and the API in background threads."""
+        self._executor = ProcessPoolExecutor(max_workers=self.n_jobs, initializer=_warm)
+        if self.socket_path is not None:
+            if os.path.exists(self.socket_path): os.remove(self.socket_path)
+            self._httpd = _UnixHTTPServer(self.socket_path, _APIHandler)
+            # Only the owner can submit jobs
+            os.chmod(self.socket_path, 0o600)
+        else:
+            self._httpd = ThreadingHTTPServer((self.host, self.port), _APIHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.release_server = self
+        self._threads = [threading.Thread(target=self._httpd.serve_forever, daemon=True), threading.Thread(target=self._dispatch, daemon=True)]
+        for thread in self._threads: thread.start()
+        self.started = time.time()
+        if self.verbose>=3: print('[irelease] Release server on %s with %d workers.' %(self.url, self.n_jobs))
+        if self.verbose>=1 and self.generated_token: print('[irelease] Token of the release server: %s' %(self.token))
+        return self
+
+    def stop(self):
+        """Stop accepting jobs, wait for the running jobs and stop the workers."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        if self.socket_path is not None and os.path.exists(self.socket_path): os.remove(self.socket_path)
+
+    def serve_forever(self):
+        """Start and block until interrupted."""
+        self.start()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            if self.verbose>=3: print('[irelease] Stopping the release server..')
+        finally:
+            self.stop()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    pass
+
+
+# %% API
+class _APIHandler(BaseHTTPRequestHandler):
+    """JSON API.
+
+    GET /health, GET /jobs[?status=], GET /jobs/<id>, POST /jobs {"path": ..., options}, DELETE /jobs/<id>.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def address_string(self):
+        # Unix sockets have no client address
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def _send(self, status, data):
+        data = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _authorized(self):
+        server = self.server.release_server
+        # Host without port, [::1]:8765 -> ::1
+        host = re.sub(r':\d+$', '', self.headers.get('Host', '')).strip('[]').lower()
+        if host not in LOCAL_HOSTS + [server.host]:
+            self._send(403, {'message': 'Host is not allowed: %s' %(host)})
+            return False
+        if server.token is None or secrets.compare_digest(self.headers.get('Authorization', ''), 'Bearer ' + server.token): return True
+        self._send(401, {'message': 'Bad credentials'})
+        return False
+
+    def do_GET(self):
+        if not self._authorized(): return
+        server = self.server.release_server
+        path, _, query = self.path.partition('?')
+        match = re.match(r'^/jobs/([^/]+)$', path)
+        if path=='/health':
+            return self._send(200, server.stats())
+        if path=='/jobs':
+            status = dict(p.split('=', 1) for p in query.split('&') if '=' in p).get('status')
+            return self._send(200, server.list_jobs(status=status))
+        if match and server.get(match.group(1)) is not None:
+            return self._send(200, server.get(match.group(1)))
+        self._send(404, {'message': 'Not Found'})
+
+    def do_POST(self):
+        if not self._authorized(): return
+        if self.path!='/jobs': return self._send(404, {'message': 'Not Found'})
+        # Browsers send forms without a preflight request, but not json.
+        if self.headers.get_content_type()!='application/json': return self._send(415, {'message': 'Content-Type must be application/json'})
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            options = json.loads(self.rfile.read(length) or b'{}')
+            job = self.server.release_server.submit(options.pop('path'), **options)
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            return self._send(400, {'message': str(e)})
+        self._send(202, job)
+
+    def do_DELETE(self):
+        if not self._authorized(): return
+        match = re.match(r'^/jobs/([^/]+)$', self.path)
+        job = self.server.release_server.cancel(match.group(1)) if match else None
+        if job is None: return self._send(404, {'message': 'Not Found'})
+        self._send(200, job)
+
+
+# %% Client
+def submit(path, server='http://127.0.0.1:%d/' %(DEFAULT_PORT), token=None, wait=False, interval=1.0, **options):
+    """Submit a release to a running server.
+
+    Parameters
+    ----------
+    path : str
+        Package directory on the machine of the server.
+    server : str, optional
+        Url of the server. The default is http://127.0.0.1:8765/.
+    token : str, optional
+        Token of the server, printed when the server starts. The default is read from IRELEASE_SERVER_TOKEN.
+    wait : bool, optional
+        Wait until the job is finished. The default is False.
+    interval : float, optional
+        Seconds between the status requests while waiting. The default is 1.
+    **options
+        Options of the job, see JOB_OPTIONS.
+
+    Returns
+    -------
+    job : dict
+        The job, with the final status when wait=True.
+
+    Examples
+    --------
+    >>> from irelease import server
+    >>> job = server.submit('/home/ci/repos/pca', upload=False, wait=True)
+
+    """
+    from irelease.httpclient import HTTPClient
+    token = token or os.environ.get('IRELEASE_SERVER_TOKEN')
+    http = HTTPClient(timeout=30, headers={'Authorization': 'Bearer ' + token} if token else None)
+    url = server.rstrip('/') + '/jobs'
+    response = http.request('POST', url, body=dict(options, path=path))
+    if not response.ok: raise Exception('Job is not submitted: HTTP %d %s' %(response.status, response.text()[:200]))
+    job = response.json()
+    while wait and job['status'] in ('queued', 'running'):
+        time.sleep(interval)
+        job = http.request('GET', '%s/%s' %(url, job['id'])).json()
+    http.close()
+    return job
@@ -0,0 +1,211 @@
+"""Local content-addressed store of build artifacts, shared by all checkouts and runs on a machine."""
+# --------------------------------------------------
+# Name        : store.py
+# Author      : E.Taskesen
+# Contact     : erdogant@gmail.com
+# github      : https://github.com/erdogant/irelease
+# Licence     : MIT
+# --------------------------------------------------
+
+import os
+import json
+import time
+import hashlib
+import shutil
+import tempfile
+from irelease import trace
+from irelease.builder import CACHE_DIR, _file_hash, _write_json
+
+META_FILE = '.irelease-store.json'
+# Maximum size of the store in bytes. The least recently used entries are removed above it.
+MAX_SIZE = 1024 ** 3
+
+
+# %% Keys
+def artifact_key(srcdir, packagename, version, build_mode='single'):
+    """Key of the artifacts of a build.
+
+    The key is the hash of the git commit, the source hash of the package (so uncommitted changes give
+    another key), the package name, the version and the build configuration: build mode, build-system
+    table, python version and platform.
+
+    Returns
+    -------
+    key : str
+        sha256 hex digest.
+    meta : dict
+        The data of the key.
+
+    """
+    from irelease import builder
+    from irelease.gitops import Git
+    process = Git(srcdir, verbose=0).run('rev-parse', 'HEAD', check=False)
+    meta = {'commit': process.stdout.strip() if process.returncode==0 else None,
+            'source': builder.source_hash(srcdir, packagename, version),
+            'package': packagename,
+            'version': version,
+            'build_mode': build_mode,
+            'build_env': builder.env_key(builder.build_system(srcdir))}
+    return hashlib.sha256(json.dumps(meta, sort_keys=True).encode()).hexdigest(), meta
+
+
+def _entrydir(key, cachedir=None):
+    return os.path.join(cachedir or CACHE_DIR, 'artifacts', key[:2], key)
+
+
+# %% Get and put
+def get(key, outdir='dist', cachedir=None, verbose=3):
+    """Hard-link (or copy) the artifacts of key from the store into outdir.
+
+    The files in the store are read-only and are checked against their sha256 before they are used.
+    A damaged entry is removed and counts as a miss.
+
+    Returns
+    -------
+    artifacts : list of str or None
+        Paths of the artifacts in outdir, None on a miss.
+
+    """
+    entrydir = _entrydir(key, cachedir)
+    metafile = os.path.join(entrydir, META_FILE)
+    if not os.path.isfile(metafile): return None
+    with trace.span('store get') as event:
+        with open(metafile, 'r') as f:
+            meta = json.load(f)
+        for name, digest in meta['files'].items():
+            filepath = os.path.join(entrydir, name)
+            if not os.path.isfile(filepath) or _file_hash(filepath)!=digest:
+                if verbose>=2: print('[irelease] Warning: artifact store entry [%s] is damaged and removed.' %(key[:12]))
+                _remove(entrydir)
+                return None
+
+        os.makedirs(outdir, exist_ok=True)
+        artifacts, event['linked'] = [], 0
+        for name in sorted(meta['files']):
+            target = os.path.join(outdir, name)
+            if os.path.lexists(target): os.remove(target)
+            try:
+                os.link(os.path.join(entrydir, name), target)
+                event['linked'] += 1
+            except OSError:
+                # Another filesystem, or hard links are not supported
+                shutil.copy2(os.path.join(entrydir, name), target)
+            artifacts.append(target)
+
+    meta['last_used'], meta['hits'] = time.time(), meta.get('hits', 0) + 1
+    _write_json(metafile, meta)
+    if verbose>=3: print('[irelease] Reuse artifacts of %s %s from the store [%s]: %s' %(meta['package'], meta['version'], key[:12], ', '.join(sorted(meta['files']))))
+    return artifacts
+
+
+def put(key, artifacts, meta=None, cachedir=None, max_size=MAX_SIZE, verbose=3):
+    """Copy the artifacts into the store under key and remove the least recently used entries above max_size.
+
+    The entry is written to a temporary directory first and moved in place, so concurrent releases never
+    see a half-written entry. When the key is already stored, the existing entry is kept.
+
+    Returns
+    -------
+    entrydir : str
+        Directory of the entry.
+
+    """
+    entrydir = _entrydir(key, cachedir)
+    if os.path.isfile(os.path.join(entrydir, META_FILE)): return entrydir
+    with trace.span('store put'):
+        os.makedirs(os.path.dirname(entrydir), exist_ok=True)
+        tmpdir = tempfile.mkdtemp(prefix=key[:12] + '.tmp-', dir=os.path.dirname(entrydir))
+        files = {}
+        for artifact in artifacts:
+            target = os.path.join(tmpdir, os.path.basename(artifact))
+            shutil.copy2(artifact, target)
+            # Read-only: the files are hard-linked into dist/ directories.
+            os.chmod(target, 0o444)
+            files[os.path.basename(artifact)] = _file_hash(target)
+        data = dict(meta or {})
+        data.update({'key': key, 'files': files, 'size': sum(os.path.getsize(os.path.join(tmpdir, f)) for f in files), 'created': time.time(), 'last_used': time.time(), 'hits': 0})
+        _write_json(os.path.join(tmpdir, META_FILE), data)
+        try:
+            os.rename(tmpdir, entrydir)
+        except OSError:
+            # Another process was first.
+            shutil.rmtree(tmpdir, ignore_errors=True)
+    if verbose>=4: print('[irelease] Artifacts are stored [%s]' %(key[:12]))
+    prune(cachedir=cachedir, max_size=max_size, keep=[key], verbose=verbose)
+    return entrydir
+
+
+# %% Maintenance
+def list_entries(cachedir=None):
+    """List the entries of the store, most recently used first."""
+    storedir = os.path.join(cachedir or CACHE_DIR, 'artifacts')
+    entries = []
+    if not os.path.isdir(storedir): return entries
+    for prefix in os.scandir(storedir):
+        if not prefix.is_dir(): continue
+        for entry in os.scandir(prefix.path):
+            metafile = os.path.join(entry.path, META_FILE)
+            if entry.is_dir() and os.path.isfile(metafile):
+                with open(metafile, 'r') as f:
+                    meta = json.load(f)
+                meta['path'] = entry.path
+                entries.append(meta)
+    return sorted(entries, key=lambda e: e.get('last_used', 0), reverse=True)
+
+
+def prune(cachedir=None, max_size=MAX_SIZE, keep=None, verbose=3):
+    """Remove the least recently used entries until the store is at most max_size bytes.
+
+    Returns
+    -------
+    removed : list of str
+        Keys of the removed entries.
+
+    """
+    keep = keep or []
+    removed, total = [], 0
+    for entry in list_entries(cachedir):
+        if entry['key'] not in keep and total + entry.get('size', 0)>max_size:
+            if verbose>=3: print('[irelease] Remove %s %s from the artifact store [%s]' %(entry.get('package'), entry.get('version'), entry['key'][:12]))
+            _remove(entry['path'])
+            removed.append(entry['key'])
+        else:
+            total = total + entry.get('size', 0)
+    return removed
+
+
+def _remove(path):
+    # The files are read-only, which does not matter for the removal on posix but does on windows.
+    for root, _, files in os.walk(path):
+        for f in files:
+            os.chmod(os.path.join(root, f), 0o644)
+    shutil.rmtree(path, ignore_errors=True)
+    try:
+        os.rmdir(os.path.dirname(path))
+    except OSError:
+        # Other entries with the same prefix
+        pass
+
+
+def stats(cachedir=None, verbose=3):
+    """Number of entries, size and hits of the artifact store and the cached build environments.
+
+    Returns
+    -------
+    results : dict
+        artifacts : {entries, size, hits, max_size, items}.
+        build_envs : {entries, size}.
+
+    """
+    from irelease import builder
+    entries, envs = list_entries(cachedir), builder.list_envs(cachedir)
+    results = {'artifacts': {'entries': len(entries), 'size': sum(e.get('size', 0) for e in entries), 'hits': sum(e.get('hits', 0) for e in entries), 'max_size': MAX_SIZE, 'items': entries},
+               'build_envs': {'entries': len(envs), 'size': sum(e.get('size', 0) for e in envs)}}
+    if verbose>=3:
+        from irelease.clean import _format_bytes
+        print('[irelease] Cache: %s' %(cachedir or CACHE_DIR))
+        print('[irelease] Artifacts : %d entries, %s of %s, %d hits' %(len(entries), _format_bytes(results['artifacts']['size']), _format_bytes(MAX_SIZE), results['artifacts']['hits']))
+        for e in entries:
+            print('[irelease]   %-12s %-20s %-10s %9s %4d hits  last used %s' %(e['key'][:12], e.get('package'), e.get('version'), _format_bytes(e.get('size', 0)), e.get('hits', 0), time.strftime('%Y-%m-%d %H:%M', time.localtime(e.get('last_used', 0)))))
+        print('[irelease] Build envs: %d entries, %s' %(len(envs), _format_bytes(results['build_envs']['size'])))
+    return results
@@ -0,0 +1,199 @@
+"""Timing spans of the release stages, written to a json(l) trace file."""
+# --------------------------------------------------
+# Name        : trace.py
+# Author      : E.Taskesen
+# Contact     : erdogant@gmail.com
+# github      : https://github.com/erdogant/irelease
+# Licence     : MIT
+# --------------------------------------------------
+
+import os
+import json
+import time
+import threading
+import itertools
+import contextvars
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows: the peak memory of child processes is not reported.
+    resource = None
+
+# Child processes (batch releases) write to the same trace file.
+TRACE_ENV = 'IRELEASE_TRACE_FILE'
+_TRACER = None
+_LOCK = threading.Lock()
+# Name and id of the innermost open span. A context variable is per thread and per asyncio task.
+_PARENT = contextvars.ContextVar('irelease_span', default=(None, None))
+# Span ids are unique per process, the pid makes them unique in a trace file of several processes.
+_IDS = itertools.count(1)
+
+
+class Tracer:
+    """Collect spans and append them as json lines to filepath.
+
+    Parameters
+    ----------
+    filepath : str
+        Trace file. Every finished span is appended as one json line.
+
+    """
+
+    def __init__(self, filepath):
+        self.filepath = os.path.abspath(filepath)
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def write(self, event):
+        with self._lock:
+            self.spans.append(event)
+            # Open in append mode for every event so that forked processes can write to the same file.
+            with open(self.filepath, 'a') as f:
+                f.write(json.dumps(event) + '\n')
+
+
+def start(filepath):
+    """Start tracing to filepath. Use a '.json' extension for a json list instead of json lines."""
+    global _TRACER
+    if filepath is None: return None
+    with _LOCK:
+        _TRACER = Tracer(filepath)
+        # Start with an empty file
+        open(_TRACER.filepath, 'w').close()
+        os.environ[TRACE_ENV] = _TRACER.filepath
+    return _TRACER
+
+
+def stop():
+    """Stop tracing. A trace file with the '.json' extension is rewritten as one json list.
+
+    Returns
+    -------
+    spans : list of dict
+        All spans in the trace file, also those of child processes.
+
+    """
+    global _TRACER
+    with _LOCK:
+        tracer, _TRACER = _TRACER, None
+        os.environ.pop(TRACE_ENV, None)
+    if tracer is None: return []
+    spans = read(tracer.filepath)
+    if tracer.filepath.endswith('.json'):
+        with open(tracer.filepath, 'w') as f:
+            json.dump(spans, f, indent=2)
+    return spans
+
+
+def read(filepath):
+    """Read the spans of a json or json lines trace file."""
+    with open(filepath, 'r') as f:
+        text = f.read()
+    if text.lstrip().startswith('['):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()!='']
+
+
+def _tracer():
+    global _TRACER
+    if _TRACER is None and os.environ.get(TRACE_ENV):
+        # A child process of a traced run (spawned): append to the same file.
+        with _LOCK:
+            if _TRACER is None: _TRACER = Tracer(os.environ[TRACE_ENV])
+    return _TRACER
+
+
+def bind(func):
+    """Wrap func so that its spans are children of the current span when it runs in a worker thread.
+
+    Examples
+    --------
+    >>> with trace.span('upload'):
+    >>>     results = executor.map(trace.bind(upload_file), files)
+
+    """
+    context = contextvars.copy_context()
+    # A context can not be entered by two threads at once: every call runs in its own copy.
+    return lambda *args, **kwargs: context.copy().run(func, *args, **kwargs)
+
+
+def _child_maxrss():
+    # Peak resident memory of the largest child process that has finished, in kB.
+    if resource is None: return None
+    maxrss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # Linux reports kB, macOS bytes
+    return maxrss // 1024 if os.uname().sysname=='Darwin' else maxrss
+
+
+@contextmanager
+def span(name, **attrs):
+    """Time the enclosed code as a span.
+
+    Nothing is recorded when tracing has not been started, so spans can be used everywhere.
+    The span is yielded as a dict to which attributes can be added, e.g. the exit code.
+
+    Parameters
+    ----------
+    name : str
+        Name of the span, e.g. 'build' or 'git push'.
+    **attrs
+        Extra attributes that are stored with the span.
+
+    Examples
+    --------
+    >>> with trace.span('build', package='pca') as event:
+    >>>     event['files'] = build()
+
+    """
+    tracer = _tracer()
+    if tracer is None:
+        yield {}
+        return
+    parent, parent_id = _PARENT.get()
+    event = {'name': name, 'id': '%d-%d' %(os.getpid(), next(_IDS)), 'parent': parent, 'parent_id': parent_id, 'start': time.time(), 'pid': os.getpid(), 'thread': threading.current_thread().name, 'status': 'ok'}
+    event.update(attrs)
+    token = _PARENT.set((name, event['id']))
+    start = time.perf_counter()
+    try:
+        yield event
+    except BaseException as e:
+        event['status'] = 'error'
+        event['error'] = str(e)
+        raise
+    finally:
+        _PARENT.reset(token)
+        event['duration'] = time.perf_counter() - start
+        event['child_maxrss_kb'] = _child_maxrss()
+        tracer.write(event)
+
+
+def summary(spans, verbose=3):
+    """Print the total duration per span name, slowest first."""
+    totals = {}
+    for s in spans:
+        total = totals.setdefault(s['name'], [0, 0.0])
+        total[0], total[1] = total[0] + 1, total[1] + s['duration']
+    if verbose>=3:
+        print('[irelease] ================================================================')
+        print('[irelease] %-40s %6s %10s' %('span', 'count', 'time (s)'))
+        for name, (count, duration) in sorted(totals.items(), key=lambda t: -t[1][1]):
+            print('[irelease] %-40s %6d %10.2f' %(name[:40], count, duration))
+        print('[irelease] ================================================================')
+    return totals
+
+
+# %% Profiling
+def profile(func, filepath='irelease.prof', verbose=3):
+    """Run func with cProfile, store the stats in filepath and print the top 20 functions."""
+    import cProfile
+    import pstats
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func)
+    finally:
+        profiler.dump_stats(filepath)
+        if verbose>=3:
+            pstats.Stats(filepath).sort_stats('cumulative').print_stats(20)
+            print('[irelease] Profile is written to %s' %(filepath))
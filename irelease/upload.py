@@ -0,0 +1,238 @@
+"""Upload distribution archives to PyPi, or any other index, concurrently."""
+# --------------------------------------------------
+# Name        : upload.py
+# Author      : E.Taskesen
+# Contact     : erdogant@gmail.com
+# github      : https://github.com/erdogant/irelease
+# Licence     : MIT
+# --------------------------------------------------
+
+import os
+import re
+import time
+import uuid
+import base64
+import hashlib
+import tarfile
+import zipfile
+from email.parser import HeaderParser
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+from irelease import trace
+from irelease.httpclient import HTTPClient
+from irelease.irelease import get_pypi_credentials
+
+PYPI_URL = 'https://upload.pypi.org/legacy/'
+# Index (simple API) of the known upload urls
+INDEX_URLS = {'https://upload.pypi.org/legacy/': 'https://pypi.org/simple/',
+              'https://test.pypi.org/legacy/': 'https://test.pypi.org/simple/'}
+# Metadata fields that have another name in the upload form.
+FORM_FIELDS = {'classifier': 'classifiers', 'project_url': 'project_urls'}
+
+
+# %% Metadata
+def read_metadata(filepath):
+    """Read the core metadata of a wheel or sdist without extracting it.
+
+    Returns
+    -------
+    email.message.Message
+        Metadata headers, the long description is the payload.
+
+    """
+    if filepath.endswith('.whl'):
+        with zipfile.ZipFile(filepath) as z:
+            name = [n for n in z.namelist() if re.match(r'^[^/]+\.dist-info/METADATA$', n)][0]
+            data = z.read(name)
+    elif filepath.endswith(('.tar.gz', '.tgz')):
+        with tarfile.open(filepath) as tar:
+            member = [m for m in tar.getmembers() if re.match(r'^[^/]+/PKG-INFO$', m.name)][0]
+            data = tar.extractfile(member).read()
+    else:
+        raise ValueError('[irelease] ERROR: Unknown distribution type: %s' %(filepath))
+    return HeaderParser().parsestr(data.decode('utf-8'))
+
+
+def _form_fields(filepath, metadata, content):
+    # Fields of the legacy upload API (the same as twine sends).
+    if filepath.endswith('.whl'):
+        filetype = 'bdist_wheel'
+        pyversion = os.path.basename(filepath).split('-')[-3]
+    else:
+        filetype, pyversion = 'sdist', 'source'
+    fields = [(':action', 'file_upload'), ('protocol_version', '1'), ('filetype', filetype), ('pyversion', pyversion),
+              ('md5_digest', hashlib.md5(content).hexdigest()), ('sha256_digest', hashlib.sha256(content).hexdigest()),
+              ('blake2_256_digest', hashlib.blake2b(content, digest_size=32).hexdigest())]
+    for key, value in metadata.items():
+        key = key.lower().replace('-', '_')
+        fields.append((FORM_FIELDS.get(key, key), value))
+    description = metadata.get_payload()
+    if description and 'description' not in metadata:
+        fields.append(('description', description))
+    return fields
+
+
+def _multipart(fields, filename, content, name='content'):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for key, value in fields:
+        parts.append(('--%s\r\nContent-Disposition: form-data; name="%s"\r\n\r\n' %(boundary, key)).encode('utf-8') + str(value).encode('utf-8') + b'\r\n')
+    parts.append(('--%s\r\nContent-Disposition: form-data; name="%s"; filename="%s"\r\nContent-Type: application/octet-stream\r\n\r\n' %(boundary, name, filename)).encode('utf-8') + content + b'\r\n')
+    parts.append(('--%s--\r\n' %(boundary)).encode('utf-8'))
+    return b''.join(parts), 'multipart/form-data; boundary=%s' %(boundary)
+
+
+# %% Index
+def normalize_name(name):
+    """Normalized project name (PEP 503)."""
+    return re.sub(r'[-_.]+', '-', name).lower()
+
+
+def existing_files(client, index_url, name):
+    """Filenames of the project that are already on the index, from the simple API (PEP 503/691).
+
+    Returns
+    -------
+    set of str
+        Filenames. Empty when the project or the index can not be found.
+
+    """
+    url = urljoin(index_url, normalize_name(name) + '/')
+    try:
+        response = client.request('GET', url, headers={'Accept': 'application/vnd.pypi.simple.v1+json, text/html;q=0.1'})
+    except Exception:
+        return set()
+    if not response.ok:
+        return set()
+    if 'json' in response.headers.get('content-type', ''):
+        return set(f['filename'] for f in response.json().get('files', []))
+    return set(m.split('#')[0].rsplit('/', 1)[-1] for m in re.findall(r'href="([^"]+)"', response.text()))
+
+
+def get_credentials(username=None, password=None, verbose=3):
+    """Credentials from the arguments, the TWINE_USERNAME/TWINE_PASSWORD environment or the .pypirc file."""
+    username = username or os.environ.get('TWINE_USERNAME')
+    password = password or os.environ.get('TWINE_PASSWORD')
+    if password is None:
+        pypirc_username, pypirc_password = get_pypi_credentials(verbose=verbose)
+        username, password = username or pypirc_username, pypirc_password
+    if password is not None and username is None:
+        username = '__token__'
+    return username, password
+
+
+# %% Upload
+def upload_file(client, repository_url, filepath, auth=None, retries=3, backoff=1.0, verbose=3):
+    """Upload one distribution archive and retry on failures with exponential backoff.
+
+    Returns
+    -------
+    result : dict
+        file, status ('uploaded', 'skipped' or 'failed'), bytes, time, speed (MB/s), attempts and error.
+
+    """
+    result = {'file': filepath, 'status': 'failed', 'bytes': os.path.getsize(filepath), 'time': 0.0, 'speed': 0.0, 'attempts': 0, 'error': None}
+    with open(filepath, 'rb') as f:
+        content = f.read()
+    body, content_type = _multipart(_form_fields(filepath, read_metadata(filepath), content), os.path.basename(filepath), content)
+    headers = {'Content-Type': content_type, 'Content-Length': str(len(body))}
+    if auth is not None and auth[1] is not None:
+        headers['Authorization'] = 'Basic ' + base64.b64encode(('%s:%s' %auth).encode('utf-8')).decode('ascii')
+
+    for attempt in range(retries + 1):
+        result['attempts'] = attempt + 1
+        start = time.perf_counter()
+        try:
+            with trace.span('upload ' + os.path.basename(filepath), attempt=attempt + 1, bytes=len(body)) as event:
+                response = client.request('POST', repository_url, body=body, headers=headers)
+                event['http_status'] = response.status
+            result['time'] = time.perf_counter() - start
+            if response.ok:
+                result['status'] = 'uploaded'
+            elif response.status in (400, 409) and 'exist' in response.text().lower():
+                result['status'] = 'skipped'
+            elif response.status==429 or response.status>=500:
+                result['error'] = 'HTTP %d: %s' %(response.status, response.text()[:200])
+            else:
+                # Client errors such as invalid credentials or metadata do not improve by retrying.
+                result['error'] = 'HTTP %d: %s' %(response.status, response.text()[:200])
+                break
+        except Exception as e:
+            result['error'] = str(e)
+
+        if result['status']!='failed':
+            result['error'] = None
+            break
+        if attempt<retries:
+            if verbose>=3: print('[irelease] Retry %s in %.0fs: %s' %(os.path.basename(filepath), backoff * 2**attempt, result['error']))
+            time.sleep(backoff * 2**attempt)
+
+    if result['status']=='uploaded' and result['time']>0:
+        result['speed'] = result['bytes'] / result['time'] / 1e6
+    return result
+
+
+def upload_artifacts(artifacts, repository_url=PYPI_URL, index_url=None, username=None, password=None, auth=None, n_jobs=4, retries=3, skip_existing=True, verbose=3):
+    """Upload the distribution archives concurrently.
+
+    Files that are already on the index are skipped, so an interrupted upload can simply be run again.
+
+    Parameters
+    ----------
+    artifacts : list of str
+        Wheels and sdists to upload.
+    repository_url : str, optional
+        Upload url of the repository. The default is 'https://upload.pypi.org/legacy/'.
+    index_url : str, optional
+        Simple API of the repository that is used to find files that already exist.
+        The default is derived from the repository_url.
+    username : str, optional
+        Username, the default is read from TWINE_USERNAME or .pypirc.
+    password : str, optional
+        Password or API token, the default is read from TWINE_PASSWORD or .pypirc.
+    auth : tuple, optional
+        (username, password) that is used as is, (None, None) uploads without credentials.
+        The default is read with username and password, see :func:`get_credentials`.
+    n_jobs : int, optional
+        Number of concurrent uploads. The default is 4.
+    retries : int, optional
+        Number of retries per file. The default is 3.
+    skip_existing : bool, optional
+        Skip files that are already on the index. The default is True.
+    verbose : int, optional
+        Print message. The default is 3.
+
+    Returns
+    -------
+    results : list of dict
+        One result per file, see :func:`upload_file`.
+
+    Examples
+    --------
+    >>> from irelease import upload
+    >>> results = upload.upload_artifacts(glob.glob('dist/*'), repository_url='http://localhost:8080/')
+
+    """
+    if index_url is None:
+        index_url = INDEX_URLS.get(repository_url, urljoin(repository_url, '/simple/'))
+    if auth is None: auth = get_credentials(username, password, verbose=verbose)
+    results = []
+
+    with HTTPClient(headers={'User-Agent': 'irelease'}) as client:
+        todo = list(artifacts)
+        if skip_existing and len(todo)>0:
+            names = set(read_metadata(f)['Name'] for f in todo)
+            existing = set().union(*[existing_files(client, index_url, name) for name in names])
+            for f in [f for f in todo if os.path.basename(f) in existing]:
+                if verbose>=3: print('[irelease] %s already exists on the index.' %(os.path.basename(f)))
+                results.append({'file': f, 'status': 'skipped', 'bytes': os.path.getsize(f), 'time': 0.0, 'speed': 0.0, 'attempts': 0, 'error': None})
+                todo.remove(f)
+
+        with ThreadPoolExecutor(max_workers=max(1, n_jobs)) as executor:
+            for result in executor.map(trace.bind(lambda f: upload_file(client, repository_url, f, auth=auth, retries=retries, verbose=verbose)), todo):
+                if verbose>=3 and result['status']=='uploaded':
+                    print('[irelease] Uploaded %s (%.1f MB in %.1fs, %.2f MB/s)' %(os.path.basename(result['file']), result['bytes'] / 1e6, result['time'], result['speed']))
+                if verbose>=1 and result['status']=='failed':
+                    print('[irelease] ERROR: Upload of %s failed: %s' %(os.path.basename(result['file']), result['error']))
+                results.append(result)
+    return results
@@ -0,0 +1,303 @@
+"""Verify the distribution archives before they are uploaded."""
+# --------------------------------------------------
+# Name        : verify.py
+# Author      : E.Taskesen
+# Contact     : erdogant@gmail.com
+# github      : https://github.com/erdogant/irelease
+# Licence     : MIT
+# --------------------------------------------------
+
+import os
+import re
+import io
+import csv
+import json
+import time
+import base64
+import hashlib
+import tarfile
+import zipfile
+from email.parser import HeaderParser
+import toml
+from irelease.upload import normalize_name
+
+# Budgets in MB. Override them with max-artifact-mb and max-member-mb in [tool.irelease] of the pyproject.toml.
+MAX_ARTIFACT_MB = 50
+MAX_MEMBER_MB = 10
+# Provenance manifest in the dist directory. The leading dot keeps it out of 'twine upload dist/*'.
+PROVENANCE_FILE = '.irelease-provenance.json'
+CHUNK_SIZE = 1024 * 1024
+
+
+# %% Streaming
+class _HashingReader:
+    """Read-only file object that computes the sha256 of the bytes while they are read sequentially."""
+
+    def __init__(self, f):
+        self._f = f
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def read(self, size=-1):
+        data = self._f.read(size)
+        self.sha256.update(data)
+        self.size = self.size + len(data)
+        return data
+
+    def drain(self):
+        # Hash the remainder, e.g. the padding after the end of a tar archive.
+        while self.read(CHUNK_SIZE):
+            pass
+
+
+def _record_hash(data_or_hash):
+    # RECORD hashes are urlsafe base64 without padding.
+    return 'sha256=' + base64.urlsafe_b64encode(data_or_hash.digest()).rstrip(b'=').decode('ascii')
+
+
+def _read_wheel(filepath, report):
+    # The zip index is at the end of the file, so the members are read after the file is hashed; the
+    # second read is served from the page cache. Nothing is extracted to disk.
+    with open(filepath, 'rb') as f:
+        reader = _HashingReader(f)
+        reader.drain()
+    report['sha256'] = reader.sha256.hexdigest()
+
+    members, metadata, record = {}, None, None
+    with zipfile.ZipFile(filepath) as z:
+        for info in z.infolist():
+            if info.is_dir(): continue
+            sha256 = hashlib.sha256()
+            with z.open(info) as member:
+                for chunk in iter(lambda: member.read(CHUNK_SIZE), b''):
+                    sha256.update(chunk)
+            members[info.filename] = (_record_hash(sha256), info.file_size)
+            if re.match(r'^[^/]+\.dist-info/METADATA$', info.filename):
+                metadata = z.read(info).decode('utf-8')
+            elif re.match(r'^[^/]+\.dist-info/RECORD$', info.filename):
+                record = (info.filename, z.read(info).decode('utf-8'))
+    return members, metadata, record
+
+
+def _read_sdist(filepath, report):
+    # One sequential pass: the archive is hashed while tarfile streams the members.
+    members, metadata = {}, None
+    with open(filepath, 'rb') as f:
+        reader = _HashingReader(f)
+        with tarfile.open(fileobj=reader, mode='r|*') as tar:
+            for info in tar:
+                if not info.isfile(): continue
+                member = tar.extractfile(info)
+                if re.match(r'^[^/]+/PKG-INFO$', info.name):
+                    data = member.read()
+                    metadata = data.decode('utf-8')
+                    digest = hashlib.sha256(data)
+                else:
+                    digest = hashlib.sha256()
+                    for chunk in iter(lambda: member.read(CHUNK_SIZE), b''):
+                        digest.update(chunk)
+                members[info.name] = (_record_hash(digest), info.size)
+        reader.drain()
+    report['sha256'] = reader.sha256.hexdigest()
+    return members, metadata
+
+
+# %% Checks
+def _check_filename(filename, name, version, report):
+    if filename.endswith('.whl'):
+        report['type'] = 'bdist_wheel'
+        match = re.match(r'^([^-]+)-([^-]+)(-\d[^-]*)?-[^-]+-[^-]+-[^-]+\.whl$', filename)
+    elif filename.endswith('.tar.gz'):
+        report['type'] = 'sdist'
+        match = re.match(r'^(.+)-([^-]+)\.tar\.gz$', filename)
+    else:
+        report['errors'].append('Unknown distribution type.')
+        return
+    if match is None:
+        report['errors'].append('Invalid filename.')
+        return
+    if version is not None and not _same_version(match.group(2), version):
+        report['errors'].append('Version %s in the filename does not match the version %s (stale artifact).' %(match.group(2), version))
+    if name is not None and normalize_name(match.group(1))!=normalize_name(name):
+        report['errors'].append('Name %s in the filename does not match %s.' %(match.group(1), name))
+
+
+def _same_version(version1, version2):
+    # Build backends normalize the version, e.g. 1.0.0-rc1 becomes 1.0.0rc1.
+    from packaging.version import Version, InvalidVersion
+    try:
+        return Version(version1)==Version(version2)
+    except InvalidVersion:
+        return version1==version2
+
+
+def _check_metadata(text, name, version, report):
+    if text is None:
+        report['errors'].append('No metadata (METADATA or PKG-INFO).')
+        return
+    metadata = HeaderParser().parsestr(text)
+    for field in ['Metadata-Version', 'Name', 'Version']:
+        if metadata.get(field) is None:
+            report['errors'].append('Metadata field %s is missing.' %(field))
+    if version is not None and metadata.get('Version') is not None and not _same_version(metadata.get('Version'), version):
+        report['errors'].append('Metadata version %s does not match the version %s.' %(metadata.get('Version'), version))
+    if name is not None and metadata.get('Name') is not None and normalize_name(metadata.get('Name'))!=normalize_name(name):
+        report['errors'].append('Metadata name %s does not match %s.' %(metadata.get('Name'), name))
+
+    # The long description is the project page on PyPi.
+    description = metadata.get_payload() or metadata.get('Description') or ''
+    content_type = (metadata.get('Description-Content-Type') or 'text/x-rst').split(';')[0].strip()
+    if description.strip()=='':
+        report['warnings'].append('The long description is empty: the project page on PyPi will be empty.')
+    elif content_type=='text/x-rst':
+        try:
+            from readme_renderer.rst import render
+        except ImportError:
+            # readme_renderer (a dependency of twine) is optional.
+            render = None
+        if render is not None and render(description) is None:
+            report['errors'].append('The long description (reStructuredText) can not be rendered by PyPi.')
+    report['name'], report['version'] = metadata.get('Name'), metadata.get('Version')
+
+
+def _check_record(members, record, report):
+    if record is None:
+        report['errors'].append('The wheel has no RECORD.')
+        return
+    recordname, text = record
+    listed = {}
+    for row in csv.reader(io.StringIO(text)):
+        if len(row)==0: continue
+        listed[row[0]] = row[1:3] if len(row)>=3 else ['', '']
+    for path, (digest, size) in members.items():
+        if path==recordname or path.endswith(('.dist-info/RECORD.jws', '.dist-info/RECORD.p7s')): continue
+        if path not in listed:
+            report['errors'].append('%s is not in the RECORD.' %(path))
+        elif listed[path][0]!=digest or (listed[path][1]!='' and int(listed[path][1])!=size):
+            report['errors'].append('%s does not match its hash or size in the RECORD.' %(path))
+    for path in listed:
+        if path not in members:
+            report['errors'].append('%s is in the RECORD but not in the wheel.' %(path))
+
+
+def verify_artifact(filepath, name=None, version=None, max_artifact_mb=MAX_ARTIFACT_MB, max_member_mb=MAX_MEMBER_MB):
+    """Verify one wheel or sdist without extracting it.
+
+    Parameters
+    ----------
+    filepath : str
+        Path to the wheel or sdist.
+    name : str, optional
+        Expected project name. None does not check the name.
+    version : str, optional
+        Expected version. None does not check the version.
+    max_artifact_mb : float, optional
+        Maximum size of the archive in MB. The default is 50.
+    max_member_mb : float, optional
+        Members that are larger (uncompressed) are reported as warning. The default is 10.
+
+    Returns
+    -------
+    report : dict
+        file, type, name, version, size, sha256, members (count), largest (member, size), errors and warnings.
+
+    """
+    filename = os.path.basename(filepath)
+    report = {'file': filename, 'type': None, 'name': None, 'version': None, 'size': os.path.getsize(filepath), 'sha256': None, 'members': 0, 'largest': None, 'errors': [], 'warnings': []}
+    _check_filename(filename, name, version, report)
+    if report['type'] is None: return report
+    if report['size']>max_artifact_mb * 1e6:
+        report['errors'].append('The size %.1f MB exceeds the budget of %g MB.' %(report['size'] / 1e6, max_artifact_mb))
+
+    try:
+        if report['type']=='bdist_wheel':
+            members, metadata, record = _read_wheel(filepath, report)
+            _check_record(members, record, report)
+        else:
+            members, metadata = _read_sdist(filepath, report)
+    except (zipfile.BadZipFile, tarfile.TarError, OSError, EOFError) as e:
+        report['errors'].append('The archive can not be read: %s' %(e))
+        return report
+
+    _check_metadata(metadata, name, version, report)
+    report['members'] = len(members)
+    for path, (_, size) in members.items():
+        if size>max_member_mb * 1e6:
+            report['warnings'].append('%s is large: %.1f MB.' %(path, size / 1e6))
+    if len(members)>0:
+        largest = max(members.items(), key=lambda m: m[1][1])
+        report['largest'] = [largest[0], largest[1][1]]
+    return report
+
+
+def read_budget(srcdir='.'):
+    """Size budgets (max-artifact-mb, max-member-mb) from [tool.irelease] in the pyproject.toml."""
+    config = {}
+    filepath = os.path.join(srcdir, 'pyproject.toml')
+    if os.path.isfile(filepath):
+        config = toml.load(filepath).get('tool', {}).get('irelease', {})
+    return config.get('max-artifact-mb', MAX_ARTIFACT_MB), config.get('max-member-mb', MAX_MEMBER_MB)
+
+
+def verify_dist(distdir='dist', name=None, version=None, srcdir='.', artifacts=None, manifest=True, verbose=3):
+    """Verify all distribution archives in distdir and write the provenance manifest.
+
+    Archives of other versions in distdir are reported as errors because they would be uploaded with 'twine upload dist/*'.
+
+    Parameters
+    ----------
+    distdir : str, optional
+        Directory with the distribution archives. The default is 'dist'.
+    name : str, optional
+        Expected project name.
+    version : str, optional
+        Expected version, e.g. the __version__ of the package.
+    srcdir : str, optional
+        Root directory of the package, for the budgets in the pyproject.toml and the git commit. The default is '.'.
+    artifacts : list of str, optional
+        Only verify these archives. The default is all archives in distdir.
+    manifest : bool, optional
+        Write the reports with the sha256 digests to distdir/.irelease-provenance.json. The default is True.
+    verbose : int, optional
+        Print message. The default is 3.
+
+    Returns
+    -------
+    results : dict
+        ok (bool), name, version, commit, created, artifacts (list of reports) and manifest (path).
+
+    Examples
+    --------
+    >>> from irelease import verify
+    >>> results = verify.verify_dist('dist', name='irelease', version='1.0.0')
+
+    """
+    max_artifact_mb, max_member_mb = read_budget(srcdir)
+    if artifacts is not None:
+        filepaths = sorted(artifacts)
+    else:
+        filepaths = sorted(os.path.join(distdir, f) for f in os.listdir(distdir) if not f.startswith('.')) if os.path.isdir(distdir) else []
+    reports = [verify_artifact(f, name=name, version=version, max_artifact_mb=max_artifact_mb, max_member_mb=max_member_mb) for f in filepaths]
+    if len(reports)==0:
+        reports.append({'file': distdir, 'errors': ['No distribution archives found.'], 'warnings': []})
+    results = {'ok': all(len(r['errors'])==0 for r in reports), 'name': name, 'version': version, 'commit': _git_commit(srcdir), 'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()), 'artifacts': reports, 'manifest': None}
+
+    if manifest and os.path.isdir(distdir):
+        results['manifest'] = os.path.join(distdir, PROVENANCE_FILE)
+        with open(results['manifest'], 'w') as f:
+            json.dump(results, f, indent=2)
+
+    for r in reports:
+        if verbose>=3 and len(r['errors'])==0: print('[irelease] [%s] verified: %.1f MB, %d files, sha256 %s' %(r['file'], r['size'] / 1e6, r['members'], r['sha256']))
+        for warning in r['warnings']:
+            if verbose>=2: print('[irelease] Warning: [%s] %s' %(r['file'], warning))
+        for error in r['errors']:
+            if verbose>=1: print('[irelease] ERROR: [%s] %s' %(r['file'], error))
+    return results
+
+
+def _git_commit(srcdir):
+    # Commit of the sources for the provenance manifest, None outside a git repository.
+    from irelease.gitops import Git
+    process = Git(srcdir, verbose=0).run('rev-parse', 'HEAD', check=False)
+    return process.stdout.strip() if process.returncode==0 else None
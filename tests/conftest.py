@@ -0,0 +1,81 @@
+import io
+import os
+import base64
+import hashlib
+import tarfile
+import subprocess
+import zipfile
+import pytest
+
+METADATA = 'Metadata-Version: 2.1\nName: %s\nVersion: %s\nSummary: Test package\nClassifier: Programming Language :: Python :: 3\nClassifier: Operating System :: OS Independent\n\nLong description.\n'
+PYPROJECT = """[build-system]
+requires = ["setuptools>=61"]
+build-backend = "setuptools.build_meta"
+
+[project]
+name = "demo"
+dynamic = ["version"]
+
+[tool.setuptools.dynamic]
+version = {attr = "demo.__version__"}
+"""
+
+
+def make_artifacts(dirpath, name='demo_pkg', version='0.1.0'):
+    """Minimal wheel and sdist with core metadata, without a build backend."""
+    os.makedirs(dirpath, exist_ok=True)
+    metadata = (METADATA %(name, version)).encode('utf-8')
+    wheel = os.path.join(dirpath, '%s-%s-py3-none-any.whl' %(name, version))
+    distinfo = '%s-%s.dist-info' %(name, version)
+    with zipfile.ZipFile(wheel, 'w') as z:
+        z.writestr('%s/__init__.py' %(name), '')
+        z.writestr(distinfo + '/METADATA', metadata)
+        # The hash of the empty file and of the metadata, as the RECORD of a built wheel.
+        digest = base64.urlsafe_b64encode(hashlib.sha256(metadata).digest()).rstrip(b'=').decode('ascii')
+        z.writestr(distinfo + '/RECORD', '%s/__init__.py,sha256=47DEQpj8HBSa-_TImW-5JCeuQeRkm5NMpJWZG3hSuFU,0\n%s/METADATA,sha256=%s,%d\n%s/RECORD,,\n' %(name, distinfo, digest, len(metadata), distinfo))
+    sdist = os.path.join(dirpath, '%s-%s.tar.gz' %(name, version))
+    with tarfile.open(sdist, 'w:gz') as tar:
+        for filename, content in [('PKG-INFO', metadata), ('pyproject.toml', PYPROJECT.encode('utf-8'))]:
+            info = tarfile.TarInfo('%s-%s/%s' %(name, version, filename))
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    return [sdist, wheel]
+
+
+def git(path, *args):
+    return subprocess.run(['git'] + list(args), cwd=path, check=True, capture_output=True, text=True).stdout
+
+
+def make_repo(path, version='0.1.0', remote='https://github.com/owner/demo.git'):
+    """Git repository with the package demo at version in one commit, with remote as origin."""
+    os.makedirs(os.path.join(path, 'demo'))
+    with open(os.path.join(path, 'demo', '__init__.py'), 'w') as f:
+        f.write("__version__ = '%s'\n" %(version))
+    with open(os.path.join(path, 'pyproject.toml'), 'w') as f:
+        f.write(PYPROJECT)
+    git(path, 'init', '-q', '-b', 'master')
+    git(path, 'config', 'user.email', 'dev@example.com')
+    git(path, 'config', 'user.name', 'dev')
+    git(path, 'config', 'commit.gpgsign', 'false')
+    git(path, 'remote', 'add', 'origin', remote)
+    git(path, 'add', '-A')
+    git(path, 'commit', '-q', '-m', 'init')
+    return path
+
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    path = make_repo(str(tmp_path / 'demo'))
+    monkeypatch.chdir(path)
+    return path
+
+
+@pytest.fixture
+def artifacts(tmp_path):
+    return make_artifacts(str(tmp_path / 'dist'))
+
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    # Retries back off with time.sleep.
+    monkeypatch.setattr('time.sleep', lambda seconds: None)
@@ -0,0 +1,388 @@
+"""Local stand-in servers of the package index, github and gitlab for the tests and the pipeline benchmark."""
+# --------------------------------------------------
+# Name        : mockserver.py
+# Author      : E.Taskesen
+# Contact     : erdogant@gmail.com
+# github      : https://github.com/erdogant/irelease
+# Licence     : MIT
+# --------------------------------------------------
+
+import json
+import re
+import hashlib
+import threading
+import email
+import email.policy
+from urllib.parse import unquote
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class MockServer:
+    """Threaded HTTP server on localhost that runs in the background.
+
+    Parameters
+    ----------
+    handler : BaseHTTPRequestHandler
+        Request handler class. The server instance is available as ``self.server.mock``.
+    port : int, optional
+        Port number, 0 picks a free port. The default is 0.
+
+    Examples
+    --------
+    >>> with MockIndex() as index:
+    >>>     print(index.url)
+
+    """
+
+    def __init__(self, handler, port=0):
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', port), handler)
+        self._httpd.daemon_threads = True
+        self._httpd.mock = self
+        self._thread = None
+        self.requests = []
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d/' %(self._httpd.server_address[1])
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return self.rfile.read(length) if length>0 else b''
+
+    def _send(self, status, data=b'', content_type='application/json', headers=None):
+        if isinstance(data, (dict, list)):
+            data = json.dumps(data).encode('utf-8')
+        elif isinstance(data, str):
+            data = data.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _multipart(self, body):
+        # Fields and files of a multipart/form-data body: ({name: [value]}, {name: (filename, content)}).
+        message = email.message_from_bytes(b'Content-Type: ' + self.headers['Content-Type'].encode() + b'\r\n\r\n' + body, policy=email.policy.HTTP)
+        fields, files = {}, {}
+        for part in message.iter_parts():
+            name = part.get_param('name', header='content-disposition')
+            if part.get_filename() is not None:
+                files[name] = (part.get_filename(), part.get_payload(decode=True))
+            else:
+                fields.setdefault(name, []).append(part.get_content())
+        return fields, files
+
+
+# %% Package index
+class _IndexHandler(_Handler):
+
+    def do_GET(self):
+        mock = self.server.mock
+        mock.requests.append(('GET', self.path))
+        match = re.match(r'^/simple/([^/]+)/?$', self.path)
+        if match is None:
+            return self._send(404, {'message': 'Not Found'})
+        with mock.lock:
+            files = sorted(mock.files.get(match.group(1), {}).items())
+        if len(files)==0:
+            return self._send(404, {'message': 'Not Found'})
+        data = {'meta': {'api-version': '1.0'}, 'name': match.group(1), 'files': [{'filename': name, 'url': '/files/' + name, 'hashes': {'sha256': hashlib.sha256(content).hexdigest()}} for name, content in files]}
+        self._send(200, data, content_type='application/vnd.pypi.simple.v1+json')
+
+    def do_POST(self):
+        mock = self.server.mock
+        body = self._body()
+        mock.requests.append(('POST', self.path))
+        with mock.lock:
+            mock.attempts = mock.attempts + 1
+            fail = mock.fail_first>0
+            if fail: mock.fail_first = mock.fail_first - 1
+        if fail:
+            return self._send(503, 'Service Unavailable', content_type='text/plain')
+        if mock.credentials is not None and self.headers.get('Authorization')!=mock.credentials:
+            return self._send(403, 'Invalid or non-existent authentication information.', content_type='text/plain')
+
+        fields, files = self._multipart(body)
+        filename, content = files.get('content', (None, None))
+
+        if content is None or 'name' not in fields or 'version' not in fields:
+            return self._send(400, 'Invalid upload.', content_type='text/plain')
+        if fields.get('sha256_digest', [None])[0]!=hashlib.sha256(content).hexdigest():
+            return self._send(400, 'The digest supplied does not match a digest calculated from the uploaded file.', content_type='text/plain')
+        project = re.sub(r'[-_.]+', '-', fields['name'][0]).lower()
+        with mock.lock:
+            if filename in mock.files.setdefault(project, {}):
+                return self._send(400, 'File already exists.', content_type='text/plain')
+            mock.files[project][filename] = content
+            mock.fields[filename] = fields
+        self._send(200, 'OK', content_type='text/plain')
+
+
+class MockIndex(MockServer):
+    """Stand-in for PyPI: the legacy upload API on ``url`` and the simple API on ``url + 'simple/'``.
+
+    Parameters
+    ----------
+    fail_first : int, optional
+        Number of uploads that fail with HTTP 503 before uploads succeed. The default is 0.
+    credentials : str, optional
+        Expected Authorization header. None accepts every upload.
+    port : int, optional
+        Port number, 0 picks a free port. The default is 0.
+
+    Attributes
+    ----------
+    files : dict
+        Uploaded files per normalized project name: {project: {filename: content}}.
+    fields : dict
+        Form fields per uploaded filename.
+
+    """
+
+    def __init__(self, fail_first=0, credentials=None, port=0):
+        super().__init__(_IndexHandler, port=port)
+        self.files = {}
+        self.fields = {}
+        self.attempts = 0
+        self.fail_first = fail_first
+        self.credentials = credentials
+
+    @property
+    def index_url(self):
+        return self.url + 'simple/'
+
+
+# %% GitHub API
+class _GitHubHandler(_Handler):
+
+    def do_GET(self):
+        mock = self.server.mock
+        mock.requests.append(('GET', self.path))
+        match = re.match(r'^/repos/([^/]+)/([^/]+)/releases/tags/([^/?]+)$', self.path)
+        if match is not None:
+            with mock.lock:
+                found = [r for r in mock.releases.get(match.group(1) + '/' + match.group(2), []) if r['tag_name']==match.group(3)]
+            return self._send(200, mock._release_json(match.group(1), match.group(2), found[0])) if found else self._send(404, {'message': 'Not Found'})
+        match = re.match(r'^/repos/([^/]+)/([^/]+)/releases(?:\?.*)?$', self.path)
+        if match is None:
+            return self._send(404, {'message': 'Not Found'})
+        with mock.lock:
+            releases = mock.releases.get(match.group(1) + '/' + match.group(2))
+            releases = None if releases is None else [dict(r) for r in reversed(releases)]
+        if releases is None:
+            return self._send(404, {'message': 'Not Found'})
+        data = json.dumps(releases).encode('utf-8')
+        etag = '"%s"' %(hashlib.sha1(data).hexdigest())
+        if self.headers.get('If-None-Match')==etag:
+            return self._send(304, headers={'ETag': etag})
+        self._send(200, data, headers={'ETag': etag})
+
+    def do_POST(self):
+        mock = self.server.mock
+        body = self._body()
+        mock.requests.append(('POST', self.path))
+        if mock.token is not None and self.headers.get('Authorization')!='Bearer ' + mock.token:
+            return self._send(401, {'message': 'Bad credentials'})
+        match = re.match(r'^/repos/([^/]+)/([^/]+)/releases$', self.path)
+        if match is not None:
+            return self._create_release(match.group(1), match.group(2), json.loads(body))
+        match = re.match(r'^/repos/([^/]+)/([^/]+)/releases/(\d+)/assets\?name=([^&]+)', self.path)
+        if match is not None:
+            return self._upload_asset(int(match.group(3)), unquote(match.group(4)), body)
+        if self.path!='/graphql':
+            return self._send(404, {'message': 'Not Found'})
+        query = json.loads(body)['query']
+        data = {}
+        for alias, owner, name in re.findall(r'(\w+): repository\(owner: "([^"]+)", name: "([^"]+)"\)', query):
+            with mock.lock:
+                releases = mock.releases.get(owner + '/' + name)
+            if releases is None:
+                data[alias] = None
+            else:
+                nodes = [{'tagName': r['tag_name'], 'isPrerelease': r.get('prerelease', False), 'isDraft': r.get('draft', False)} for r in reversed(releases)]
+                data[alias] = {'releases': {'nodes': nodes}}
+        self._send(200, {'data': data})
+
+    def _create_release(self, owner, repo, data):
+        mock = self.server.mock
+        with mock.lock:
+            releases = mock.releases.setdefault(owner + '/' + repo, [])
+            if any(r['tag_name']==data['tag_name'] for r in releases):
+                return self._send(422, {'message': 'Validation Failed', 'errors': [{'resource': 'Release', 'code': 'already_exists', 'field': 'tag_name'}]})
+            release = {'tag_name': data['tag_name'], 'name': data.get('name'), 'body': data.get('body'), 'prerelease': data.get('prerelease', False), 'draft': data.get('draft', False), 'id': len(mock.assets) + 1}
+            releases.append(release)
+            mock.assets[release['id']] = {}
+        self._send(201, mock._release_json(owner, repo, release))
+
+    def _upload_asset(self, release_id, name, content):
+        mock = self.server.mock
+        with mock.lock:
+            if release_id not in mock.assets:
+                return self._send(404, {'message': 'Not Found'})
+            if name in mock.assets[release_id]:
+                return self._send(422, {'message': 'Validation Failed', 'errors': [{'resource': 'ReleaseAsset', 'code': 'already_exists', 'field': 'name'}]})
+            mock.assets[release_id][name] = content
+        self._send(201, {'name': name, 'size': len(content), 'browser_download_url': '%sdownload/%d/%s' %(mock.url, release_id, name)})
+
+
+class MockGitHub(MockServer):
+    """Stand-in for the GitHub releases API.
+
+    Parameters
+    ----------
+    releases : dict, optional
+        Releases per repository, oldest first: {'owner/repo': ['0.1.0', {'tag_name': '0.2.0rc1', 'prerelease': True}]}.
+    token : str, optional
+        Token that is required to create releases. None accepts every request.
+    port : int, optional
+        Port number, 0 picks a free port. The default is 0.
+
+    Attributes
+    ----------
+    assets : dict
+        Uploaded assets per release id: {id: {name: content}}.
+
+    Examples
+    --------
+    >>> with MockGitHub({'erdogant/pca': ['1.0.0']}) as github:
+    >>>     VersionClient(api_url=github.url, cachedir=None).latest_version('erdogant', 'pca')
+    '1.0.0'
+
+    """
+
+    def __init__(self, releases=None, token=None, port=0):
+        super().__init__(_GitHubHandler, port=port)
+        self.releases = {}
+        self.assets = {}
+        self.token = token
+        for repo, tags in (releases or {}).items():
+            self.releases[repo] = [t if isinstance(t, dict) else {'tag_name': t} for t in tags]
+
+    def _release_json(self, owner, repo, release):
+        assets = self.assets.get(release.get('id'), {})
+        return dict(release, html_url='https://github.com/%s/%s/releases/tag/%s' %(owner, repo, release['tag_name']),
+                    upload_url='%srepos/%s/%s/releases/%s/assets{?name,label}' %(self.url, owner, repo, release.get('id')),
+                    assets=[{'name': name, 'size': len(content)} for name, content in assets.items()])
+
+
+# %% GitLab API
+class _GitLabHandler(_Handler):
+
+    def _project(self):
+        # /api/v4/projects/<url-encoded path>/<rest>
+        match = re.match(r'^/api/v4/projects/([^/]+)(/.*)?$', self.path)
+        if match is None: return None, None
+        return unquote(match.group(1)), match.group(2) or ''
+
+    def do_GET(self):
+        mock = self.server.mock
+        mock.requests.append(('GET', self.path))
+        project, rest = self._project()
+        match = re.match(r'^/releases/([^/]+)$', rest or '')
+        if match is None:
+            return self._send(404, {'message': '404 Not Found'})
+        with mock.lock:
+            release = mock.releases.get(project, {}).get(unquote(match.group(1)))
+        self._send(200, mock._release_json(project, release)) if release else self._send(404, {'message': '404 Not Found'})
+
+    def do_POST(self):
+        mock = self.server.mock
+        body = self._body()
+        mock.requests.append(('POST', self.path))
+        if mock.token is not None and self.headers.get('PRIVATE-TOKEN')!=mock.token:
+            return self._send(401, {'message': '401 Unauthorized'})
+        project, rest = self._project()
+        if project is None:
+            return self._send(404, {'message': '404 Not Found'})
+
+        if rest=='/releases':
+            data = json.loads(body)
+            with mock.lock:
+                releases = mock.releases.setdefault(project, {})
+                if data['tag_name'] in releases:
+                    return self._send(409, {'message': 'Release already exists'})
+                releases[data['tag_name']] = {'tag_name': data['tag_name'], 'name': data.get('name'), 'description': data.get('description'), 'links': []}
+                release = releases[data['tag_name']]
+            return self._send(201, mock._release_json(project, release))
+
+        if rest=='/uploads':
+            _, files = self._multipart(body)
+            filename, content = files['file']
+            with mock.lock:
+                secret = hashlib.sha1(content).hexdigest()[:32]
+                mock.uploads[secret + '/' + filename] = content
+            return self._send(201, {'alt': filename, 'url': '/uploads/%s/%s' %(secret, filename), 'markdown': '[%s](/uploads/%s/%s)' %(filename, secret, filename)})
+
+        match = re.match(r'^/releases/([^/]+)/assets/links$', rest)
+        if match is not None:
+            data = json.loads(body)
+            with mock.lock:
+                release = mock.releases.get(project, {}).get(unquote(match.group(1)))
+                if release is None:
+                    return self._send(404, {'message': '404 Not Found'})
+                if any(link['name']==data['name'] for link in release['links']):
+                    return self._send(400, {'message': {'name': ['has already been taken']}})
+                link = {'id': len(release['links']) + 1, 'name': data['name'], 'url': data['url']}
+                release['links'].append(link)
+            return self._send(201, link)
+        self._send(404, {'message': '404 Not Found'})
+
+
+class MockGitLab(MockServer):
+    """Stand-in for the GitLab releases API on ``url + 'api/v4'``.
+
+    Parameters
+    ----------
+    token : str, optional
+        Expected PRIVATE-TOKEN header. None accepts every request.
+    port : int, optional
+        Port number, 0 picks a free port. The default is 0.
+
+    Attributes
+    ----------
+    releases : dict
+        Releases per project path: {'group/subgroup/repo': {tag: release}}.
+    uploads : dict
+        Uploaded files: {'<secret>/<filename>': content}.
+
+    """
+
+    def __init__(self, token=None, port=0):
+        super().__init__(_GitLabHandler, port=port)
+        self.releases = {}
+        self.uploads = {}
+        self.token = token
+
+    @property
+    def api_url(self):
+        return self.url + 'api/v4'
+
+    def _release_json(self, project, release):
+        return {'tag_name': release['tag_name'], 'name': release['name'], 'description': release['description'],
+                'assets': {'links': list(release['links'])},
+                '_links': {'self': '%s%s/-/releases/%s' %(self.url, project, release['tag_name'])}}
@@ -0,0 +1,64 @@
+import os
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from irelease import batch, builder, store
+from conftest import git, make_artifacts, make_repo
+
+
+def test_print_summary(capsys):
+    timings = {'git_pull': 0.1, 'clean': 0.1, 'build': 2.0, 'verify': 0.3, 'tag': 0.1, 'upload': 1.0, 'git_release': 0.5}
+    result = {'path': '/tmp/demo', 'package': 'demo', 'version': '0.1.0', 'remote_version': None, 'status': 'released', 'error': None, 'timings': timings, 'time': 4.1}
+    batch.print_summary([result])
+    header, row = capsys.readouterr().out.splitlines()[1:3]
+    assert header.split()[-8:] == ['git_pull', 'remote_v', 'clean', 'build', 'verify', 'tag', 'upload', 'git_rele']
+    assert row.split()[-8:] == ['0.1', '-', '0.1', '2.0', '0.3', '0.1', '1.0', '0.5']
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    # Two packages with a local remote. The build backend is replaced and fails for the broken package.
+    paths = []
+    for name in ['broken', 'good']:
+        remote = str(tmp_path / 'remotes' / (name + '.git'))
+        git(str(tmp_path), 'init', '-q', '--bare', remote)
+        path = make_repo(str(tmp_path / 'workspace' / name), remote=remote)
+        git(path, 'push', '-q', '-u', 'origin', 'master')
+        paths.append(path)
+
+    def _build_artifacts(srcdir, outdir, mode='single', runner=None, verbose=3):
+        if os.path.basename(os.getcwd())=='broken': raise Exception('Backend setuptools.build_meta is not available.')
+        sdist, wheel = make_artifacts(outdir, name='demo', version='0.1.0')
+        return {'sdist': {'file': sdist}, 'wheel': {'file': wheel}}
+    monkeypatch.setattr(builder, 'build_artifacts', _build_artifacts)
+    monkeypatch.setattr(store, 'CACHE_DIR', str(tmp_path / 'cache'))
+    # The patches are not seen by the worker processes of a spawned process pool: the packages are released in a thread.
+    monkeypatch.setattr(batch, 'ProcessPoolExecutor', ThreadPoolExecutor)
+    monkeypatch.delenv('GITHUB_TOKEN', raising=False)
+    return paths
+
+
+def test_release_package(workspace):
+    broken, good = workspace
+    result = batch.release_package(broken, upload=False, verbose=0)
+    assert (result['package'], result['version'], result['status'], result['error']) == ('demo', '0.1.0', 'failed', 'Backend setuptools.build_meta is not available.')
+    assert {'git_pull', 'remote_version', 'clean', 'build'} <= set(result['timings']) and 'tag' not in result['timings']
+    assert git(broken, 'ls-remote', '--tags', 'origin') == ''
+
+    result = batch.release_package(good, upload=False, verbose=0)
+    assert (result['status'], result['error'], result['remote_version']) == ('released', None, '0.0.0')
+    assert set(result['timings']) == {'git_pull', 'remote_version', 'version_check', 'clean', 'build', 'verify', 'tag', 'upload', 'git_release'}
+    assert 'refs/tags/0.1.0' in git(good, 'ls-remote', '--tags', 'origin')
+
+
+def test_run_batch(workspace, capsys):
+    results = batch.run_batch([os.path.dirname(workspace[0])], n_jobs=1, upload=False, verbose=1)
+    assert [(os.path.basename(r['path']), r['status']) for r in results] == [('broken', 'failed'), ('good', 'released')]
+    assert all(r['time']>0 and 'build' in r['timings'] for r in results)
+    # Both packages are in the summary with their timings, and the error of the broken one.
+    out = capsys.readouterr().out
+    rows = [line.split() for line in out.splitlines() if line.startswith('[irelease] demo ')]
+    assert [row[2:4] for row in rows] == [['0.1.0', 'failed'], ['0.1.0', 'released']]
+    # The broken package has the timings up to and including the build that failed.
+    assert '-' not in rows[0][4:9] and rows[0][9:] == ['-', '-', '-', '-'] and '-' not in rows[1][4:]
+    assert 'demo: Backend setuptools.build_meta is not available.' in out
+    assert 'released: 1, skipped: 0, failed: 1' in out
@@ -0,0 +1,25 @@
+from irelease import benchmark
+
+
+def test_suite_without_mock_servers(monkeypatch, tmp_path, capsys):
+    # An installed irelease has no tests/mockserver.py: the pipeline benchmark is skipped, not an error.
+    monkeypatch.setattr(benchmark, '_mockserver_dir', lambda: None)
+    results = benchmark.run_suite(sizes=['small'], repeat=1, pipeline=True, workdir=str(tmp_path), verbose=2)
+    assert 'pipeline' not in results[0] and results[0]['clean']['files']>0
+    assert 'pipeline benchmark is skipped' in capsys.readouterr().out
+    assert 'pipeline' not in benchmark.run_suite(sizes=['small'], repeat=1, workdir=str(tmp_path), verbose=0)[0]
+
+
+def test_lazy_imports():
+    # A fresh interpreter: the modules of the test run are not imported yet.
+    results = benchmark.import_time('irelease', repeat=1)
+    assert 'irelease.irelease' in results['modules']
+    assert [m for m in results['modules'] if m.split('.')[0] in ('build', 'packaging', 'pyproject_hooks', 'http', 'twine', 'requests')] == []
+    assert [m for m in benchmark.LAZY_MODULES if m in results['modules']] == []
+
+
+def test_check_import_time(capsys):
+    assert benchmark.check_import_time(results={'time': 10.0, 'times': [10.0], 'modules': ['irelease', 'json']}, verbose=0)
+    assert not benchmark.check_import_time(results={'time': 10.0, 'times': [10.0], 'modules': ['irelease', 'packaging']}, verbose=1)
+    assert 'modules are imported at startup: packaging' in capsys.readouterr().out
+    assert not benchmark.check_import_time(results={'time': 500.0, 'times': [500.0], 'modules': ['irelease']}, budget=100, verbose=0)
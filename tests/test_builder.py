@@ -0,0 +1,136 @@
+import os
+import pytest
+from irelease import builder, irelease
+from conftest import PYPROJECT, make_artifacts
+
+
+def test_copy_source(tmp_path):
+    srcdir = tmp_path / 'pkg'
+    for filepath in ['pyproject.toml', 'demo/__init__.py', 'demo/build/__init__.py', 'demo/__pycache__/x.pyc', '.git/HEAD', 'build/lib/demo/__init__.py',
+                     'dist/demo-0.1.0.tar.gz', 'demo.egg-info/PKG-INFO', '.venv/bin/python']:
+        (srcdir / filepath).parent.mkdir(parents=True, exist_ok=True)
+        (srcdir / filepath).write_text('')
+    outdir = builder._copy_source(str(srcdir), str(tmp_path / 'copy'))
+    copied = sorted(os.path.relpath(os.path.join(root, f), outdir) for root, _, files in os.walk(outdir) for f in files)
+    # Build output and environments are left out at the top level only, a subpackage named build is copied.
+    assert copied == ['demo/__init__.py', 'demo/build/__init__.py', 'pyproject.toml']
+
+
+def _write(filepath, content):
+    os.makedirs(os.path.dirname(filepath) or '.', exist_ok=True)
+    with open(filepath, 'w') as f:
+        f.write(content)
+
+
+@pytest.mark.parametrize('change', ['source', 'new file', 'metadata', 'readme', 'version'])
+def test_is_up_to_date(repo, change):
+    artifacts = make_artifacts('dist', name='demo', version='0.1.0')
+    builder.write_manifest('.', 'demo', '0.1.0', artifacts)
+    assert [os.path.basename(f) for f in builder.is_up_to_date('.', 'demo', '0.1.0')] == ['demo-0.1.0-py3-none-any.whl', 'demo-0.1.0.tar.gz']
+    # Byte code and other projects files do not change the sources.
+    _write('demo/__pycache__/x.pyc', '')
+    _write('notes.txt', '')
+    assert builder.is_up_to_date('.', 'demo', '0.1.0') is not None
+    version = '0.1.0'
+    if change=='source':
+        _write('demo/__init__.py', "__version__ = '0.1.0'\nx = 1\n")
+    elif change=='new file':
+        _write('demo/core.py', '')
+    elif change=='metadata':
+        _write('pyproject.toml', PYPROJECT + '\n[tool.irelease]\n')
+    elif change=='readme':
+        _write('README.md', '# demo\n')
+    else:
+        version = '0.2.0'
+    assert builder.is_up_to_date('.', 'demo', version) is None
+
+
+def test_is_up_to_date_artifacts(repo):
+    assert builder.is_up_to_date('.', 'demo', '0.1.0') is None
+    artifacts = make_artifacts('dist', name='demo', version='0.1.0')
+    builder.write_manifest('.', 'demo', '0.1.0', artifacts)
+    # An artifact that is changed or removed after the build
+    with open(artifacts[1], 'ab') as f:
+        f.write(b'x')
+    assert builder.is_up_to_date('.', 'demo', '0.1.0') is None
+    os.remove(artifacts[1])
+    assert builder.is_up_to_date('.', 'demo', '0.1.0') is None
+
+
+@pytest.fixture
+def build_calls(repo, tmp_path, monkeypatch):
+    # The build backend is replaced, the artifact store is empty.
+    from irelease import store
+    monkeypatch.setattr(store, 'CACHE_DIR', str(tmp_path / 'cache'))
+    calls = []
+
+    def _build_artifacts(srcdir, outdir, mode='single', runner=None, verbose=3):
+        calls.append(mode)
+        sdist, wheel = make_artifacts(outdir, name='demo', version=irelease._getversion('demo', cache=False))
+        return {'sdist': {'file': sdist}, 'wheel': {'file': wheel}}
+    monkeypatch.setattr(builder, 'build_artifacts', _build_artifacts)
+    return calls
+
+
+def test_build_reuses_dist(build_calls):
+    irelease._build_and_install('demo', '0.1.0', False, runner=object(), verbose=0)
+    irelease._build_and_install('demo', '0.1.0', False, runner=object(), verbose=0)
+    assert build_calls == ['single']
+    irelease._build_and_install('demo', '0.1.0', False, force_rebuild=True, runner=object(), verbose=0)
+    assert build_calls == ['single', 'single']
+    _write('demo/__init__.py', "__version__ = '0.2.0'\n")
+    irelease._build_and_install('demo', '0.2.0', False, runner=object(), verbose=0)
+    assert build_calls == ['single', 'single', 'single']
+    assert sorted(os.listdir('dist')) == ['.irelease-manifest.json', 'demo-0.1.0-py3-none-any.whl', 'demo-0.1.0.tar.gz', 'demo-0.2.0-py3-none-any.whl', 'demo-0.2.0.tar.gz']
+
+
+@pytest.fixture
+def created_envs(tmp_path, monkeypatch):
+    # No virtual environment and no pip: the environment is a directory with the requirements.
+    envs = []
+
+    def _create_env(envdir, requires=None, verbose=3):
+        envs.append(requires)
+        _write(os.path.join(envdir, 'requires.txt'), '\n'.join(requires) * 100)
+        return builder._env_python(envdir)
+    monkeypatch.setattr(builder, 'create_env', _create_env)
+    return envs
+
+
+def _set_requires(srcdir, requires):
+    _write(os.path.join(srcdir, 'pyproject.toml'), '[build-system]\nrequires = %s\nbuild-backend = "setuptools.build_meta"\n' %(requires))
+
+
+def test_cached_env(tmp_path, created_envs):
+    srcdir, cachedir = str(tmp_path / 'pkg'), str(tmp_path / 'cache')
+    _set_requires(srcdir, '["setuptools>=61"]')
+    python = builder.cached_env(srcdir, cachedir=cachedir, verbose=0)
+    assert builder.cached_env(srcdir, cachedir=cachedir, verbose=0) == python
+    assert created_envs == [['setuptools>=61']]
+    # Other build requirements give another environment, the previous one is kept.
+    _set_requires(srcdir, '["setuptools>=61", "wheel"]')
+    assert builder.cached_env(srcdir, cachedir=cachedir, verbose=0) != python
+    assert created_envs == [['setuptools>=61'], ['setuptools>=61', 'wheel']]
+    assert len(builder.list_envs(cachedir)) == 2
+    # Without a pyproject.toml the legacy build-system is used.
+    os.remove(os.path.join(srcdir, 'pyproject.toml'))
+    builder.cached_env(srcdir, cachedir=cachedir, verbose=0)
+    assert created_envs[-1] == builder.LEGACY_BUILD_SYSTEM['requires']
+
+
+def test_prune_envs(tmp_path, created_envs):
+    srcdir, cachedir = str(tmp_path / 'pkg'), str(tmp_path / 'cache')
+    keys = []
+    for requires in ['["a"]', '["b"]', '["c"]']:
+        _set_requires(srcdir, requires)
+        builder.cached_env(srcdir, cachedir=cachedir, max_envs=2, verbose=0)
+        keys.append(builder.env_key(builder.build_system(srcdir)))
+    # The least recently used environment is removed above max_envs.
+    assert [e['key'] for e in builder.list_envs(cachedir)] == [keys[2], keys[1]]
+    assert not os.path.exists(os.path.join(cachedir, 'build-envs', keys[0]))
+    # And above max_size, except the environment that is in use.
+    size = builder.list_envs(cachedir)[0]['size']
+    assert builder.prune_envs(cachedir=cachedir, max_size=size, verbose=0) == [keys[1]]
+    assert builder.prune_envs(cachedir=cachedir, max_envs=0, max_size=0, keep=[keys[2]], verbose=0) == []
+    assert builder.prune_envs(cachedir=cachedir, max_envs=0, max_size=0, verbose=0) == [keys[2]]
+    assert builder.list_envs(cachedir) == []
@@ -0,0 +1,40 @@
+from irelease import bump
+
+PYPROJECT = '''[build-system]
+requires = ["setuptools>=61"]
+build-backend = "setuptools.build_meta"
+
+[tool.other]
+version = "9.9.9"
+
+[project]  # metadata
+name = "demo"
+dependencies = [
+    "requests",
+]
+version = "0.1.0"
+
+[project.urls]
+Homepage = "https://example.com"
+
+[tool.commitizen]
+version = "0.1.0"
+'''
+
+
+def test_next_version():
+    assert bump.next_version('0.1.0', 'patch') == '0.1.1'
+    assert bump.next_version('0.1.9', 'minor') == '0.2.0'
+    assert bump.next_version('1.2.3', 'major') == '2.0.0'
+
+
+def test_pyproject_project_table_only(repo):
+    with open('pyproject.toml', 'w') as f:
+        f.write(PYPROJECT)
+    occurrences = [(o['file'], o['line'], o['version']) for o in bump.find_versions(repo, initfile='demo/__init__.py')]
+    assert occurrences == [('pyproject.toml', 13, '0.1.0'), ('demo/__init__.py', 1, '0.1.0')]
+
+    results = bump.bump('patch', srcdir=repo, verbose=0)
+    assert results['version'] == '0.1.1'
+    with open('pyproject.toml') as f:
+        assert f.read() == PYPROJECT.replace('version = "0.1.0"\n\n[project.urls]', 'version = "0.1.1"\n\n[project.urls]')
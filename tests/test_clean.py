@@ -0,0 +1,71 @@
+import os
+from irelease import clean
+
+FILES = [
+    'demo/__init__.py', 'demo/__pycache__/x.cpython-311.pyc', 'demo/sub/__pycache__/y.cpython-311.pyc', 'demo/sub/z.pyc', 'demo/build/keep.py',
+    'dist/demo-0.1.0.tar.gz', 'build/lib/demo/__init__.py', 'demo.egg-info/PKG-INFO', 'src/demo.egg-info/PKG-INFO', 'docs/notes.egg-info/keep.txt',
+    'docs/_build/index.html', '.pytest_cache/v/cache', '.git/objects/x.pyc', '.venv/lib/__pycache__/a.pyc', 'data/dist/keep.txt',
+]
+
+
+def _tree(srcdir, files=FILES):
+    for filepath in files:
+        filepath = os.path.join(srcdir, filepath)
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        with open(filepath, 'w') as f:
+            f.write('12345')
+    return srcdir
+
+
+def _files(srcdir):
+    return sorted(os.path.relpath(os.path.join(root, f), srcdir).replace(os.sep, '/') for root, _, files in os.walk(srcdir) for f in files)
+
+
+def test_default_patterns(tmp_path):
+    srcdir = _tree(str(tmp_path))
+    # '**/' patterns match at any depth, the others only from the root: demo/build and data/dist are kept.
+    # .git and virtual environments are never walked into.
+    assert clean.find_matches(srcdir) == ['.pytest_cache', 'build', 'demo.egg-info', 'demo/__pycache__', 'demo/sub/__pycache__', 'demo/sub/z.pyc', 'dist', 'src/demo.egg-info']
+    results = clean.clean(srcdir, verbose=0)
+    assert (results['files'], results['bytes'], results['errors']) == (8, 40, {})
+    assert _files(srcdir) == ['.git/objects/x.pyc', '.venv/lib/__pycache__/a.pyc', 'data/dist/keep.txt', 'demo/__init__.py', 'demo/build/keep.py',
+                              'docs/_build/index.html', 'docs/notes.egg-info/keep.txt']
+
+
+def test_extend_clean(tmp_path):
+    srcdir = _tree(str(tmp_path))
+    with open(os.path.join(srcdir, 'pyproject.toml'), 'w') as f:
+        f.write('[tool.irelease]\nextend-clean = ["docs/_build", "**/keep.txt"]\n')
+    assert clean.find_matches(srcdir) == ['.pytest_cache', 'build', 'data/dist/keep.txt', 'demo.egg-info', 'demo/__pycache__', 'demo/sub/__pycache__', 'demo/sub/z.pyc', 'dist',
+                                          'docs/_build', 'docs/notes.egg-info/keep.txt', 'src/demo.egg-info']
+
+
+def test_clean_replaces_defaults(tmp_path):
+    srcdir = _tree(str(tmp_path))
+    with open(os.path.join(srcdir, 'pyproject.toml'), 'w') as f:
+        f.write('[tool.irelease]\nclean = ["dist"]\nextend-clean = ["build"]\n')
+    assert clean.read_patterns(srcdir) == ['dist', 'build']
+    clean.clean(srcdir, verbose=0)
+    removed = set(FILES) - set(_files(srcdir))
+    assert removed == {'dist/demo-0.1.0.tar.gz', 'build/lib/demo/__init__.py'}
+
+
+def test_dry_run(tmp_path, capsys):
+    srcdir = _tree(str(tmp_path))
+    before = _files(srcdir)
+    results = clean.clean(srcdir, dry_run=True, verbose=3)
+    assert _files(srcdir) == before
+    assert (results['files'], results['bytes']) == (8, 40)
+    out = capsys.readouterr().out
+    assert '[dist] would be removed (1 files, 5 B)' in out and 'Would free 8 files (40 B) in 8 paths' in out
+
+
+def test_symlinks_are_not_followed(tmp_path):
+    outside = _tree(str(tmp_path / 'outside'), ['build/keep.txt'])
+    srcdir = _tree(str(tmp_path / 'pkg'), ['demo/__init__.py'])
+    os.symlink(os.path.join(outside, 'build'), os.path.join(srcdir, 'build'))
+    os.symlink(outside, os.path.join(srcdir, 'demo', 'link'))
+    assert clean.find_matches(srcdir) == ['build']
+    clean.clean(srcdir, verbose=0)
+    # The link is removed, not the directory it points to.
+    assert not os.path.lexists(os.path.join(srcdir, 'build')) and os.path.isfile(os.path.join(outside, 'build', 'keep.txt'))
@@ -0,0 +1,146 @@
+import os
+import json
+import pytest
+from irelease import discover
+from conftest import git
+
+
+def _project(path, files):
+    for filepath, content in files.items():
+        filepath = os.path.join(str(path), filepath)
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        with open(filepath, 'w') as f:
+            f.write(content)
+    return str(path)
+
+
+def _touch(filepath, seconds=10):
+    # A modification time that differs from the cached one, also on file systems with a coarse resolution.
+    stat = os.stat(filepath)
+    os.utime(filepath, ns=(stat.st_atime_ns, stat.st_mtime_ns + seconds * 10 ** 9))
+
+
+INIT = "__version__ = '0.1.0'\n"
+
+LAYOUTS = {
+    # Flat layout, found without any package configuration. tests/ and docs/ are never the package.
+    'flat': ({'pyproject.toml': '[project]\nname = "demo"\ndynamic = ["version"]\n', 'demo/__init__.py': INIT, 'tests/__init__.py': '', 'docs/__init__.py': ''},
+             {'name': 'demo', 'packagename': 'demo', 'packagedir': 'demo', 'initfile': 'demo/__init__.py', 'layout': 'flat', 'source': 'pyproject.toml'}),
+    # The src-layout wins over the flat layout, like the auto-discovery of setuptools.
+    'src': ({'pyproject.toml': '[project]\nname = "demo"\n', 'src/demo/__init__.py': INIT, 'other/__init__.py': ''},
+            {'packagename': 'demo', 'packagedir': 'src/demo', 'initfile': 'src/demo/__init__.py', 'layout': 'src'}),
+    # The package with the normalized name of the project, not the first one.
+    'name': ({'pyproject.toml': '[project]\nname = "My-Pkg"\n', 'alpha/__init__.py': '', 'my_pkg/__init__.py': INIT},
+             {'name': 'My-Pkg', 'packagename': 'my_pkg'}),
+    'packages': ({'pyproject.toml': '[project]\nname = "demo"\n[tool.setuptools]\npackages = ["demo.sub", "demo"]\n', 'demo/__init__.py': INIT},
+                 {'packagename': 'demo', 'packagedir': 'demo'}),
+    'package_dir': ({'setup.cfg': '[metadata]\nname = demo\n[options]\npackage_dir =\n    =lib\npackages = find:\n', 'lib/demo/__init__.py': INIT},
+                    {'packagename': 'demo', 'packagedir': 'lib/demo', 'layout': 'src', 'source': 'setup.cfg'}),
+    'namespace': ({'setup.cfg': '[metadata]\nname = ns.demo\n[options]\npackages = find_namespace:\n[options.packages.find]\nwhere = src\n', 'src/ns/demo/__init__.py': INIT},
+                  {'packagename': 'ns.demo', 'packagedir': 'src/ns/demo', 'initfile': 'src/ns/demo/__init__.py'}),
+    'module': ({'pyproject.toml': '[project]\nname = "demo"\n[tool.setuptools]\npy-modules = ["demo"]\n', 'demo.py': INIT},
+               {'packagename': 'demo', 'packagedir': None, 'initfile': 'demo.py', 'layout': 'module'}),
+    # setup.py is parsed, never executed: module constants are resolved.
+    'setup.py': ({'setup.py': "import sys\nfrom setuptools import setup, find_packages\nNAME = 'demo'\nsys.exit('executed')\nsetup(name=NAME, packages=find_packages(where='src'), package_dir={'': 'src'})\n",
+                  'src/demo/__init__.py': INIT},
+                 {'name': 'demo', 'packagename': 'demo', 'packagedir': 'src/demo', 'source': 'setup.py'}),
+    # Without metadata the package directory is guessed.
+    'guess': ({'demo/__init__.py': INIT}, {'name': 'demo', 'packagename': 'demo', 'source': None}),
+}
+
+
+@pytest.mark.parametrize('layout', LAYOUTS)
+def test_layout(tmp_path, layout):
+    files, expected = LAYOUTS[layout]
+    result = discover.discover(_project(tmp_path, files), cache=False)
+    assert {key: result[key] for key in expected} == expected
+    assert result['version'] == '0.1.0'
+
+
+VERSIONS = {
+    'pyproject': ({'pyproject.toml': '[project]\nname = "demo"\nversion = "1.2.3"\n', 'demo/__init__.py': ''}, 'pyproject.toml', 'demo/__init__.py'),
+    'setup.cfg': ({'setup.cfg': '[metadata]\nname = demo\nversion = 1.2.3\n', 'demo/__init__.py': ''}, 'setup.cfg', 'demo/__init__.py'),
+    'setup.py': ({'setup.py': "VERSION = '1.2.3'\nsetup(name='demo', version=VERSION)\n", 'demo/__init__.py': ''}, 'setup.py', 'demo/__init__.py'),
+    'attr': ({'pyproject.toml': '[project]\nname = "demo"\ndynamic = ["version"]\n[tool.setuptools.dynamic]\nversion = {attr = "demo._version.__version__"}\n',
+              'demo/__init__.py': '', 'demo/_version.py': "__version__ = '1.2.3'\n"}, 'demo/_version.py', 'demo/_version.py'),
+    'attr setup.cfg': ({'setup.cfg': '[metadata]\nname = demo\nversion = attr: demo.__version__\n[options]\npackage_dir =\n    =src\n', 'src/demo/__init__.py': "__version__ = '1.2.3'\n"},
+                       'src/demo/__init__.py', 'src/demo/__init__.py'),
+    'file': ({'setup.cfg': '[metadata]\nname = demo\nversion = file: VERSION\n', 'demo/__init__.py': '', 'VERSION': '1.2.3\n'}, 'VERSION', 'VERSION'),
+    'setuptools file': ({'pyproject.toml': '[project]\nname = "demo"\n[tool.setuptools.dynamic]\nversion = {file = ["VERSION.txt"]}\n', 'demo/__init__.py': '', 'VERSION.txt': '1.2.3'},
+                        'VERSION.txt', 'VERSION.txt'),
+    'hatch': ({'pyproject.toml': '[project]\nname = "demo"\n[tool.hatch.version]\npath = "demo/about.py"\n', 'demo/__init__.py': '', 'demo/about.py': "__version__ = '1.2.3'\n"},
+              'demo/about.py', 'demo/about.py'),
+    'init': ({'pyproject.toml': '[project]\nname = "demo"\n', 'demo/__init__.py': "__version__ = '1.2.3'\n"}, 'demo/__init__.py', 'demo/__init__.py'),
+}
+
+
+@pytest.mark.parametrize('source', VERSIONS)
+def test_version(tmp_path, source):
+    files, versionfile, initfile = VERSIONS[source]
+    result = discover.discover(_project(tmp_path, files), cache=False)
+    assert (result['version'], result['versionfile'], result['initfile']) == ('1.2.3', versionfile, initfile)
+
+
+def test_no_version(tmp_path):
+    result = discover.discover(_project(tmp_path, {'pyproject.toml': '[project]\nname = "demo"\n', 'demo/__init__.py': ''}), cache=False)
+    assert (result['packagename'], result['version']) == ('demo', None)
+
+
+def test_invalid_metadata_is_skipped(tmp_path):
+    result = discover.discover(_project(tmp_path, {'pyproject.toml': '[project\nname =', 'setup.cfg': '[metadata]\nname = demo\n', 'demo/__init__.py': INIT}), cache=False)
+    assert (result['name'], result['source']) == ('demo', 'setup.cfg')
+
+
+@pytest.fixture
+def project(tmp_path):
+    path = _project(tmp_path / 'demo', {'pyproject.toml': '[project]\nname = "demo"\n', 'demo/__init__.py': INIT})
+    git(path, 'init', '-q')
+    return path
+
+
+def test_cache(project, monkeypatch):
+    cachefile = os.path.join(project, '.git', 'irelease', discover.CACHE_FILE)
+    assert discover.discover(project)['version'] == '0.1.0'
+    with open(cachefile, 'r') as f:
+        entry = json.load(f)[project]
+    # The version changes every release, it is read from the file and not cached.
+    assert entry['result']['packagename'] == 'demo' and entry['result']['version'] is None
+    monkeypatch.setattr(discover, '_discover', lambda srcdir: pytest.fail('the cache is not used'))
+    assert discover.discover(project)['packagename'] == 'demo'
+
+
+@pytest.mark.parametrize('change', ['pyproject.toml', 'setup.cfg', 'src', 'cache version'])
+def test_cache_invalidation(project, change):
+    discover.discover(project)
+    expected = ('other', 'other')
+    if change=='pyproject.toml':
+        _project(project, {'pyproject.toml': '[project]\nname = "other"\n', 'other/__init__.py': INIT})
+        _touch(os.path.join(project, 'pyproject.toml'))
+    elif change=='setup.cfg':
+        _project(project, {'setup.cfg': '[metadata]\nname = other\n', 'other/__init__.py': INIT})
+    elif change=='src':
+        # A new src-layout is found because the directories that are scanned changed.
+        _project(project, {'src/demo/__init__.py': INIT})
+        _touch(project)
+        expected = ('demo', 'src/demo')
+    else:
+        # A cache of another version of irelease is not used.
+        cachefile = os.path.join(project, '.git', 'irelease', discover.CACHE_FILE)
+        with open(cachefile, 'r') as f:
+            data = json.load(f)
+        data[project]['stamp'][0] = discover.CACHE_VERSION - 1
+        data[project]['result']['packagename'] = 'stale'
+        with open(cachefile, 'w') as f:
+            json.dump(data, f)
+        expected = ('demo', 'demo')
+    result = discover.discover(project)
+    assert (result['packagename'], result['packagedir']) == expected
+
+
+def test_cache_modes(project):
+    cachefile = os.path.join(project, '.git', 'irelease', discover.CACHE_FILE)
+    discover.discover(project, cache=False)
+    discover.discover(project, cache='read')
+    assert not os.path.exists(cachefile)
+    discover.discover(project)
+    assert os.path.isfile(cachefile)
@@ -0,0 +1,112 @@
+import os
+import sys
+import time
+import pytest
+from irelease import gitops, irelease, pipeline, runner
+from conftest import git
+
+
+def test_latest_version():
+    tags = ['0.1.0', 'v0.3.0', '0.10.0rc1', 'notaversion', 'pkg-2.0.0']
+    assert gitops.latest_version(tags) == 'v0.3.0'
+    assert gitops.latest_version(tags, prereleases=True) == '0.10.0rc1'
+    assert gitops.latest_version(tags, prefix='pkg-') == '2.0.0'
+    assert gitops.latest_version([]) == gitops.NO_RELEASE
+
+
+def test_list_tags(repo):
+    git(repo, 'tag', '0.1.0')
+    git(repo, 'tag', '-a', 'release/0.2.0', '-m', 'annotated')
+    git(repo, 'pack-refs', '--all')
+    git(repo, 'tag', '0.3.0')
+    assert gitops.list_tags(repo) == gitops.list_tags(repo, method='git') == ['0.1.0', '0.3.0', 'release/0.2.0']
+
+
+def test_branch(repo):
+    repo_git = gitops.Git(repo, verbose=0)
+    assert repo_git.branch() == 'master'
+    git(repo, 'checkout', '-q', '--detach')
+    assert repo_git.is_detached()
+    assert repo_git.timings == []
+
+
+def test_commit_all(repo):
+    repo_git = gitops.Git(repo, verbose=0)
+    assert repo_git.commit_all('nothing') is False
+    with open('demo/__init__.py', 'w') as f:
+        f.write("__version__ = '0.2.0'\n")
+    assert repo_git.commit_all('0.2.0') is True
+    assert git(repo, 'log', '-1', '--format=%s').strip() == '0.2.0'
+    assert [command.split()[0] for command, _ in repo_git.timings] == ['add', 'commit', 'diff', 'add', 'commit']
+
+
+def test_commit_all_hook_failure(repo):
+    with open('.git/hooks/pre-commit', 'w') as f:
+        f.write('#!/bin/sh\necho rejected by hook\nexit 1\n')
+    os.chmod('.git/hooks/pre-commit', 0o755)
+    with open('demo/__init__.py', 'w') as f:
+        f.write("__version__ = '0.2.0'\n")
+    with pytest.raises(gitops.GitError, match='rejected by hook'):
+        gitops.Git(repo, verbose=0).commit_all('0.2.0')
+
+
+def test_tag(repo):
+    repo_git = gitops.Git(repo, verbose=0)
+    repo_git.tag('0.1.0')
+    assert git(repo, 'cat-file', '-t', '0.1.0').strip() == 'tag'
+    # An existing tag on HEAD is accepted, on another commit it is an error.
+    repo_git.tag('0.1.0')
+    git(repo, 'commit', '-q', '--allow-empty', '-m', 'next')
+    with pytest.raises(gitops.GitError, match='already exists'):
+        repo_git.tag('0.1.0')
+    assert [command.split()[0] for command, _ in repo_git.timings] == ['cat-file', 'tag', 'cat-file', 'cat-file']
+
+
+def test_resolve(repo):
+    head = git(repo, 'rev-parse', 'HEAD').strip()
+    assert gitops.Git(repo, verbose=0).resolve('HEAD', 'refs/tags/missing^{commit}') == [head, None]
+
+
+def test_push(repo, tmp_path):
+    remote = str(tmp_path / 'remote.git')
+    git(str(tmp_path), 'init', '-q', '--bare', remote)
+    git(repo, 'remote', 'set-url', 'origin', remote)
+    git(repo, 'tag', '0.1.0')
+    git(repo, 'tag', '0.0.9')
+    repo_git = gitops.Git(repo, verbose=0)
+    repo_git.push(tags=['0.1.0'])
+    assert git(remote, 'tag').split() == ['0.1.0']
+    assert git(remote, 'rev-parse', 'master') == git(repo, 'rev-parse', 'master')
+    assert len(repo_git.timings) == 1
+
+
+def _hang(path):
+    with open(path, 'w') as f:
+        f.write('#!/bin/sh\nsleep 60\n')
+    os.chmod(path, 0o755)
+
+
+@pytest.mark.skipif(sys.platform=='win32', reason='shell scripts')
+def test_pull_timeout(repo, tmp_path, monkeypatch, capsys):
+    # A hanging ssh connection (or credential prompt) is killed after the timeout of the step, the pull is a warning.
+    _hang(str(tmp_path / 'ssh.sh'))
+    git(repo, 'config', 'core.sshCommand', str(tmp_path / 'ssh.sh'))
+    git(repo, 'remote', 'set-url', 'origin', 'ssh://git@example.com/owner/demo.git')
+    monkeypatch.setitem(runner.TIMEOUTS, 'git_pull', 1)
+    start = time.time()
+    assert pipeline._step_git_pull({'packagename': 'demo', 'verbose': 2}) == {'pulled': False}
+    assert time.time() - start < 10
+    assert 'git pull timed out after 1s' in capsys.readouterr().out
+    assert os.path.isfile(os.path.join(repo, '.git', 'irelease', 'logs', 'demo', 'git_pull.log'))
+
+
+@pytest.mark.skipif(sys.platform=='win32', reason='shell scripts')
+def test_commit_timeout(repo, monkeypatch):
+    _hang('.git/hooks/pre-commit')
+    with open('demo/__init__.py', 'w') as f:
+        f.write("__version__ = '0.2.0'\n")
+    monkeypatch.setitem(runner.TIMEOUTS, 'git_commit', 1)
+    start = time.time()
+    with pytest.raises(gitops.GitError, match='git commit -m 0.2.0 timed out after 1s'):
+        irelease._set_tag_and_push('0.2.0', verbose=0)
+    assert time.time() - start < 10
@@ -0,0 +1,68 @@
+import pytest
+from irelease import gitrelease
+from mockserver import MockGitHub, MockGitLab
+from conftest import git
+
+
+def test_release_notes(repo):
+    git(repo, 'tag', '0.1.0')
+    for message in ['Fix the parser', '0.2.0', 'Add a feature']:
+        git(repo, 'commit', '-q', '--allow-empty', '-m', message)
+    git(repo, 'tag', '0.2.0')
+    notes = gitrelease.release_notes('0.2.0')
+    lines = notes.splitlines()
+    assert lines[0] == '## Changes since 0.1.0'
+    assert [line.rsplit(' (', 1)[0] for line in lines[2:]] == ['- Add a feature', '- Fix the parser']
+
+
+def test_create_github_release(repo, artifacts):
+    with MockGitHub({'owner/demo': ['0.0.1']}, token='secret') as github:
+        results = gitrelease.create_release('0.1.0', artifacts=artifacts, notes='Notes', host='github', api_url=github.url, token='secret', verbose=0)
+        release = github.releases['owner/demo'][-1]
+        assets = github.assets[release['id']]
+    assert results['status'] == 'created'
+    assert results['url'] == 'https://github.com/owner/demo/releases/tag/0.1.0'
+    assert [a['status'] for a in results['assets']] == ['uploaded', 'uploaded']
+    assert (release['tag_name'], release['name'], release['body'], release['prerelease']) == ('0.1.0', 'v0.1.0', 'Notes', False)
+    assert sorted(assets) == sorted(a.split('/')[-1] for a in artifacts)
+
+
+def test_create_github_release_exists(repo, artifacts):
+    with MockGitHub(token='secret') as github:
+        gitrelease.create_release('0.1.0', artifacts=artifacts[:1], notes='Notes', host='github', api_url=github.url, token='secret', verbose=0)
+        results = gitrelease.create_release('0.1.0', artifacts=artifacts, notes='Notes', host='github', api_url=github.url, token='secret', verbose=0)
+        assert len(github.releases['owner/demo']) == 1
+    assert results['status'] == 'exists'
+    assert [a['status'] for a in results['assets']] == ['skipped', 'uploaded']
+
+
+def test_create_github_prerelease(repo):
+    with MockGitHub() as github:
+        gitrelease.create_release('1.0.0rc1', notes='Notes', host='github', api_url=github.url, token='secret', verbose=0)
+        assert github.releases['owner/demo'][-1]['prerelease'] is True
+
+
+def test_create_github_release_bad_credentials(repo):
+    with MockGitHub(token='secret') as github:
+        with pytest.raises(Exception, match='HTTP 401'):
+            gitrelease.create_release('0.1.0', notes='Notes', host='github', api_url=github.url, token='wrong', verbose=0)
+
+
+def test_create_gitlab_release(repo, artifacts):
+    git(repo, 'remote', 'set-url', 'origin', 'https://gitlab.com/owner/group/demo.git')
+    with MockGitLab(token='secret') as gitlab:
+        results = gitrelease.create_release('0.1.0', artifacts=artifacts, notes='Notes', api_url=gitlab.api_url, token='secret', verbose=0)
+        release = gitlab.releases['owner/group/demo']['0.1.0']
+        web_url = gitlab.url + 'owner/group/demo/uploads/'
+    assert results['status'] == 'created'
+    assert [a['status'] for a in results['assets']] == ['uploaded', 'uploaded']
+    assert release['description'] == 'Notes'
+    assert sorted(link['name'] for link in release['links']) == sorted(a.split('/')[-1] for a in artifacts)
+    assert all(link['url'].startswith(web_url) for link in release['links'])
+
+
+def test_create_release_tag_is_not_a_version(repo):
+    with MockGitHub() as github:
+        results = gitrelease.create_release('nightly', notes='Notes', host='github', api_url=github.url, token='secret', verbose=0)
+        assert github.releases['owner/demo'][-1]['prerelease'] is False
+    assert results['status'] == 'created'
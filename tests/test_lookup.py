@@ -0,0 +1,70 @@
+import json
+from irelease.lookup import VersionClient, NO_RELEASE, NOT_FOUND
+from mockserver import MockGitHub
+
+
+def test_latest_version():
+    releases = {'owner/pkg': ['0.1.0', '0.2.0', {'tag_name': '0.3.0rc1', 'prerelease': True}], 'owner/empty': []}
+    with MockGitHub(releases) as github:
+        client = VersionClient(api_url=github.url, token='', cachedir=None, verbose=0)
+        assert client.latest_version('owner', 'pkg') == '0.2.0'
+        assert client.latest_version('owner', 'empty') == NO_RELEASE
+        assert client.latest_version('owner', 'missing') == NOT_FOUND
+        client.close()
+
+
+def test_etag_revalidation(tmp_path):
+    with MockGitHub({'owner/pkg': ['0.1.0']}) as github:
+        client = VersionClient(api_url=github.url, token='', cachedir=str(tmp_path), verbose=0)
+        assert client.latest_version('owner', 'pkg') == '0.1.0'
+        client.close()
+        cachefile = tmp_path / 'versions.json'
+        cache = json.loads(cachefile.read_text())
+        (url, entry), = cache.items()
+        assert entry['etag'] and entry['version'] == '0.1.0'
+
+        # Not modified: the version comes from the cache, as the sentinel shows.
+        cache[url]['version'] = 'cached'
+        cachefile.write_text(json.dumps(cache))
+        client = VersionClient(api_url=github.url, token='', cachedir=str(tmp_path), verbose=0)
+        assert client.latest_version('owner', 'pkg') == 'cached'
+
+        # Modified: the ETag changes and the new release is returned and cached.
+        github.releases['owner/pkg'].append({'tag_name': '0.2.0'})
+        assert client.latest_version('owner', 'pkg') == '0.2.0'
+        client.close()
+        assert json.loads(cachefile.read_text())[url]['etag'] != entry['etag']
+
+
+def test_offline_uses_cache(tmp_path):
+    with MockGitHub({'owner/pkg': ['0.1.0']}) as github:
+        url = github.url
+        client = VersionClient(api_url=url, token='', cachedir=str(tmp_path), verbose=0)
+        assert client.latest_version('owner', 'pkg') == '0.1.0'
+        client.close()
+    client = VersionClient(api_url=url, token='', cachedir=str(tmp_path), verbose=0)
+    assert client.latest_version('owner', 'pkg') == '0.1.0'
+    client.close()
+
+
+def test_latest_versions():
+    with MockGitHub({'owner/a': ['1.0.0'], 'owner/b': ['2.0.0']}) as github:
+        client = VersionClient(api_url=github.url, token='', cachedir=None, verbose=0)
+        assert client.latest_versions([('owner', 'a'), ('owner', 'b'), ('owner', 'a')]) == {('owner', 'a'): '1.0.0', ('owner', 'b'): '2.0.0'}
+        assert client.latest_versions_graphql([('owner', 'a'), ('owner', 'c')]) == {('owner', 'a'): '1.0.0', ('owner', 'c'): NOT_FOUND}
+        client.close()
+
+
+def test_read_only_cache(tmp_path):
+    with MockGitHub({'owner/pkg': ['0.1.0']}) as github:
+        client = VersionClient(api_url=github.url, token='', cachedir=str(tmp_path), verbose=0)
+        assert client.latest_version('owner', 'pkg') == '0.1.0'
+        client.close()
+        cachefile = tmp_path / 'versions.json'
+        before = cachefile.read_text()
+
+        github.releases['owner/pkg'].append({'tag_name': '0.2.0'})
+        client = VersionClient(api_url=github.url, token='', cachedir=str(tmp_path), cache='read', verbose=0)
+        assert client.latest_version('owner', 'pkg') == '0.2.0'
+        client.close()
+    assert cachefile.read_text() == before
@@ -0,0 +1,109 @@
+import os
+import sys
+import asyncio
+import pytest
+from irelease import batch, gitops, irelease, pipeline
+from conftest import git
+
+
+def test_git_pull_failure_is_a_warning(repo, tmp_path, capsys):
+    # The remote does not exist: the pull fails, the release goes on.
+    git(repo, 'remote', 'set-url', 'origin', str(tmp_path / 'missing.git'))
+    assert pipeline._step_git_pull({'verbose': 3}) == {'pulled': False}
+    assert '[irelease] Warning:' in capsys.readouterr().out
+
+
+def test_git_pull(repo, tmp_path):
+    remote = str(tmp_path / 'remote.git')
+    git(str(tmp_path), 'init', '-q', '--bare', remote)
+    git(repo, 'remote', 'set-url', 'origin', remote)
+    git(repo, 'push', '-q', '-u', 'origin', 'master')
+    assert pipeline._step_git_pull({'verbose': 0}) == {'pulled': True}
+
+
+VERSION_SOURCES = {
+    'pyproject': {'pyproject.toml': '[project]\nname = "demo"\nversion = "1.2.3"\n'},
+    'setup.cfg': {'setup.cfg': '[metadata]\nname = demo\nversion = 1.2.3\n'},
+    'setup.py': {'setup.py': "from setuptools import setup\nsetup(name='demo', version='1.2.3')\n"},
+    'attr': {'pyproject.toml': '[project]\nname = "demo"\ndynamic = ["version"]\n[tool.setuptools.dynamic]\nversion = {attr = "demo._version.__version__"}\n',
+             'demo/_version.py': "__version__ = '1.2.3'\n"},
+    'file': {'setup.cfg': '[metadata]\nname = demo\nversion = file: VERSION\n', 'VERSION': '1.2.3\n'},
+    'init': {'demo/__init__.py': "__version__ = '1.2.3'\n"},
+}
+
+
+def _write_project(repo, files):
+    # The package of the repo fixture with its version in one place only.
+    os.remove(os.path.join(repo, 'pyproject.toml'))
+    files = dict({'demo/__init__.py': ''}, **files)
+    for filepath, content in files.items():
+        with open(os.path.join(repo, filepath), 'w') as f:
+            f.write(content)
+
+
+@pytest.mark.parametrize('source', VERSION_SOURCES)
+def test_release_metadata_version(repo, source):
+    _write_project(repo, VERSION_SOURCES[source])
+    assert pipeline._release_metadata({'verbose': 0})['current_version'] == '1.2.3'
+
+
+@pytest.mark.parametrize('source', VERSION_SOURCES)
+def test_run_version(repo, source, monkeypatch):
+    # The interactive release resolves the version like the pipeline.
+    _write_project(repo, VERSION_SOURCES[source])
+    calls = []
+    monkeypatch.setattr(irelease, '_try_to_release', lambda *args, **kwargs: calls.append(args[2]))
+    irelease.run(None, None, verbose=2)
+    assert calls == ['1.2.3']
+
+
+def test_release_metadata_without_version(repo):
+    _write_project(repo, {'pyproject.toml': '[project]\nname = "demo"\ndynamic = ["version"]\n'})
+    with pytest.raises(Exception, match='Unable to find version string in demo/__init__.py'):
+        pipeline._release_metadata({'verbose': 0})
+
+
+def test_state_filepath_worktree(repo, tmp_path, monkeypatch):
+    # The checkpoint is shared by all worktrees, a temporary worktree of --worktree is not checkpointed.
+    assert pipeline.state_filepath('demo') == os.path.join(repo, '.git', 'irelease', 'demo.json')
+    linked = str(tmp_path / 'linked')
+    git(repo, 'worktree', 'add', '-q', linked)
+    monkeypatch.chdir(linked)
+    assert pipeline.state_filepath('demo') == os.path.join(repo, '.git', 'irelease', 'demo.json')
+    with gitops.worktree(repo, verbose=0) as workdir:
+        monkeypatch.chdir(workdir)
+        assert gitops.is_temporary_worktree(workdir)
+        assert pipeline.state_filepath('demo') is None
+        with pytest.raises(ValueError, match='Resume can not be used with a worktree'):
+            pipeline.release(upload=False, resume=True, verbose=0)
+        monkeypatch.chdir(repo)
+
+
+def test_resume_with_worktree_is_refused(repo, monkeypatch, capsys):
+    result = batch.release_package(repo, upload=False, resume=True, worktree=True, verbose=0)
+    assert result['status'] == 'failed' and 'Resume can not be used with a worktree' in result['error']
+    monkeypatch.setattr(sys, 'argv', ['irelease', '-y', '--worktree', '--resume'])
+    with pytest.raises(SystemExit) as exit:
+        irelease.main()
+    assert exit.value.code == 1
+    assert '--resume can not be used with --worktree' in capsys.readouterr().out
+    assert git(repo, 'worktree', 'list').count('\n') == 1
+
+
+def _fail(ctx):
+    raise Exception('Backend is not available.')
+
+
+@pytest.mark.parametrize('runner', ['threads', 'asyncio'])
+def test_failed_step_timing(runner):
+    # The time until a step failed is in the timings, the steps that did not start are not.
+    steps = [pipeline.Step('clean', lambda ctx: {'cleaned': True}, provides=['cleaned']),
+             pipeline.Step('build', _fail, requires=['cleaned'], provides=['artifacts']),
+             pipeline.Step('upload', lambda ctx: {}, requires=['artifacts'])]
+    if runner=='threads':
+        results = pipeline.run_pipeline(steps, verbose=0)
+    else:
+        from irelease import aio
+        results = asyncio.run(aio.run_pipeline_async(steps, verbose=0))
+    assert (results['status'], results['failed'], results['error']) == ('failed', 'build', 'Backend is not available.')
+    assert sorted(results['timings']) == ['build', 'clean']
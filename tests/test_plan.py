@@ -0,0 +1,63 @@
+import os
+import sys
+import pytest
+from irelease import irelease, pipeline, plan
+from irelease.discover import discover
+from conftest import git
+
+
+def _snapshot(path):
+    return {os.path.join(root, f): os.stat(os.path.join(root, f)).st_mtime_ns for root, _, files in os.walk(path) for f in files}
+
+
+def test_plan_release(repo):
+    git(repo, 'tag', '0.0.1')
+    result = plan.plan_release(repo, upload=False)
+    assert (result['action'], result['reason']) == ('release', None)
+    assert (result['name'], result['version'], result['released'], result['tag']) == ('demo', '0.1.0', '0.0.1', '0.1.0')
+    assert result['artifacts'] == ['demo-0.1.0.tar.gz', 'demo-0.1.0-py3-none-any.whl']
+    assert result['push'] == 'origin refs/heads/master refs/tags/0.1.0'
+
+
+def test_plan_skip(repo):
+    git(repo, 'tag', '0.1.0')
+    assert plan.plan_release(repo, upload=False)['action'] == 'skip'
+
+
+def test_plan_without_side_effects(repo):
+    # Nothing in the working copy or the .git directory is written, not even the discovery cache.
+    with open('notes.txt', 'w') as f:
+        f.write('uncommitted')
+    before = _snapshot(repo)
+    result = plan.plan_release(repo, upload=False)
+    assert result['commit'] == ['notes.txt']
+    assert _snapshot(repo) == before
+    assert not os.path.exists(os.path.join(repo, '.git', 'irelease', 'discovery.json'))
+
+
+def test_plan_reads_discovery_cache(repo):
+    discover(repo)
+    cachefile = os.path.join(repo, '.git', 'irelease', 'discovery.json')
+    before = os.stat(cachefile).st_mtime_ns
+    assert plan.plan_release(repo, upload=False)['action'] == 'release'
+    assert os.stat(cachefile).st_mtime_ns == before
+
+
+def test_plan_unreleasable_version(repo, monkeypatch):
+    # The plan resolves the version like the release: no version is an error with exit code 1, not a release.
+    with open('pyproject.toml', 'w') as f:
+        f.write('[project]\nname = "demo"\nversion = "1.2.3"\n')
+    with open('demo/__init__.py', 'w') as f:
+        f.write('')
+    assert plan.plan_release(repo, upload=False)['version'] == '1.2.3'
+
+    with open('pyproject.toml', 'w') as f:
+        f.write('[project]\nname = "demo"\ndynamic = ["version"]\n')
+    result = plan.plan_release(repo, upload=False)
+    with pytest.raises(Exception) as error:
+        pipeline._release_metadata({'verbose': 0})
+    assert (result['action'], result['reason']) == ('error', str(error.value))
+    monkeypatch.setattr(sys, 'argv', ['irelease', 'plan', repo])
+    with pytest.raises(SystemExit) as exit:
+        irelease.main()
+    assert exit.value.code == 1
@@ -0,0 +1,113 @@
+import os
+import base64
+import asyncio
+import shutil
+import pytest
+from irelease import publish
+from mockserver import MockIndex
+from conftest import make_artifacts
+
+CREDENTIALS = 'Basic ' + base64.b64encode(b'__token__:secret').decode('ascii')
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    # Package directory with dist/, without .pypirc or credentials of the user.
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('HOME', str(tmp_path))
+    for key in ['TWINE_USERNAME', 'TWINE_PASSWORD', 'TWINE_REPOSITORY', 'TWINE_REPOSITORY_URL']:
+        monkeypatch.delenv(key, raising=False)
+    make_artifacts(str(tmp_path / 'dist'))
+    return tmp_path
+
+
+def _write_targets(path, targets):
+    lines = ['[tool.irelease]', 'publish = [%s]' %(', '.join('"%s"' %(name) for name in targets))]
+    for name, settings in targets.items():
+        lines += ['', '[tool.irelease.targets.%s]' %(name)] + ['%s = %s' %(key, value if isinstance(value, int) else '"%s"' %(value)) for key, value in settings.items()]
+    (path / 'pyproject.toml').write_text('\n'.join(lines) + '\n')
+
+
+def test_read_targets(project):
+    assert [(t['name'], t['implicit']) for t in publish.read_targets()] == [('pypi', True)]
+    targets = publish.read_targets(repository_url='http://mirror.example.com/legacy/')
+    assert [(t['name'], t['repository_url'], t['implicit']) for t in targets] == [('mirror.example.com', 'http://mirror.example.com/legacy/', False)]
+
+
+def test_repository_url_credentials(project, monkeypatch):
+    monkeypatch.setenv('TWINE_PASSWORD', 'secret')
+    target, = publish.read_targets(repository_url='http://mirror.example.com/legacy/')
+    assert (target['username'], target['password']) == ('__token__', 'secret')
+
+
+def test_publish_to_repository_url(project, monkeypatch):
+    monkeypatch.setenv('TWINE_PASSWORD', 'secret')
+    with MockIndex(credentials=CREDENTIALS) as mirror:
+        results = publish.publish(['dist/' + f for f in sorted(os.listdir('dist'))], repository_url=mirror.url, verbose=0)
+    assert [(r['repository_url'], r['status'], r['uploaded']) for r in results] == [(mirror.url, 'uploaded', 2)]
+    assert sorted(mirror.files['demo-pkg']) == sorted(os.listdir('dist'))
+
+
+@pytest.mark.skipif(shutil.which('twine') is None, reason='twine is not installed')
+def test_publish_twine_to_repository_url(project, monkeypatch):
+    # Twine must upload to the mirror, not to its default repository (here a closed port instead of pypi).
+    monkeypatch.setenv('TWINE_PASSWORD', 'secret')
+    monkeypatch.setenv('TWINE_REPOSITORY_URL', 'http://127.0.0.1:9/legacy/')
+    with MockIndex(credentials=CREDENTIALS) as mirror:
+        results = publish.publish(['dist/' + f for f in sorted(os.listdir('dist'))], twine=shutil.which('twine'), repository_url=mirror.url, verbose=0)
+    assert results[0]['status'] == 'uploaded', results[0]['error']
+    assert sorted(mirror.files['demo-pkg']) == sorted(os.listdir('dist'))
+
+
+@pytest.mark.skipif(shutil.which('twine') is None, reason='twine is not installed')
+def test_async_twine_to_repository_url(project, monkeypatch):
+    from irelease import aio
+    monkeypatch.setenv('TWINE_PASSWORD', 'secret')
+    monkeypatch.setenv('TWINE_REPOSITORY_URL', 'http://127.0.0.1:9/legacy/')
+    with MockIndex(credentials=CREDENTIALS) as mirror:
+        ctx = {'upload': True, 'twine': shutil.which('twine'), 'repository_url': mirror.url, 'packagename': 'demo_pkg', 'verbose': 0,
+               'artifacts': ['dist/' + f for f in sorted(os.listdir('dist'))]}
+        assert asyncio.run(aio._step_upload(ctx)) == {'uploaded': True}
+    assert sorted(mirror.files['demo-pkg']) == sorted(os.listdir('dist'))
+
+
+def test_publish_partial_failure(project, no_sleep):
+    with MockIndex() as good, MockIndex(fail_first=100) as flaky, MockIndex(credentials=CREDENTIALS) as private:
+        _write_targets(project, {'good': {'repository': good.url, 'password': 'x'}, 'flaky': {'repository': flaky.url, 'retries': 2, 'password': 'x'},
+                                 'private': {'repository': private.url, 'password': 'wrong'}})
+        artifacts = ['dist/' + f for f in sorted(os.listdir('dist'))]
+        results = {r['name']: r for r in publish.publish(artifacts, verbose=0)}
+        good_files, private_attempts = sorted(good.files['demo-pkg']), private.attempts
+    assert results['good']['status'] == 'uploaded'
+    assert results['good']['uploaded'] == 2
+    assert good_files == sorted(os.listdir('dist'))
+    # Server errors are retried per file, client errors are not.
+    assert results['flaky']['status'] == 'failed'
+    assert (results['flaky']['failed'], results['flaky']['attempts']) == (2, 3)
+    assert 'HTTP 503' in results['flaky']['error']
+    assert results['private']['status'] == 'failed'
+    assert (results['private']['failed'], private_attempts) == (2, 2)
+    assert 'HTTP 403' in results['private']['error']
+
+
+def test_publish_credentials_per_target(project, monkeypatch):
+    monkeypatch.setenv('IRELEASE_PRIVATE_PASSWORD', 'secret')
+    with MockIndex(credentials=CREDENTIALS) as private, MockIndex() as public:
+        _write_targets(project, {'private': {'repository': private.url}, 'public': {'repository': public.url}})
+        results = publish.publish(['dist/' + f for f in sorted(os.listdir('dist'))], verbose=0)
+    assert [r['status'] for r in results] == ['uploaded', 'uploaded']
+    assert len(private.files['demo-pkg']) == len(public.files['demo-pkg']) == 2
+
+
+def test_twine_uploads_the_artifacts(project):
+    # An older archive in dist/ is not verified and must not be uploaded.
+    make_artifacts(str(project / 'dist'), version='0.0.9')
+    twine = project / 'twine'
+    twine.write_text('#!/bin/sh\necho "$@" > twine.args\n')
+    twine.chmod(0o755)
+    artifacts = ['dist/demo_pkg-0.1.0.tar.gz', 'dist/demo_pkg-0.1.0-py3-none-any.whl']
+    results = publish.publish(artifacts, twine=str(twine), verbose=0)
+    assert (results[0]['status'], results[0]['uploaded']) == ('uploaded', 2)
+    args = (project / 'twine.args').read_text().split()
+    assert args[0] == 'upload'
+    assert [a for a in args if a.startswith('dist/')] == artifacts
@@ -0,0 +1,46 @@
+import os
+import time
+import asyncio
+import pytest
+from irelease import aio, runner
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    # A killed child that is not reaped yet is a zombie
+    with open('/proc/%d/stat' %(pid)) as f:
+        return f.read().split(')')[1].split()[0]!='Z'
+
+
+def test_run(tmp_path):
+    results = runner.run('echo one; echo two', 'build', log=runner.StepLog('build', logdir=str(tmp_path), verbose=0), verbose=0)
+    assert (results['returncode'], results['tail'], results['timed_out']) == (0, ['one', 'two'], False)
+
+
+def test_run_failure(tmp_path):
+    with pytest.raises(runner.CommandFailed, match='failed with exit code 3') as e:
+        runner.run('echo broken; exit 3', 'build', log=runner.StepLog('build', logdir=str(tmp_path), verbose=0), verbose=0)
+    assert e.value.tail == ['broken']
+
+
+@pytest.mark.skipif(not os.path.isdir('/proc'), reason='needs /proc')
+@pytest.mark.parametrize('streamed', [False, True])
+def test_timeout_kills_process_group(tmp_path, monkeypatch, streamed):
+    # The shell starts a child that outlives a kill of the shell alone.
+    monkeypatch.chdir(tmp_path)
+    command = 'sleep 30 & echo $! > child.pid; wait'
+    start = time.perf_counter()
+    with pytest.raises(runner.CommandFailed, match='timed out after 1s'):
+        if streamed:
+            asyncio.run(aio.stream(command, 'build', timeout=1, verbose=0))
+        else:
+            runner.run(command, 'build', timeout=1, verbose=0)
+    # The orphaned child would keep the output pipe open until it exits.
+    assert time.perf_counter() - start < 10
+    with open('child.pid') as f:
+        pid = int(f.read())
+    time.sleep(0.2)
+    assert not _alive(pid)
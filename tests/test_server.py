@@ -0,0 +1,63 @@
+import http.client
+import json
+import pytest
+from irelease.server import ReleaseServer
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.delenv('IRELEASE_SERVER_TOKEN', raising=False)
+    with ReleaseServer(port=0, n_jobs=1, verbose=0) as server:
+        yield server
+
+
+def _request(server, method, path, body=None, headers=None):
+    connection = http.client.HTTPConnection('127.0.0.1', server._httpd.server_address[1], timeout=10)
+    connection.request(method, path, body=body, headers=headers or {})
+    response = connection.getresponse()
+    data = json.loads(response.read())
+    connection.close()
+    return response.status, data
+
+
+def test_generated_token(server):
+    assert server.generated_token and len(server.token)>=32
+    assert _request(server, 'GET', '/health')[0] == 401
+    assert _request(server, 'GET', '/health', headers={'Authorization': 'Bearer wrong'})[0] == 401
+    status, data = _request(server, 'GET', '/health', headers={'Authorization': 'Bearer ' + server.token})
+    assert (status, data['status']) == (200, 'ok')
+
+
+def test_host(server):
+    auth = {'Authorization': 'Bearer ' + server.token}
+    assert _request(server, 'GET', '/health', headers=dict(auth, Host='localhost:8765'))[0] == 200
+    assert _request(server, 'GET', '/health', headers=dict(auth, Host='[::1]:8765'))[0] == 200
+    assert _request(server, 'GET', '/health', headers=dict(auth, Host='attacker.example.com'))[0] == 403
+
+
+def test_submit_content_type(server, tmp_path):
+    auth = {'Authorization': 'Bearer ' + server.token}
+    body = json.dumps({'path': str(tmp_path), 'upload': False})
+    status, _ = _request(server, 'POST', '/jobs', body=body, headers=dict(auth, **{'Content-Type': 'application/x-www-form-urlencoded'}))
+    assert status == 415
+    assert server.list_jobs() == []
+
+
+def test_submit_options(server, tmp_path):
+    auth = {'Authorization': 'Bearer ' + server.token, 'Content-Type': 'application/json'}
+    for option in [{'twine': '/tmp/evil'}, {'repository_url': 'http://attacker.example.com/'}]:
+        status, data = _request(server, 'POST', '/jobs', body=json.dumps(dict(option, path=str(tmp_path))), headers=auth)
+        assert status == 400 and 'Unknown options' in data['message']
+    assert server.list_jobs() == []
+
+
+def test_unix_socket_without_token(monkeypatch, tmp_path):
+    monkeypatch.delenv('IRELEASE_SERVER_TOKEN', raising=False)
+    server = ReleaseServer(socket_path=str(tmp_path / 'irelease.sock'), verbose=0)
+    assert server.token is None and not server.generated_token
+
+
+def test_submit_resume_with_worktree(server, tmp_path):
+    with pytest.raises(ValueError, match='Resume can not be used with a worktree'):
+        server.submit(str(tmp_path), resume=True, worktree=True)
+    assert server.list_jobs() == []
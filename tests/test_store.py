@@ -0,0 +1,118 @@
+import os
+import sys
+import json
+import time
+import pytest
+from irelease import irelease, store, builder
+from conftest import git, make_artifacts
+
+
+def _put(cachedir, key, version='0.1.0', max_size=store.MAX_SIZE):
+    artifacts = make_artifacts(os.path.join(cachedir, 'build', key), version=version)
+    return store.put(key, artifacts, meta={'package': 'demo_pkg', 'version': version}, cachedir=cachedir, max_size=max_size, verbose=0)
+
+
+def _keys(cachedir):
+    return sorted(e['key'] for e in store.list_entries(cachedir))
+
+
+def test_artifact_key(repo):
+    key, meta = store.artifact_key(repo, 'demo', '0.1.0')
+    assert store.artifact_key(repo, 'demo', '0.1.0')[0] == key
+    assert (meta['commit'], meta['package'], meta['version'], meta['build_mode']) == (git(repo, 'rev-parse', 'HEAD').strip(), 'demo', '0.1.0', 'single')
+    # The version, the build configuration, uncommitted changes and a new commit all give another key.
+    keys = {key, store.artifact_key(repo, 'demo', '0.2.0')[0], store.artifact_key(repo, 'demo', '0.1.0', build_mode='parallel')[0]}
+    with open(os.path.join(repo, 'demo', 'core.py'), 'w') as f:
+        f.write('x = 1\n')
+    keys.add(store.artifact_key(repo, 'demo', '0.1.0')[0])
+    git(repo, 'add', '-A')
+    git(repo, 'commit', '-q', '-m', 'core')
+    keys.add(store.artifact_key(repo, 'demo', '0.1.0')[0])
+    assert len(keys) == 5
+
+
+def test_put_and_get(tmp_path):
+    cachedir, outdir = str(tmp_path / 'cache'), str(tmp_path / 'dist')
+    assert store.get('ab' * 32, outdir, cachedir=cachedir, verbose=0) is None
+    entrydir = _put(cachedir, 'ab' * 32)
+    artifacts = store.get('ab' * 32, outdir, cachedir=cachedir, verbose=0)
+    assert [os.path.basename(f) for f in artifacts] == ['demo_pkg-0.1.0-py3-none-any.whl', 'demo_pkg-0.1.0.tar.gz']
+    # The files in the store are read-only and hard-linked into dist/.
+    for artifact in artifacts:
+        stored = os.path.join(entrydir, os.path.basename(artifact))
+        assert os.path.samefile(artifact, stored) and os.stat(stored).st_mode & 0o222 == 0
+    assert store.list_entries(cachedir)[0]['hits'] == 1
+
+
+def test_get_copy_fallback(tmp_path, monkeypatch):
+    cachedir, outdir = str(tmp_path / 'cache'), str(tmp_path / 'dist')
+    entrydir = _put(cachedir, 'ab' * 32)
+
+    def _link(src, dst):
+        raise OSError('Invalid cross-device link')
+    monkeypatch.setattr(os, 'link', _link)
+    artifacts = store.get('ab' * 32, outdir, cachedir=cachedir, verbose=0)
+    for artifact in artifacts:
+        stored = os.path.join(entrydir, os.path.basename(artifact))
+        assert not os.path.samefile(artifact, stored)
+        with open(artifact, 'rb') as f1, open(stored, 'rb') as f2:
+            assert f1.read() == f2.read()
+
+
+def test_damaged_entry(tmp_path):
+    cachedir = str(tmp_path / 'cache')
+    entrydir = _put(cachedir, 'ab' * 32)
+    filepath = os.path.join(entrydir, 'demo_pkg-0.1.0.tar.gz')
+    os.chmod(filepath, 0o644)
+    with open(filepath, 'ab') as f:
+        f.write(b'x')
+    assert store.get('ab' * 32, str(tmp_path / 'dist'), cachedir=cachedir, verbose=0) is None
+    assert not os.path.exists(entrydir) and _keys(cachedir) == []
+
+
+def test_prune_lru(tmp_path):
+    cachedir = str(tmp_path / 'cache')
+    _put(cachedir, 'aa' * 32)
+    size = store.list_entries(cachedir)[0]['size']
+    _put(cachedir, 'bb' * 32)
+    time.sleep(0.01)
+    # aa is used after bb was stored: bb is the least recently used.
+    store.get('aa' * 32, str(tmp_path / 'dist'), cachedir=cachedir, verbose=0)
+    time.sleep(0.01)
+    # Room for two entries: the new entry is always kept.
+    _put(cachedir, 'cc' * 32, max_size=2 * size)
+    assert _keys(cachedir) == ['aa' * 32, 'cc' * 32]
+    assert store.prune(cachedir=cachedir, max_size=size, verbose=0) == ['aa' * 32]
+    assert store.prune(cachedir=cachedir, max_size=0, verbose=0) == ['cc' * 32]
+    assert os.listdir(os.path.join(cachedir, 'artifacts')) == []
+
+
+def test_stats(tmp_path, capsys):
+    cachedir = str(tmp_path / 'cache')
+    _put(cachedir, 'aa' * 32)
+    _put(cachedir, 'bb' * 32, version='0.2.0')
+    store.get('bb' * 32, str(tmp_path / 'dist'), cachedir=cachedir, verbose=0)
+    results = store.stats(cachedir=cachedir, verbose=3)
+    assert (results['artifacts']['entries'], results['artifacts']['hits'], results['build_envs']['entries']) == (2, 1, 0)
+    assert results['artifacts']['size'] == sum(e['size'] for e in results['artifacts']['items'])
+    assert results['artifacts']['items'][0]['key'] == 'bb' * 32
+    assert 'Artifacts : 2 entries' in capsys.readouterr().out
+
+
+def test_cache_prune_all(tmp_path, monkeypatch):
+    cachedir = str(tmp_path / 'cache')
+    monkeypatch.setattr(store, 'CACHE_DIR', cachedir)
+    monkeypatch.setattr(builder, 'CACHE_DIR', cachedir)
+    _put(cachedir, 'aa' * 32)
+    envdir = os.path.join(cachedir, 'build-envs', '0123456789abcdef')
+    os.makedirs(envdir)
+    with open(os.path.join(envdir, '.irelease-env.json'), 'w') as f:
+        json.dump({'key': '0123456789abcdef', 'size': 10, 'last_used': time.time()}, f)
+    assert store.stats(verbose=0)['build_envs']['entries'] == 1
+
+    monkeypatch.setattr(sys, 'argv', ['irelease', '-v', '0', 'cache', 'prune', '--all'])
+    with pytest.raises(SystemExit) as exit:
+        irelease.main()
+    assert exit.value.code == 0
+    results = store.stats(verbose=0)
+    assert (results['artifacts']['entries'], results['build_envs']['entries']) == (0, 0)
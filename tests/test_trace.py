@@ -0,0 +1,81 @@
+import os
+import json
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from irelease import trace
+
+
+@pytest.fixture
+def tracer(monkeypatch):
+    # The trace file of child processes is passed in the environment.
+    monkeypatch.delenv(trace.TRACE_ENV, raising=False)
+    yield
+    trace.stop()
+
+
+def _work(name):
+    with trace.span(name):
+        with trace.span(name + ' step'):
+            pass
+    return name
+
+
+def test_span_nesting(tmp_path, tracer):
+    # Nothing is recorded before tracing is started.
+    with trace.span('untraced') as event:
+        assert event == {}
+    trace.start(str(tmp_path / 'trace.jsonl'))
+    with trace.span('release', package='demo') as event:
+        event['files'] = 2
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            list(executor.map(trace.bind(_work), ['sdist', 'wheel']))
+        with trace.span('upload'):
+            pass
+    spans = {s['name']: s for s in trace.stop()}
+
+    release = spans['release']
+    assert (release['parent'], release['parent_id'], release['package'], release['files'], release['status']) == (None, None, 'demo', 2, 'ok')
+    assert len({s['id'] for s in spans.values()}) == 6
+    # Spans in worker threads of trace.bind are children of the span that was open when it was bound.
+    for name in ['sdist', 'wheel', 'upload']:
+        assert (spans[name]['parent'], spans[name]['parent_id']) == ('release', release['id'])
+    for name in ['sdist', 'wheel']:
+        assert (spans[name + ' step']['parent'], spans[name + ' step']['parent_id']) == (name, spans[name]['id'])
+        assert spans[name]['thread'] != release['thread']
+    assert release['duration'] >= max(s['duration'] for s in spans.values() if s is not release)
+
+
+def test_span_error(tmp_path, tracer):
+    trace.start(str(tmp_path / 'trace.jsonl'))
+    with pytest.raises(ValueError):
+        with trace.span('build'):
+            raise ValueError('no backend')
+    # The parent is restored after an error.
+    with trace.span('upload'):
+        pass
+    build, upload = trace.stop()
+    assert (build['status'], build['error']) == ('error', 'no backend')
+    assert (upload['status'], upload['parent']) == ('ok', None)
+
+
+@pytest.mark.parametrize('filename', ['trace.jsonl', 'trace.json'])
+def test_output(tmp_path, tracer, filename):
+    filepath = str(tmp_path / filename)
+    trace.start(filepath)
+    assert os.environ[trace.TRACE_ENV] == filepath
+    with trace.span('release'):
+        with trace.span('build'):
+            pass
+    # Every finished span is appended as a json line while tracing.
+    with open(filepath, 'r') as f:
+        assert [json.loads(line)['name'] for line in f] == ['build', 'release']
+    spans = trace.stop()
+    assert trace.TRACE_ENV not in os.environ
+    with open(filepath, 'r') as f:
+        text = f.read()
+    if filename.endswith('.json'):
+        assert json.loads(text) == spans
+    else:
+        assert [json.loads(line) for line in text.splitlines()] == spans
+    assert trace.read(filepath) == spans
+    assert trace.summary(spans, verbose=0) == {'build': [1, spans[0]['duration']], 'release': [1, spans[1]['duration']]}
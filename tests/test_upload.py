@@ -0,0 +1,78 @@
+import hashlib
+import base64
+from irelease import upload
+from mockserver import MockIndex
+
+
+def test_upload_artifacts(artifacts):
+    with MockIndex() as index:
+        results = upload.upload_artifacts(artifacts, repository_url=index.url, auth=(None, None), verbose=0)
+    assert [r['status'] for r in results] == ['uploaded', 'uploaded']
+    assert sorted(index.files['demo-pkg']) == sorted(a.split('/')[-1] for a in artifacts)
+
+
+def test_multipart_fields(artifacts):
+    with MockIndex() as index:
+        upload.upload_artifacts(artifacts, repository_url=index.url, auth=(None, None), verbose=0)
+    sdist, wheel = [a.split('/')[-1] for a in artifacts]
+    fields = index.fields[wheel]
+    content = index.files['demo-pkg'][wheel]
+    assert fields[':action'] == ['file_upload']
+    assert fields['protocol_version'] == ['1']
+    assert fields['name'] == ['demo_pkg']
+    assert fields['version'] == ['0.1.0']
+    assert fields['filetype'] == ['bdist_wheel']
+    assert fields['pyversion'] == ['py3']
+    assert fields['metadata_version'] == ['2.1']
+    assert fields['sha256_digest'] == [hashlib.sha256(content).hexdigest()]
+    assert fields['md5_digest'] == [hashlib.md5(content).hexdigest()]
+    assert fields['classifiers'] == ['Programming Language :: Python :: 3', 'Operating System :: OS Independent']
+    assert fields['description'][0].strip() == 'Long description.'
+    assert index.fields[sdist]['filetype'] == ['sdist']
+    assert index.fields[sdist]['pyversion'] == ['source']
+
+
+def test_skip_existing(artifacts):
+    with MockIndex() as index:
+        upload.upload_artifacts(artifacts[:1], repository_url=index.url, auth=(None, None), verbose=0)
+        posts = index.attempts
+        results = upload.upload_artifacts(artifacts, repository_url=index.url, auth=(None, None), verbose=0)
+        # The sdist is on the simple API, only the wheel is posted.
+        assert index.attempts == posts + 1
+    assert {r['file']: r['status'] for r in results} == {artifacts[0]: 'skipped', artifacts[1]: 'uploaded'}
+
+
+def test_skip_existing_on_upload(artifacts):
+    # An index without simple API: the file exists error of the upload is a skip as well.
+    with MockIndex() as index:
+        upload.upload_artifacts(artifacts, repository_url=index.url, auth=(None, None), verbose=0)
+        results = upload.upload_artifacts(artifacts, repository_url=index.url, index_url=index.url + 'missing/', auth=(None, None), verbose=0)
+    assert [r['status'] for r in results] == ['skipped', 'skipped']
+    assert all(r['error'] is None for r in results)
+
+
+def test_retry(artifacts, no_sleep):
+    with MockIndex(fail_first=2) as index:
+        results = upload.upload_artifacts(artifacts[:1], repository_url=index.url, auth=(None, None), retries=3, verbose=0)
+    assert results[0]['status'] == 'uploaded'
+    assert results[0]['attempts'] == 3
+    assert index.attempts == 3
+
+
+def test_retries_exhausted(artifacts, no_sleep):
+    with MockIndex(fail_first=10) as index:
+        results = upload.upload_artifacts(artifacts[:1], repository_url=index.url, auth=(None, None), retries=2, verbose=0)
+    assert results[0]['status'] == 'failed'
+    assert results[0]['attempts'] == 3
+    assert results[0]['error'].startswith('HTTP 503')
+
+
+def test_no_retry_on_client_error(artifacts, no_sleep):
+    credentials = 'Basic ' + base64.b64encode(b'__token__:secret').decode('ascii')
+    with MockIndex(credentials=credentials) as index:
+        failed = upload.upload_artifacts(artifacts[:1], repository_url=index.url, auth=('__token__', 'wrong'), retries=3, verbose=0)
+        uploaded = upload.upload_artifacts(artifacts[:1], repository_url=index.url, auth=('__token__', 'secret'), verbose=0)
+    assert failed[0]['status'] == 'failed'
+    assert failed[0]['attempts'] == 1
+    assert failed[0]['error'].startswith('HTTP 403')
+    assert uploaded[0]['status'] == 'uploaded'
@@ -0,0 +1,144 @@
+import io
+import os
+import json
+import base64
+import hashlib
+import tarfile
+import zipfile
+import pytest
+from irelease import verify
+from conftest import METADATA, git, make_artifacts
+
+
+def _hash(data):
+    return 'sha256=' + base64.urlsafe_b64encode(hashlib.sha256(data).digest()).rstrip(b'=').decode('ascii')
+
+
+def make_wheel(dirpath, name='demo_pkg', version='0.1.0', files=None, metadata=None, record=True, tamper=None):
+    """Wheel with a RECORD of its members. tamper is a member that is changed after the RECORD is written."""
+    os.makedirs(dirpath, exist_ok=True)
+    distinfo = '%s-%s.dist-info' %(name, version)
+    members = dict(files or {'%s/__init__.py' %(name): b"__version__ = '%s'\n" %(version.encode())})
+    members[distinfo + '/METADATA'] = (metadata or METADATA %(name, version)).encode('utf-8')
+    lines = ['%s,%s,%d' %(path, _hash(data), len(data)) for path, data in members.items()] + [distinfo + '/RECORD,,']
+    if tamper is not None: members[tamper] = members[tamper] + b'# changed\n'
+    filepath = os.path.join(dirpath, '%s-%s-py3-none-any.whl' %(name, version))
+    with zipfile.ZipFile(filepath, 'w') as z:
+        for path, data in members.items():
+            z.writestr(path, data)
+        if record: z.writestr(distinfo + '/RECORD', '\n'.join(lines) + '\n')
+    return filepath
+
+
+def make_sdist(dirpath, name='demo_pkg', version='0.1.0', metadata=None, pkginfo=True):
+    os.makedirs(dirpath, exist_ok=True)
+    filepath = os.path.join(dirpath, '%s-%s.tar.gz' %(name, version))
+    files = [('PKG-INFO', metadata or METADATA %(name, version))] if pkginfo else []
+    with tarfile.open(filepath, 'w:gz') as tar:
+        for filename, content in files + [('setup.py', '')]:
+            data = content.encode('utf-8')
+            info = tarfile.TarInfo('%s-%s/%s' %(name, version, filename))
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return filepath
+
+
+def _errors(filepath, **kwargs):
+    return ' '.join(verify.verify_artifact(filepath, **kwargs)['errors'])
+
+
+def test_verify_dist(tmp_path):
+    distdir = str(tmp_path / 'dist')
+    wheel, sdist = make_wheel(distdir), make_sdist(distdir)
+    results = verify.verify_dist(distdir, name='demo-pkg', version='0.1.0', srcdir=str(tmp_path), verbose=0)
+    assert results['ok'], results['artifacts']
+    # The provenance manifest has the digests of the archives and is not uploaded with dist/*.
+    with open(os.path.join(distdir, verify.PROVENANCE_FILE), 'r') as f:
+        manifest = json.load(f)
+    digests = {r['file']: r['sha256'] for r in manifest['artifacts']}
+    for filepath in [wheel, sdist]:
+        with open(filepath, 'rb') as f:
+            assert digests[os.path.basename(filepath)] == hashlib.sha256(f.read()).hexdigest()
+    assert (manifest['name'], manifest['version'], manifest['commit']) == ('demo-pkg', '0.1.0', None)
+    assert {r['type'] for r in manifest['artifacts']} == {'bdist_wheel', 'sdist'}
+
+
+def test_provenance_commit(repo):
+    make_artifacts('dist', name='demo', version='0.1.0')
+    results = verify.verify_dist('dist', name='demo', version='0.1.0', manifest=False, verbose=0)
+    assert results['commit'] == git(repo, 'rev-parse', 'HEAD').strip()
+    assert results['manifest'] is None and not os.path.exists(os.path.join('dist', verify.PROVENANCE_FILE))
+
+
+def test_stale_artifacts(tmp_path):
+    distdir = str(tmp_path / 'dist')
+    make_wheel(distdir, version='0.1.0')
+    stale = make_wheel(distdir, version='0.0.9')
+    results = verify.verify_dist(distdir, name='demo_pkg', version='0.1.0', manifest=False, verbose=0)
+    assert not results['ok']
+    assert [r['file'] for r in results['artifacts'] if r['errors']] == [os.path.basename(stale)]
+    assert 'stale artifact' in _errors(stale, version='0.1.0')
+    # Only the given artifacts are verified.
+    assert verify.verify_dist(distdir, version='0.1.0', artifacts=[os.path.join(distdir, 'demo_pkg-0.1.0-py3-none-any.whl')], manifest=False, verbose=0)['ok']
+
+
+def test_version_and_name_mismatch(tmp_path):
+    # The version in the metadata differs from the filename, and the name from the project.
+    wheel = make_wheel(str(tmp_path), metadata=METADATA %('demo_pkg', '0.2.0'))
+    assert 'Metadata version 0.2.0 does not match the version 0.1.0' in _errors(wheel, version='0.1.0')
+    assert 'Name demo_pkg in the filename does not match other' in _errors(wheel, name='other')
+    sdist = make_sdist(str(tmp_path), metadata=METADATA %('other', '0.1.0'))
+    assert 'Metadata name other does not match demo_pkg' in _errors(sdist, name='demo_pkg')
+    # Normalized versions are the same version.
+    assert _errors(make_wheel(str(tmp_path / 'rc'), version='1.0.0rc1'), version='1.0.0-rc1') == ''
+
+
+@pytest.mark.parametrize('broken, error', [
+    ({'tamper': 'demo_pkg/__init__.py'}, 'demo_pkg/__init__.py does not match its hash or size in the RECORD'),
+    ({'record': False}, 'The wheel has no RECORD'),
+])
+def test_record(tmp_path, broken, error):
+    assert error in _errors(make_wheel(str(tmp_path), **broken))
+
+
+def test_record_members(tmp_path):
+    wheel = make_wheel(str(tmp_path))
+    # A member that is added after the RECORD, and a member of the RECORD that is removed.
+    with zipfile.ZipFile(wheel, 'a') as z:
+        z.writestr('demo_pkg/extra.py', '')
+    assert 'demo_pkg/extra.py is not in the RECORD' in _errors(wheel)
+    with zipfile.ZipFile(wheel, 'r') as z:
+        members = {i.filename: z.read(i) for i in z.infolist() if i.filename!='demo_pkg/__init__.py'}
+    with zipfile.ZipFile(wheel, 'w') as z:
+        for path, data in members.items():
+            z.writestr(path, data)
+    assert 'demo_pkg/__init__.py is in the RECORD but not in the wheel' in _errors(wheel)
+
+
+def test_metadata(tmp_path):
+    assert 'Metadata field Version is missing' in _errors(make_sdist(str(tmp_path / 'a'), metadata='Metadata-Version: 2.1\nName: demo_pkg\n\nText.\n'))
+    assert 'No metadata' in _errors(make_sdist(str(tmp_path / 'b'), pkginfo=False))
+    report = verify.verify_artifact(make_wheel(str(tmp_path / 'c'), metadata='Metadata-Version: 2.1\nName: demo_pkg\nVersion: 0.1.0\n'))
+    assert report['errors'] == [] and 'long description is empty' in report['warnings'][0]
+
+
+def test_unreadable_archive(tmp_path):
+    filepath = tmp_path / 'demo_pkg-0.1.0-py3-none-any.whl'
+    filepath.write_bytes(b'not a zip file')
+    assert 'The archive can not be read' in _errors(str(filepath))
+    (tmp_path / 'demo_pkg-0.1.0.exe').write_bytes(b'')
+    assert 'Unknown distribution type' in _errors(str(tmp_path / 'demo_pkg-0.1.0.exe'))
+    assert verify.verify_dist(str(tmp_path / 'empty'), verbose=0)['artifacts'][0]['errors'] == ['No distribution archives found.']
+
+
+def test_size_budget(tmp_path):
+    srcdir = str(tmp_path)
+    with open(os.path.join(srcdir, 'pyproject.toml'), 'w') as f:
+        f.write('[tool.irelease]\nmax-artifact-mb = 0.0001\nmax-member-mb = 0.00001\n')
+    distdir = os.path.join(srcdir, 'dist')
+    make_wheel(distdir, files={'demo_pkg/__init__.py': b'', 'demo_pkg/data.bin': b'x' * 1000})
+    results = verify.verify_dist(distdir, srcdir=srcdir, manifest=False, verbose=0)
+    report = results['artifacts'][0]
+    assert not results['ok'] and 'exceeds the budget of 0.0001 MB' in report['errors'][0]
+    assert any('demo_pkg/data.bin is large' in w for w in report['warnings'])
+    assert report['largest'] == ['demo_pkg/data.bin', 1000]